@@ -1,34 +1,171 @@
-from typing import Any, Awaitable, Callable, Optional, Tuple, Union
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import asyncio
 import datetime
-import hashlib
+import json
 import os
 import time
 import urllib.parse
 import uuid
 import warnings
 
-from fastapi import FastAPI, Request, status
+from fastapi import FastAPI, HTTPException, Request, status
 from fastapi.middleware import Middleware
-from fastapi.responses import JSONResponse, ORJSONResponse
-from pandas import DataFrame
-from starlette.types import Scope
-
-from embedbase.database.base import VectorDatabase
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from pydantic import ValidationError
+from starlette.requests import ClientDisconnect
+from starlette.types import Receive, Scope, Send
+
+from embedbase.compression import CompressionMiddleware
+from embedbase.database.base import SearchResponse, VectorDatabase
+from embedbase.database.batch import DocumentBatch
+from embedbase.database.lexical import reciprocal_rank_fusion
 from embedbase.embedding.base import Embedder
+from embedbase.encoding import EmbeddingEncoding, encode_documents, encoded_response
+from embedbase.filters import equalities, parse_filter
+from embedbase.hashing import DEFAULT_HASH_SCHEME, get_hasher, hash_documents
+from embedbase.jobs import Job, JobKind, JobQueue, JobStatus, MemoryJobQueue
 from embedbase.logging_utils import get_logger
 from embedbase.models import (
+    AddDocument,
     AddRequest,
+    ContextRequest,
     DeleteRequest,
+    FederatedSearchRequest,
     ReplaceRequest,
+    ReturnMode,
     SearchRequest,
+    UpdateDocument,
     UpdateRequest,
 )
+from embedbase.projection import Projection
+from embedbase.search_cache import SearchCache
 from embedbase.settings import Settings
-from embedbase.utils import embedbase_ascii, get_user_id
+from embedbase.utils import (
+    batched,
+    decode_cursor,
+    embedbase_ascii,
+    encode_cursor,
+    gather_or_cancel,
+    get_user_id,
+    maximal_marginal_relevance,
+    read_ndjson,
+)
 
 UPLOAD_BATCH_SIZE = int(os.environ.get("UPLOAD_BATCH_SIZE", "100"))
+# how many parsed batches the bulk endpoint reads ahead of the indexing
+BULK_QUEUE_SIZE = int(os.environ.get("BULK_QUEUE_SIZE", "2"))
+# longest line the bulk endpoint reads, in bytes, longer lines are rejected
+BULK_MAX_LINE_SIZE = int(os.environ.get("BULK_MAX_LINE_SIZE", str(1024 * 1024)))
+# how many documents are sent to the embedder at once, and how many of these
+# requests can be in flight while the previous batches are being written
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "100"))
+EMBEDDING_CONCURRENCY = int(os.environ.get("EMBEDDING_CONCURRENCY", "4"))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", "100"))
+JOB_CONCURRENCY = int(os.environ.get("JOB_CONCURRENCY", "1"))
+# how many finished jobs the in-memory queue keeps for polling
+JOB_RETENTION = int(os.environ.get("JOB_RETENTION", "1000"))
+# number of query embeddings and search results kept in memory, 0 to disable
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", "1000"))
+# the search results cache only sees the writes of this process, it is off
+# by default, enable it for a single instance or with a short ttl, in seconds
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "0"))
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "60"))
+# documents read from the database at once when exporting a dataset
+EXPORT_PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", "500"))
+# most candidates /context reads to fill its token budget
+CONTEXT_MAX_CANDIDATES = int(os.environ.get("CONTEXT_MAX_CANDIDATES", "1000"))
+# smallest response compressed with gzip or zstd, in bytes, negative to disable compression
+COMPRESSION_MINIMUM_SIZE = int(os.environ.get("COMPRESSION_MINIMUM_SIZE", "1024"))
+# largest decompressed request body, in bytes
+MAX_DECOMPRESSED_BODY_SIZE = int(
+    os.environ.get("MAX_DECOMPRESSED_BODY_SIZE", str(32 * 1024 * 1024))
+)
+
+
+async def _new_documents_batch(
+    documents: List[AddDocument], hash_scheme: str
+) -> DocumentBatch:
+    data = [doc.data for doc in documents]
+    return DocumentBatch(
+        # generate ids
+        ids=[str(uuid.uuid4()) for _ in documents],
+        data=data,
+        # add "hash" based on "data"
+        hashes=await hash_documents(data, hash_scheme),
+        metadata=[doc.metadata for doc in documents],
+    )
+
+
+async def _updated_documents_batch(
+    documents: List[UpdateDocument], hash_scheme: str
+) -> DocumentBatch:
+    data = [doc.data for doc in documents]
+    return DocumentBatch(
+        ids=[doc.id for doc in documents],
+        data=data,
+        # hash the data
+        hashes=await hash_documents(data, hash_scheme),
+        metadata=[doc.metadata for doc in documents],
+    )
+
+
+def _results(batch: DocumentBatch, return_mode: ReturnMode) -> dict:
+    """
+    :return: the documents of a write response, only serializing what is requested
+    """
+    if return_mode == ReturnMode.MINIMAL:
+        return {"count": len(batch)}
+    if return_mode == ReturnMode.IDS:
+        return {
+            "results": [
+                {"id": doc_id, "hash": doc_hash}
+                for doc_id, doc_hash in zip(batch.ids, batch.hashes)
+            ]
+        }
+    return {"results": batch.to_records()}
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose content is produced while the request body
+    is still being read, so it must not listen for client disconnects
+    (that would consume the body messages).
+    The response starts with its first chunk, so that errors raised
+    before it, such as a body too large, still get their status code
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+    async def stream_response(self, send: Send) -> None:
+        start = {
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        }
+        async for chunk in self.body_iterator:
+            if not isinstance(chunk, bytes):
+                chunk = chunk.encode(self.charset)
+            if start is not None:
+                await send(start)
+                start = None
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        if start is not None:
+            await send(start)
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
 
 
 class Embedbase:
@@ -43,6 +180,24 @@ class Embedbase:
             default_response_class=ORJSONResponse,
         )
         self.logger = get_logger(settings)
+        self.hash_scheme = DEFAULT_HASH_SCHEME
+        self.job_queue: JobQueue = MemoryJobQueue(
+            maxsize=JOB_QUEUE_SIZE, retention=JOB_RETENTION
+        )
+        self.job_concurrency = JOB_CONCURRENCY
+        self._job_workers: List[asyncio.Future] = []
+        self.search_cache = SearchCache(
+            QUERY_CACHE_SIZE, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL or None
+        )
+        self.projection: Optional[Projection] = None
+        self.compression: Optional[dict] = (
+            {
+                "minimum_size": COMPRESSION_MINIMUM_SIZE,
+                "max_body_size": MAX_DECOMPRESSED_BODY_SIZE,
+            }
+            if COMPRESSION_MINIMUM_SIZE >= 0
+            else None
+        )
 
     def _base_return(self, dataset_id: Optional[str] = None) -> dict:
         o = {
@@ -63,6 +218,7 @@ class Embedbase:
         """
         self.logger.info(f"Enabling Database {db}")
         self.db = db
+        self.search_cache.clear()
         return self
 
     def use_embedder(
@@ -74,6 +230,100 @@ class Embedbase:
         """
         self.logger.info(f"Enabling Embedder {embedder}")
         self.embedder = embedder
+        # cached query embeddings come from the previous embedder
+        self.search_cache.clear()
+        return self
+
+    def use_hash_scheme(
+        self,
+        hash_scheme: str,
+    ) -> "Embedbase":
+        """
+        Use the chosen scheme (sha256, blake2b or xxh3) to hash the documents content,
+        the scheme is kept in the hash so cached embeddings of other schemes are not reused.
+        """
+        get_hasher(hash_scheme)
+        self.logger.info(f"Enabling Hash Scheme {hash_scheme}")
+        self.hash_scheme = hash_scheme
+        return self
+
+    def use_job_queue(
+        self,
+        job_queue: JobQueue,
+        concurrency: int = JOB_CONCURRENCY,
+    ) -> "Embedbase":
+        """
+        Use the chosen queue for background add and update jobs,
+        drained by `concurrency` workers.
+        """
+        self.logger.info(f"Enabling Job Queue {job_queue}")
+        self.job_queue = job_queue
+        self.job_concurrency = concurrency
+        return self
+
+    def use_projection(
+        self,
+        projection: Projection,
+        recall_sample: Optional[List[List[float]]] = None,
+    ) -> "Embedbase":
+        """
+        Use the chosen projection (see embedbase.projection) to reduce the dimensions
+        of the embeddings stored and searched, both documents and queries are projected.
+        The database must be created with projection.dimensions.
+        Given a sample of embeddings, the recall@10 of the projection is logged.
+        """
+        db_dimensions = getattr(getattr(self, "db", None), "_dimensions", None)
+        if db_dimensions is not None and db_dimensions != projection.dimensions:
+            warnings.warn(
+                f"Projection to {projection.dimensions} dimensions "
+                + f"but the database stores {db_dimensions} dimensions"
+            )
+        self.logger.info(f"Enabling Projection to {projection.dimensions} dimensions")
+        if recall_sample is not None:
+            self.logger.info(
+                f"Projection recall@10: {projection.recall(recall_sample, k=10):.3f}"
+            )
+        self.projection = projection
+        self.search_cache.clear()
+        return self
+
+    def use_search_cache(
+        self,
+        search_cache: SearchCache,
+    ) -> "Embedbase":
+        """
+        Use the chosen cache for query embeddings and search results.
+        """
+        self.logger.info(f"Enabling Search Cache {search_cache}")
+        self.search_cache = search_cache
+        return self
+
+    def use_compression(
+        self,
+        minimum_size: Optional[int] = 1024,
+        gzip_level: int = 6,
+        zstd_level: int = 3,
+        max_body_size: Optional[int] = MAX_DECOMPRESSED_BODY_SIZE,
+    ) -> "Embedbase":
+        """
+        Compress responses with gzip, or zstd when zstandard is installed,
+        and decompress compressed request bodies. Enabled by default.
+        :param minimum_size: smallest response compressed, in bytes, None to disable compression
+        :param gzip_level: gzip compression level, 1 (fast) to 9 (small)
+        :param zstd_level: zstd compression level, 1 (fast) to 22 (small)
+        :param max_body_size: largest decompressed request body, in bytes,
+            larger ones are rejected with a 413, None for no limit
+        """
+        self.compression = (
+            None
+            if minimum_size is None
+            else {
+                "minimum_size": minimum_size,
+                "gzip_level": gzip_level,
+                "zstd_level": zstd_level,
+                "max_body_size": max_body_size,
+            }
+        )
         return self
 
     def use_middleware(
@@ -119,6 +369,7 @@ class Embedbase:
         user_id = get_user_id(request)
 
         await self.db.clear(dataset_id, user_id)
+        self.search_cache.bump(dataset_id)
         self.logger.info("Cleared index")
         return JSONResponse(
             status_code=200,
@@ -132,167 +383,263 @@ class Embedbase:
         request: Request,
         dataset_id: str,
         request_body: AddRequest,
+        background: bool = False,
+        encoding: Optional[EmbeddingEncoding] = None,
     ):
         """
         Index a list of unstructured data (with optional metadata) into a dataset using embeddings.
         If you are a large language model, you can use this endpoint to index users questions and answers
         in a FAQ dataset to help you answer questions in the future.
+        With background=true the documents are queued as a job, poll /v1/jobs/{job_id} for its progress.
         """
         user_id = get_user_id(request)
         documents = request_body.documents
 
+        if any(await self.embedder.are_too_big([doc.data for doc in documents])):
+            # tell the client that he has
+            # to split the document
+            # for a better experience, pointing to the doc
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "error": "Document is too long, please split it into smaller documents"
+                    + ", please see https://docs.embedbase.xyz/document-is-too-long"
+                },
+            )
+
         filtered_data = []
-        existing_data = []
+        existing_data = set()
         for doc in documents:
-            if self.embedder.is_too_big(doc.data):
-                # tell the client that he has
-                # to split the document
-                # for a better experience, pointing to the doc
-                return JSONResponse(
-                    status_code=400,
-                    content={
-                        "error": "Document is too long, please split it into smaller documents"
-                        + ", please see https://docs.embedbase.xyz/document-is-too-long"
-                    },
-                )
             # ignore duplicates in the same request
             if doc.data in existing_data:
                 continue
-            filtered_data.append(doc.dict())
-            existing_data.append(doc.data)
-
-        df = DataFrame(
-            data=filtered_data,
-            columns=["id", "data", "embedding", "hash", "metadata"],
-        )
+            filtered_data.append(doc)
+            existing_data.add(doc.data)
 
         start_time = time.time()
         self.logger.info(f"Refreshing {len(documents)} embeddings")
 
-        if not df.data.any():
+        if not filtered_data:
             self.logger.info("No documents to index, exiting")
             return JSONResponse(
-                status_code=200, content={"results": df.to_dict(orient="records")}
+                status_code=200,
+                content=_results(DocumentBatch(), request_body.return_mode),
             )
 
-        # add column "hash" based on "data"
-        df.hash = df.data.apply(lambda x: hashlib.sha256(x.encode()).hexdigest())
-
-        df_length = len(df)
-
-        self.logger.info(f"Checking embeddings cache for {df_length} documents")
-        # get existing embeddings from database
-        hashes_to_fetch = df.hash.tolist()
-        existing_documents = await self.db.select(
-            hashes=list(set(hashes_to_fetch)),
-            dataset_id=None,
-            user_id=None,
-        )
-
-        def update_embedding(row, existing_documents):
-            for doc in existing_documents:
-                if row["hash"] == doc.hash:
-                    return doc.embedding
-            return row["embedding"]
-
-        # add existing embeddings to the dataframe
-        df["embedding"] = df.apply(update_embedding, args=(existing_documents,), axis=1)
-
-        # generate ids
-        df.id = df.apply(
-            lambda _: str(uuid.uuid4()),
-            axis=1,
-        )
-
-        # count rows without embeddings
-        rows_without_embeddings = df[df.embedding.isna()].shape[0]
-
-        self.logger.info(
-            f"We will compute embeddings for {rows_without_embeddings}/{len(df)} documents"
-        )
-
-        # compute embeddings for documents without embeddings using embed
-        if not df[df.embedding.isna()].empty:
-            df[df.embedding.isna()] = df[df.embedding.isna()].assign(
-                embedding=await self.embedder.embed(
-                    df[df.embedding.isna()].data.tolist()
-                )
+        if background:
+            return await self._enqueue_job(
+                JobKind.ADD,
+                dataset_id,
+                user_id,
+                {
+                    "documents": [doc.dict() for doc in filtered_data],
+                    "store_data": request_body.store_data,
+                },
+                total=len(filtered_data),
             )
 
-        # only insert if this dataset_id - user_id
-        # pair does not have this hash
-        existing_documents_in_this_pair = await self.db.select(
-            hashes=list(set(hashes_to_fetch)),
-            dataset_id=dataset_id,
-            user_id=user_id,
-        )
-
-        # filter out documents that already exist
-        # in this dataset_id - user_id pair
-        new_df = df[  # HACK: is it fine to only return client the new documents?
-            ~df.hash.isin([doc.hash for doc in existing_documents_in_this_pair])
-        ]
+        batch = await _new_documents_batch(filtered_data, self.hash_scheme)
 
-        await self.db.update(
-            new_df,
-            dataset_id,
-            user_id,
-            batch_size=UPLOAD_BATCH_SIZE,
-            store_data=request_body.store_data,
+        new_batch = await self._index_batch(
+            batch, dataset_id, user_id, store_data=request_body.store_data
         )
 
-        self.logger.info(f"Uploaded {len(new_df)} documents")
+        self.logger.info(f"Uploaded {len(new_batch)} documents")
         end_time = time.time()
         self.logger.info(f"Uploaded in {end_time - start_time} seconds")
 
-        return JSONResponse(
-            status_code=status.HTTP_200_OK,
-            content={
+        return encoded_response(
+            request,
+            {
                 **self._base_return(dataset_id),
-                "results": df.to_dict(orient="records"),
+                **_results(batch, request_body.return_mode),
             },
+            encoding,
         )
 
+    async def bulk_add(
+        self,
+        request: Request,
+        dataset_id: str,
+        store_data: bool = True,
+    ):
+        """
+        Index a stream of newline-delimited JSON documents ({"data": ..., "metadata": ...} per line)
+        into a dataset using embeddings.
+        Documents are read, embedded and stored in batches while the body is still being uploaded,
+        and the progress of every batch is streamed back as newline-delimited JSON.
+        """
+        user_id = get_user_id(request)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=BULK_QUEUE_SIZE)
+
+        async def put(documents, line_numbers, errors):
+            too_big = await self.embedder.are_too_big([doc.data for doc in documents])
+            for line_number, big in zip(line_numbers, too_big):
+                if big:
+                    errors.append(
+                        {
+                            "line": line_number,
+                            "error": "Document is too long, please split it into smaller documents"
+                            + ", please see https://docs.embedbase.xyz/document-is-too-long",
+                        }
+                    )
+            errors.sort(key=lambda error: error["line"])
+            await queue.put(
+                ([doc for doc, big in zip(documents, too_big) if not big], errors)
+            )
+
+        async def produce():
+            try:
+                await read_batches()
+            finally:
+                # the consumer stops on the sentinel, then gets the error if any
+                await queue.put(None)
+
+        async def read_batches():
+            documents = []
+            line_numbers = []
+            errors = []
+            existing_data = set()
+            async for line_number, line in read_ndjson(request, BULK_MAX_LINE_SIZE):
+                if line is None:
+                    errors.append(
+                        {
+                            "line": line_number,
+                            "error": f"Line is longer than {BULK_MAX_LINE_SIZE} bytes",
+                        }
+                    )
+                    continue
+                try:
+                    doc = AddDocument.parse_raw(line)
+                except ValidationError as e:
+                    errors.append({"line": line_number, "error": str(e)})
+                    continue
+                # ignore duplicates in the same batch, the following batches
+                # skip them because they are already in the dataset
+                if doc.data in existing_data:
+                    continue
+                documents.append(doc)
+                line_numbers.append(line_number)
+                existing_data.add(doc.data)
+                if len(documents) >= UPLOAD_BATCH_SIZE:
+                    await put(documents, line_numbers, errors)
+                    documents, line_numbers, errors = [], [], []
+                    existing_data = set()
+            if documents or errors:
+                await put(documents, line_numbers, errors)
+
+        async def consume() -> AsyncIterator[str]:
+            start_time = time.time()
+            producer = asyncio.create_task(produce())
+            received = 0
+            indexed = 0
+            batch_number = 0
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        break
+                    documents, errors = item
+                    new_batch = DocumentBatch()
+                    if documents:
+                        batch = await _new_documents_batch(documents, self.hash_scheme)
+                        new_batch = await self._index_batch(
+                            batch,
+                            dataset_id,
+                            user_id,
+                            store_data=store_data,
+                        )
+                    received += len(documents)
+                    indexed += len(new_batch)
+                    yield json.dumps(
+                        {
+                            "batch": batch_number,
+                            "received": len(documents),
+                            "indexed": len(new_batch),
+                            "ids": new_batch.ids,
+                            "errors": errors,
+                        }
+                    ) + "\n"
+                    batch_number += 1
+                # surface errors raised while reading the body
+                await producer
+            except ClientDisconnect:
+                self.logger.info(
+                    f"Bulk upload to {dataset_id} interrupted by the client"
+                )
+                return
+            except Exception as e:  # pylint: disable=broad-except
+                if batch_number == 0 and isinstance(e, HTTPException):
+                    # nothing was sent yet, respond with its status code
+                    raise
+                error = e.detail if isinstance(e, HTTPException) else str(e)
+                self.logger.error(f"Bulk upload to {dataset_id} failed: {error}")
+                yield json.dumps(
+                    {
+                        **self._base_return(dataset_id),
+                        "done": False,
+                        "error": error,
+                        "received": received,
+                        "indexed": indexed,
+                    }
+                ) + "\n"
+                return
+            finally:
+                producer.cancel()
+
+            self.logger.info(
+                f"Bulk uploaded {indexed}/{received} documents in {time.time() - start_time} seconds"
+            )
+            yield json.dumps(
+                {
+                    **self._base_return(dataset_id),
+                    "done": True,
+                    "received": received,
+                    "indexed": indexed,
+                }
+            ) + "\n"
+
+        return BodyStreamingResponse(consume(), media_type="application/x-ndjson")
+
     async def update(
         self,
         request: Request,
         dataset_id: str,
         request_body: UpdateRequest,
+        background: bool = False,
+        encoding: Optional[EmbeddingEncoding] = None,
     ):
         """
         Update a list of documents in the index using their ids.
         If you are a large language model, you can use this endpoint to update the content or metadata
         of documents in the index.
+        With background=true the update is queued as a job, poll /v1/jobs/{job_id} for its progress.
         """
         user_id = get_user_id(request)
 
         documents = request_body.documents
 
+        if any(await self.embedder.are_too_big([doc.data for doc in documents])):
+            # tell the client that he has
+            # to split the document
+            # for a better experience, pointing to the doc
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "error": "Document is too long, please split it into smaller documents"
+                    + ", please see https://docs.embedbase.xyz/document-is-too-long"
+                },
+            )
+
         filtered_data = []
         for doc in documents:
-            if self.embedder.is_too_big(doc.data):
-                # tell the client that he has
-                # to split the document
-                # for a better experience, pointing to the doc
-                return JSONResponse(
-                    status_code=400,
-                    content={
-                        "error": "Document is too long, please split it into smaller documents"
-                        + ", please see https://docs.embedbase.xyz/document-is-too-long"
-                    },
-                )
             if doc.id is not None:
-                filtered_data.append(doc.dict())
-
-        df = DataFrame(
-            data=filtered_data,
-            columns=["id", "data", "embedding", "hash", "metadata"],
-        )
+                filtered_data.append(doc)
 
         start_time = time.time()
         self.logger.info(f"Refreshing {len(documents)} embeddings")
 
-        if not df.id.any():
+        if not any(doc.id for doc in filtered_data):
             self.logger.info("No documents to update, exiting")
             return JSONResponse(
                 status_code=400,
@@ -300,7 +647,9 @@ class Embedbase:
                     "error": "You need to provide at least one id to update a document"
                 },
             )
-        if not df.data.any() and not df.metadata.any():
+        if not any(doc.data for doc in filtered_data) and not any(
+            doc.metadata for doc in filtered_data
+        ):
             self.logger.info("No data nor metadata was given, exiting")
             return JSONResponse(
                 status_code=400,
@@ -309,57 +658,293 @@ class Embedbase:
                 },
             )
 
-        # hash the data
-        df.hash = df.data.apply(lambda x: hashlib.sha256(x.encode()).hexdigest())
+        if background:
+            return await self._enqueue_job(
+                JobKind.UPDATE,
+                dataset_id,
+                user_id,
+                {"documents": [doc.dict() for doc in filtered_data]},
+                total=len(filtered_data),
+            )
+
+        batch = await _updated_documents_batch(filtered_data, self.hash_scheme)
+        await self._reindex_batch(batch, dataset_id, user_id)
+
+        self.logger.info(f"Updated {len(batch)} documents' embeddings")
+        end_time = time.time()
+        self.logger.info(f"Updated in {end_time - start_time} seconds")
+
+        return encoded_response(
+            request,
+            {
+                **self._base_return(dataset_id),
+                **_results(batch, request_body.return_mode),
+            },
+            encoding,
+        )
+
+    async def _index_batch(
+        self,
+        batch: DocumentBatch,
+        dataset_id: str,
+        user_id: Optional[str],
+        store_data: bool = True,
+    ) -> DocumentBatch:
+        """
+        Embed (reusing cached embeddings) and store a batch of new documents,
+        skipping the ones already present in this dataset_id - user_id pair,
+        which take the id they are stored with in the batch
+        :return: the documents that were actually stored
+        """
+        self.logger.info(f"Checking embeddings cache for {len(batch)} documents")
+        # get existing embeddings from database
+        await self._fill_cached_embeddings(batch)
+
+        # only insert if this dataset_id - user_id
+        # pair does not have this hash
+        existing_documents_in_this_pair = await self.db.select(
+            hashes=list(set(batch.hashes)),
+            dataset_id=dataset_id,
+            user_id=user_id,
+        )
+        existing_ids_in_this_pair = {
+            doc.hash: doc.id for doc in existing_documents_in_this_pair
+        }
+
+        # filter out documents that already exist
+        # in this dataset_id - user_id pair
+        new_rows = [  # HACK: is it fine to only return client the new documents?
+            i for i, h in enumerate(batch.hashes) if h not in existing_ids_in_this_pair
+        ]
+        for i, h in enumerate(batch.hashes):
+            if h in existing_ids_in_this_pair:
+                batch.ids[i] = existing_ids_in_this_pair[h]
+
+        async def write(rows: DocumentBatch):
+            await self.db.update(
+                rows,
+                dataset_id,
+                user_id,
+                batch_size=UPLOAD_BATCH_SIZE,
+                store_data=store_data,
+            )
+            self.search_cache.bump(dataset_id)
 
-        df_length = len(df)
+        # compute embeddings for documents without embeddings using embed
+        await self._embed_and_write(batch, new_rows, write)
+        return batch.take(new_rows)
 
+    async def _reindex_batch(
+        self,
+        batch: DocumentBatch,
+        dataset_id: str,
+        user_id: Optional[str],
+    ) -> None:
+        """
+        Embed (reusing cached embeddings) and upsert a batch of updated documents
+        """
         # TODO: we can probably remove the embeddings part in update (unnecessary, embeddings always there?)
 
-        self.logger.info(f"Checking embeddings cache for {df_length} documents")
+        self.logger.info(f"Checking embeddings cache for {len(batch)} documents")
         # get existing embeddings from database
-        hashes_to_fetch = df.hash.tolist()
-        existing_embeddings = await self.db.select(
-            hashes=list(set(hashes_to_fetch)),
+        await self._fill_cached_embeddings(batch)
+
+        async def write(rows: DocumentBatch):
+            await self.db.update(
+                rows,
+                dataset_id,
+                user_id,
+                batch_size=UPLOAD_BATCH_SIZE,
+            )
+            self.search_cache.bump(dataset_id)
+
+        # compute embeddings for documents without embeddings using embed
+        await self._embed_and_write(batch, range(len(batch)), write)
+
+    def _project(self, embeddings: List[List[float]]) -> List[List[float]]:
+        if self.projection is None:
+            return embeddings
+        return self.projection.transform_list(embeddings)
+
+    async def _fill_cached_embeddings(self, batch: DocumentBatch) -> None:
+        """
+        Reuse the embeddings of documents already stored with the same hash
+        """
+        existing_documents = await self.db.select(
+            hashes=list(set(batch.hashes)),
             dataset_id=None,
             user_id=None,
         )
+        cached = {doc.hash: doc.embedding for doc in existing_documents}
+        batch.embeddings = [
+            cached.get(h, e) for h, e in zip(batch.hashes, batch.embeddings)
+        ]
 
-        def update_embedding(row, docs):
-            for doc in docs:
-                if row["hash"] == doc.hash:
-                    return doc.embedding
-            return row["embedding"]
+    async def _embed_and_write(
+        self,
+        batch: DocumentBatch,
+        rows: Sequence[int],
+        write: Callable[[DocumentBatch], Awaitable[None]],
+    ) -> None:
+        """
+        Compute the embeddings of the rows of the batch that don't have one yet
+        in EMBEDDING_BATCH_SIZE chunks, at most EMBEDDING_CONCURRENCY at a time,
+        and write the given rows as soon as their embeddings are available
+        so that embedding and database writes overlap
+        :param batch: documents, embeddings are filled in place
+        :param rows: indices of the rows to write
+        :param write: coroutine storing a batch of documents
+        """
+        to_write = set(rows)
+        missing = [i for i, e in enumerate(batch.embeddings) if e is None]
 
-        # add existing embeddings to the dataframe
-        df["embedding"] = df.apply(
-            update_embedding, args=(existing_embeddings,), axis=1
+        self.logger.info(
+            f"We will compute embeddings for {len(missing)}/{len(batch)} documents"
         )
 
-        # compute embeddings for documents without embeddings using embed
-        if not df[df.embedding.isna()].empty:
-            df[df.embedding.isna()] = df[df.embedding.isna()].assign(
-                embedding=await self.embedder.embed(
-                    df[df.embedding.isna()].data.tolist()
+        semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+
+        async def embed_and_write(chunk: Sequence[int]):
+            async with semaphore:
+                embeddings = self._project(
+                    await self.embedder.embed_bucketed([batch.data[i] for i in chunk])
                 )
-            )
+            for i, embedding in zip(chunk, embeddings):
+                batch.embeddings[i] = embedding
+            chunk_to_write = [i for i in chunk if i in to_write]
+            if chunk_to_write:
+                await write(batch.take(chunk_to_write))
+
+        missing_set = set(missing)
+        # rows whose embeddings are cached are written right away
+        cached_rows = [i for i in rows if i not in missing_set]
+        writes = []
+        # (still write when there is nothing at all, databases may create the dataset)
+        if cached_rows or not to_write & missing_set:
+            writes.append(write(batch.take(cached_rows)))
+        # a failed chunk cancels the others instead of letting them spend tokens
+        await gather_or_cancel(
+            *writes,
+            *[
+                embed_and_write(chunk)
+                for chunk in batched(missing, EMBEDDING_BATCH_SIZE)
+            ],
+        )
 
-        await self.db.update(
-            df,
-            dataset_id,
-            user_id,
-            batch_size=UPLOAD_BATCH_SIZE,
+    async def _enqueue_job(
+        self,
+        kind: JobKind,
+        dataset_id: str,
+        user_id: Optional[str],
+        payload: dict,
+        total: int,
+    ) -> JSONResponse:
+        job = Job.new(kind, dataset_id, user_id, total)
+        try:
+            await self.job_queue.put(job, payload)
+        except asyncio.QueueFull:
+            return JSONResponse(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                content={"error": "Too many jobs queued, please retry later"},
+            )
+        self._start_job_workers()
+        self.logger.info(f"Queued {kind.value} job {job.id} of {total} documents")
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={
+                **self._base_return(dataset_id),
+                "job_id": job.id,
+                "status": job.status.value,
+            },
         )
 
-        self.logger.info(f"Updated {len(df)} documents' embeddings")
-        end_time = time.time()
-        self.logger.info(f"Updated in {end_time - start_time} seconds")
+    def _start_job_workers(self) -> None:
+        if self._job_workers:
+            return
+        self._job_workers = [
+            asyncio.ensure_future(self._job_worker())
+            for _ in range(self.job_concurrency)
+        ]
 
+    async def _stop_job_workers(self) -> None:
+        for worker in self._job_workers:
+            worker.cancel()
+        self._job_workers = []
+
+    async def _job_worker(self) -> None:
+        while True:
+            try:
+                job, payload = await self.job_queue.get()
+            except Exception as e:  # pylint: disable=broad-except
+                self.logger.error(f"Could not get the next job: {e}")
+                await asyncio.sleep(1)
+                continue
+            try:
+                await self._run_job(job, payload)
+            except Exception as e:  # pylint: disable=broad-except
+                # keep the worker alive, e.g. when the queue failed to save progress
+                self.logger.error(f"Job {job.id} failed: {e}")
+                job.status = JobStatus.FAILED
+                job.error = str(e)
+                try:
+                    await self.job_queue.save(job)
+                except Exception as e:  # pylint: disable=broad-except
+                    self.logger.error(f"Could not save job {job.id}: {e}")
+
+    async def _run_job(self, job: Job, payload: dict) -> None:
+        start_time = time.time()
+        # a job resumed after a restart skips the documents it already processed
+        skip = job.processed
+        try:
+            if job.kind == JobKind.ADD:
+                request_body = AddRequest.parse_obj(payload)
+                remaining = request_body.documents[skip:]
+                for documents in batched(remaining, UPLOAD_BATCH_SIZE):
+                    batch = await _new_documents_batch(documents, self.hash_scheme)
+                    new_batch = await self._index_batch(
+                        batch,
+                        job.dataset_id,
+                        job.user_id,
+                        store_data=request_body.store_data,
+                    )
+                    job.ids.extend(new_batch.ids)
+                    job.processed += len(documents)
+                    await self.job_queue.save(job)
+            else:
+                request_body = UpdateRequest.parse_obj(payload)
+                remaining = request_body.documents[skip:]
+                for documents in batched(remaining, UPLOAD_BATCH_SIZE):
+                    batch = await _updated_documents_batch(documents, self.hash_scheme)
+                    await self._reindex_batch(batch, job.dataset_id, job.user_id)
+                    job.ids.extend(batch.ids)
+                    job.processed += len(documents)
+                    await self.job_queue.save(job)
+            job.status = JobStatus.SUCCEEDED
+        except Exception as e:  # pylint: disable=broad-except
+            self.logger.error(f"Job {job.id} failed: {e}")
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+        await self.job_queue.save(job)
+        self.logger.info(
+            f"Job {job.id} {job.status.value} in {time.time() - start_time} seconds"
+        )
+
+    async def get_job(self, request: Request, job_id: str):
+        """
+        Return the status and progress of a background add or update job.
+        """
+        user_id = get_user_id(request)
+        job = await self.job_queue.fetch(job_id)
+        if job is None or job.user_id != user_id:
+            return JSONResponse(
+                status_code=status.HTTP_404_NOT_FOUND,
+                content={"error": "Job not found"},
+            )
         return JSONResponse(
             status_code=status.HTTP_200_OK,
             content={
-                **self._base_return(dataset_id),
-                "results": df.to_dict(orient="records"),
+                **self._base_return(job.dataset_id),
+                "job": job.dict(exclude={"user_id"}),
             },
         )
 
@@ -380,6 +965,7 @@ class Embedbase:
         self.logger.info(f"Deleting {len(ids)} documents")
         quoted_ids = [urllib.parse.quote(id) for id in ids]
         await self.db.delete(ids=quoted_ids, dataset_id=dataset_id, user_id=user_id)
+        self.search_cache.bump(dataset_id)
         self.logger.info(f"Deleted {len(ids)} documents")
 
         return JSONResponse(
@@ -394,6 +980,7 @@ class Embedbase:
         request: Request,
         dataset_id: str,
         request_body: SearchRequest,
+        encoding: Optional[EmbeddingEncoding] = None,
     ):
         """
         Run semantic search in a dataset using embeddings.
@@ -412,7 +999,7 @@ class Embedbase:
         user_id = get_user_id(request)
 
         # if the query is too big, return an error
-        if self.embedder.is_too_big(query):
+        if request_body.vector_weight > 0 and self.embedder.is_too_big(query):
             return JSONResponse(
                 status_code=400,
                 content={
@@ -424,41 +1011,343 @@ class Embedbase:
         top_k = 5  # TODO might fail if index empty?
         if request_body.top_k > 0:
             top_k = request_body.top_k
-        query_embedding = (await self.embedder.embed(query))[0]
-
-        self.logger.info(
-            f"Query {request_body.query} created embedding, querying index"
+        # read before searching so that results computed while the dataset
+        # is written to are stored under the previous version
+        results_key = self.search_cache.results_key(
+            dataset_id,
+            user_id,
+            request_body.where,
+            top_k,
+            query,
+            request_body.vector_weight,
+            request_body.lexical_weight,
+            request_body.mmr,
+            request_body.fetch_k,
+            request_body.mmr_lambda,
+            request_body.min_score,
         )
-
-        query_response = await self.db.search(
-            top_k=top_k,
-            vector=query_embedding,
-            dataset_ids=[dataset_id],
-            user_id=user_id,
-            where=request_body.where,
+        similarities = self.search_cache.results.get(results_key)
+        if similarities is None:
+            try:
+                query_response = await self._search(
+                    request_body, top_k, [dataset_id], user_id
+                )
+            except NotImplementedError as e:
+                return JSONResponse(status_code=400, content={"error": str(e)})
+
+            similarities = []
+            for match in query_response:
+                similarities.append(
+                    {
+                        "score": match.score,
+                        "id": match.id,
+                        "data": match.data,
+                        "hash": match.hash,
+                        "embedding": match.embedding,
+                        "metadata": match.metadata,
+                    }
+                )
+            self.search_cache.results.set(results_key, similarities)
+        return encoded_response(
+            request,
+            {
+                **self._base_return(dataset_id),
+                "query": query,
+                "similarities": similarities,
+            },
+            encoding,
         )
 
-        similarities = []
+    async def federated_search(
+        self,
+        request: Request,
+        request_body: FederatedSearchRequest,
+        encoding: Optional[EmbeddingEncoding] = None,
+    ):
+        """
+        Run semantic search across several datasets at once using embeddings,
+        results are merged by score, optionally weighted and capped per dataset.
+        If you are a large language model, you can use this endpoint to search for similar documents
+        in all the datasets that may help you answer users' questions.
+        """
+        query = request_body.query
+
+        if not query and not request_body.where:
+            return JSONResponse(
+                status_code=status.HTTP_200_OK,
+                content={"query": query, "similarities": []},
+            )
+
+        user_id = get_user_id(request)
+
+        if request_body.vector_weight > 0 and self.embedder.is_too_big(query):
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "error": "Query is too long"
+                    + ", please see https://docs.embedbase.xyz/query-is-too-long"
+                },
+            )
+
+        top_k = 5
+        if request_body.top_k > 0:
+            top_k = request_body.top_k
+        dataset_ids = list(dict.fromkeys(request_body.dataset_ids))
+        weights = request_body.weights or {}
+        quotas = request_body.quotas or {}
+
+        try:
+            if weights or quotas:
+                # weights and quotas reorder the matches, every dataset gets
+                # its own top_k candidates to be able to fill the results alone
+                # embedded once for all the searches, even without a cache
+                query_embedding = None
+                if request_body.vector_weight > 0:
+                    query_embedding = await self._embed_query(query)
+                responses = await asyncio.gather(
+                    *[
+                        self._search(
+                            request_body,
+                            top_k,
+                            [dataset_id],
+                            user_id,
+                            query_embedding,
+                        )
+                        for dataset_id in dataset_ids
+                    ]
+                )
+                query_response = [match for matches in responses for match in matches]
+            else:
+                query_response = await self._search(
+                    request_body, top_k, dataset_ids, user_id
+                )
+        except NotImplementedError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+
+        scored = []
         for match in query_response:
+            match_dataset_id = match.dataset_ids[0] if match.dataset_ids else None
+            scored.append((match.score * weights.get(match_dataset_id, 1.0), match))
+        scored.sort(key=lambda e: e[0], reverse=True)
+
+        similarities = []
+        per_dataset = {}
+        for score, match in scored:
+            match_dataset_id = match.dataset_ids[0] if match.dataset_ids else None
+            count = per_dataset.get(match_dataset_id, 0)
+            if match_dataset_id in quotas and count >= quotas[match_dataset_id]:
+                continue
+            per_dataset[match_dataset_id] = count + 1
             similarities.append(
                 {
-                    "score": match.score,
+                    "score": score,
                     "id": match.id,
+                    "dataset_id": match_dataset_id,
                     "data": match.data,
                     "hash": match.hash,
                     "embedding": match.embedding,
                     "metadata": match.metadata,
                 }
             )
+            if len(similarities) >= top_k:
+                break
+        return encoded_response(
+            request,
+            {
+                **self._base_return(),
+                "query": query,
+                "similarities": similarities,
+            },
+            encoding,
+        )
+
+    async def context(
+        self,
+        request: Request,
+        dataset_id: str,
+        request_body: ContextRequest,
+    ):
+        """
+        Build a context from the documents of a dataset most similar to a query,
+        joined in order of relevance up to max_tokens tokens.
+        If you are a large language model, you can use this endpoint to get the documents
+        that help you answer users' questions within your context window.
+        """
+        query = request_body.query
+        user_id = get_user_id(request)
+        if request_body.vector_weight > 0 and self.embedder.is_too_big(query):
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "error": "Query is too long"
+                    + ", please see https://docs.embedbase.xyz/query-is-too-long"
+                },
+            )
+
+        separator_tokens = 0
+        if request_body.separator:
+            separator_tokens = (
+                await self.embedder.count_tokens([request_body.separator])
+            )[0]
+        chunks: List[str] = []
+        documents = []
+        tokens = 0
+        seen = set()
+        # the database is searched again for twice as many candidates
+        # until the budget is filled, the query is only embedded once
+        query_embedding = None
+        if request_body.vector_weight > 0:
+            query_embedding = await self._embed_query(query)
+        top_k = max(request_body.top_k, 1)
+        full = False
+        while not full:
+            try:
+                matches = await self._search(
+                    request_body, top_k, [dataset_id], user_id, query_embedding
+                )
+            except NotImplementedError as e:
+                return JSONResponse(status_code=400, content={"error": str(e)})
+            candidates = [m for m in matches if m.id not in seen and m.data]
+            seen.update(m.id for m in matches)
+            counts = await self.embedder.count_tokens([m.data for m in candidates])
+            for match, count in zip(candidates, counts):
+                cost = count + (separator_tokens if chunks else 0)
+                if tokens + cost > request_body.max_tokens:
+                    full = True
+                    break
+                tokens += cost
+                chunks.append(match.data)
+                documents.append(
+                    {
+                        "id": match.id,
+                        "score": match.score,
+                        "tokens": count,
+                        "metadata": match.metadata,
+                    }
+                )
+            if len(matches) < top_k or top_k >= CONTEXT_MAX_CANDIDATES:
+                break
+            top_k = min(top_k * 2, CONTEXT_MAX_CANDIDATES)
+
         return JSONResponse(
             status_code=status.HTTP_200_OK,
             content={
                 **self._base_return(dataset_id),
                 "query": query,
-                "similarities": similarities,
+                "context": request_body.separator.join(chunks),
+                "tokens": tokens,
+                "documents": documents,
             },
         )
 
+    async def _search(
+        self,
+        request_body: SearchRequest,
+        top_k: int,
+        dataset_ids: List[str],
+        user_id: Optional[str],
+        query_embedding: Optional[List[float]] = None,
+    ) -> List[SearchResponse]:
+        """
+        Run the searches of a request, with mmr the top_k results are a diverse
+        selection among fetch_k candidates (maximal marginal relevance)
+        :param query_embedding: the query embedding if already computed
+        """
+        if not request_body.mmr or request_body.vector_weight <= 0:
+            matches, _ = await self._rank(
+                request_body, top_k, dataset_ids, user_id, query_embedding
+            )
+            return matches
+        fetch_k = max(request_body.fetch_k or top_k * 4, top_k)
+        matches, query_embedding = await self._rank(
+            request_body, fetch_k, dataset_ids, user_id, query_embedding
+        )
+        selected = maximal_marginal_relevance(
+            query_embedding,
+            [match.embedding for match in matches],
+            top_k,
+            request_body.mmr_lambda,
+        )
+        return [matches[i] for i in selected]
+
+    async def _rank(
+        self,
+        request_body: SearchRequest,
+        top_k: int,
+        dataset_ids: List[str],
+        user_id: Optional[str],
+        query_embedding: Optional[List[float]] = None,
+    ) -> Tuple[List[SearchResponse], Optional[List[float]]]:
+        """
+        Run the vector and/or keyword searches of a request,
+        in hybrid mode both rankings are merged with reciprocal rank fusion
+        (the scores are then the fused scores)
+        :param query_embedding: the query embedding if already computed
+        :return: the matches and the query embedding, if the query was embedded
+        """
+        query = request_body.query
+        vector_weight = request_body.vector_weight
+        lexical_weight = request_body.lexical_weight
+        hybrid = vector_weight > 0 and lexical_weight > 0
+        # fusion promotes documents found by both rankings, look further in each
+        fetch_k = top_k * 2 if hybrid else top_k
+
+        vector_matches = []
+        if vector_weight > 0:
+            if query_embedding is None:
+                query_embedding = await self._embed_query(query)
+            self.logger.info(f"Query {query} created embedding, querying index")
+            vector_matches = await self.db.search(
+                top_k=fetch_k,
+                vector=query_embedding,
+                dataset_ids=dataset_ids,
+                user_id=user_id,
+                where=request_body.where,
+                # only passed when set, for databases predating the parameter
+                **(
+                    {"min_score": request_body.min_score}
+                    if request_body.min_score is not None
+                    else {}
+                ),
+            )
+        if not lexical_weight > 0:
+            return vector_matches, query_embedding
+
+        lexical_matches = await self.db.lexical_search(
+            query=query,
+            top_k=fetch_k,
+            dataset_ids=dataset_ids,
+            user_id=user_id,
+            where=request_body.where,
+        )
+        if not hybrid:
+            return lexical_matches, query_embedding
+
+        matches = {match.id: match for match in lexical_matches}
+        matches.update({match.id: match for match in vector_matches})
+        fused = reciprocal_rank_fusion(
+            [
+                [match.id for match in vector_matches],
+                [match.id for match in lexical_matches],
+            ],
+            [vector_weight, lexical_weight],
+        )
+        return [
+            matches[doc_id].copy(update={"score": score})
+            for doc_id, score in fused[:top_k]
+        ], query_embedding
+
+    async def _embed_query(self, query: str) -> List[float]:
+        """
+        Embed (and project) a query, through the query embeddings cache
+        """
+        query_key = self.search_cache.query_key(query)
+        query_embedding = self.search_cache.embeddings.get(query_key)
+        if query_embedding is None:
+            query_embedding = self._project(await self.embedder.embed(query))[0]
+            self.search_cache.embeddings.set(query_key, query_embedding)
+        return query_embedding
+
     async def get_datasets(
         self,
         request: Request,
@@ -481,23 +1370,69 @@ class Embedbase:
 
     # TODO where filter for list?
     async def list(
-        self, request: Request, dataset_id: str, offset: int = 0, limit: int = 100
+        self,
+        request: Request,
+        dataset_id: str,
+        offset: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        stream: bool = False,
+        encoding: Optional[EmbeddingEncoding] = None,
     ):
         """
         Return a list of documents in the dataset.
         As a large language model, you can use this endpoint to see what documents you have
         and how many documents are in each.
+        Pass the next_cursor of a page as cursor to get the next page,
+        or stream=true to export the whole dataset as newline-delimited JSON.
         """
         user_id = get_user_id(request)
-        documents = await self.db.list(dataset_id, user_id, offset, limit)
-        return JSONResponse(
-            status_code=status.HTTP_200_OK,
-            content={
+        try:
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+        if stream:
+            return StreamingResponse(
+                self._export(dataset_id, user_id, after, encoding),
+                media_type="application/x-ndjson",
+            )
+        documents = await self.db.list(dataset_id, user_id, offset, limit, after=after)
+        next_cursor = None
+        if documents and len(documents) == limit and documents[-1].created_date:
+            next_cursor = encode_cursor(documents[-1].created_date, documents[-1].id)
+        return encoded_response(
+            request,
+            {
                 **self._base_return(dataset_id),
                 "documents": [e.dict() for e in documents],
+                "next_cursor": next_cursor,
             },
+            encoding,
         )
 
+    async def _export(
+        self,
+        dataset_id: str,
+        user_id: Optional[str],
+        after: Optional[Tuple[str, str]] = None,
+        encoding: Optional[EmbeddingEncoding] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Walk a dataset page by page, holding a single page in memory,
+        yielding a JSON document per line
+        """
+        while True:
+            documents = await self.db.list(
+                dataset_id, user_id, limit=EXPORT_PAGE_SIZE, after=after
+            )
+            for document in encode_documents(
+                [d.dict() for d in documents], encoding or EmbeddingEncoding.FLOAT
+            ):
+                yield json.dumps(document) + "\n"
+            if len(documents) < EXPORT_PAGE_SIZE:
+                return
+            after = (documents[-1].created_date, documents[-1].id)
+
     async def replace(
         self, request: Request, dataset_id: str, request_body: ReplaceRequest
     ):
@@ -517,13 +1452,14 @@ class Embedbase:
         # 2. delete these documents from embedbase (you cant simply upsert, maybe there are more chunks)
         ids = [d.id for d in documents]
         await self.db.delete(ids=ids, dataset_id=dataset_id, user_id=user_id)
+        self.search_cache.bump(dataset_id)
 
         # add the metadata used to filter in the documents
         for d in request_body.documents:
             if d.metadata is None:
                 d.metadata = {}
 
-            d.metadata.update(request_body.where)
+            d.metadata.update(equalities(parse_filter(request_body.where)))
 
         # 3. upsert the updated documents
         return await self.add(
@@ -553,11 +1489,26 @@ class Embedbase:
         if not hasattr(self, "embedder"):
             raise Exception("You need to use an embedder!")
 
+        self.fastapi_app.add_event_handler("startup", self._start_job_workers)
+        self.fastapi_app.add_event_handler("shutdown", self._stop_job_workers)
+
         # Add the endpoints
+        # before /v1/{dataset_id} which would match it
+        self.fastapi_app.add_api_route(
+            "/v1/search", self.federated_search, methods=["POST"]
+        )
         self.fastapi_app.add_api_route(
             "/v1/{dataset_id}/clear", self.clear, methods=["GET"]
         )
+        # after /v1/{dataset_id}/clear so that /v1/jobs/clear still clears
+        # a dataset named jobs, job ids are hex uuids
+        self.fastapi_app.add_api_route(
+            "/v1/jobs/{job_id}", self.get_job, methods=["GET"]
+        )
         self.fastapi_app.add_api_route("/v1/{dataset_id}", self.add, methods=["POST"])
+        self.fastapi_app.add_api_route(
+            "/v1/{dataset_id}/bulk", self.bulk_add, methods=["POST"]
+        )
         self.fastapi_app.add_api_route("/v1/{dataset_id}", self.update, methods=["PUT"])
         self.fastapi_app.add_api_route(
             "/v1/{dataset_id}", self.delete, methods=["DELETE"]
@@ -565,6 +1516,9 @@ class Embedbase:
         self.fastapi_app.add_api_route(
             "/v1/{dataset_id}/search", self.semantic_search, methods=["POST"]
         )
+        self.fastapi_app.add_api_route(
+            "/v1/{dataset_id}/context", self.context, methods=["POST"]
+        )
         self.fastapi_app.add_api_route(
             "/v1/datasets", self.get_datasets, methods=["GET"]
         )
@@ -574,6 +1528,10 @@ class Embedbase:
         )
 
         self.fastapi_app.add_api_route("/health", self.health, methods=["GET"])
+        if self.compression is not None:
+            self.logger.info("Enabling response compression")
+            # outermost, so that the other middlewares see decompressed requests
+            self.fastapi_app.add_middleware(CompressionMiddleware, **self.compression)
         print(embedbase_ascii)
 
         return self.fastapi_app
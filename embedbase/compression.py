@@ -0,0 +1,295 @@
+from typing import Any, Dict, List, Optional
+
+import zlib
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# content types that are not worth compressing again
+INCOMPRESSIBLE_TYPES = ("image/", "video/", "audio/", "application/zip")
+# most bytes a decompressor outputs at once
+DECOMPRESSION_CHUNK_SIZE = 64 * 1024
+
+
+class RequestBodyTooLarge(HTTPException):
+    def __init__(self, max_body_size: int):
+        super().__init__(
+            status_code=413,
+            detail=f"Decompressed request body is larger than {max_body_size} bytes",
+        )
+
+
+def _zstandard():
+    try:
+        import zstandard
+
+        return zstandard
+    except ImportError:
+        return None
+
+
+class _Compressor:
+    """
+    Incremental gzip or zstd compressor, flushing every chunk
+    so that streamed responses are not held back
+    """
+
+    def __init__(self, encoding: str, gzip_level: int, zstd_level: int):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self._zstd = _zstandard()
+            self._compressor = self._zstd.ZstdCompressor(level=zstd_level).compressobj()
+        else:
+            self._compressor = zlib.compressobj(
+                gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+            )
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "zstd":
+            flush = (
+                self._zstd.COMPRESSOBJ_FLUSH_FINISH
+                if final
+                else self._zstd.COMPRESSOBJ_FLUSH_BLOCK
+            )
+        else:
+            flush = zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH
+        return self._compressor.compress(data) + self._compressor.flush(flush)
+
+
+class _Output:
+    """
+    Decompressed chunks, counting their size against max_body_size
+    """
+
+    def __init__(self, max_body_size: Optional[int]):
+        self.max_body_size = max_body_size
+        self.size = 0
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        if self.max_body_size is not None and self.size > self.max_body_size:
+            raise RequestBodyTooLarge(self.max_body_size)
+        self._chunks.append(data)
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class _Decompressor:
+    """
+    Incremental gzip, deflate or zstd decompressor producing at most
+    DECOMPRESSION_CHUNK_SIZE bytes at once, so that a small compressed body
+    expanding past max_body_size is rejected before it is held in memory
+    """
+
+    def __init__(self, encoding: str, max_body_size: Optional[int]):
+        self._output = _Output(max_body_size)
+        self._zlib = None
+        if encoding == "zstd":
+            # the output is written one chunk at a time
+            self._zstd = (
+                _zstandard()
+                .ZstdDecompressor()
+                .stream_writer(self._output, write_size=DECOMPRESSION_CHUNK_SIZE)
+            )
+        else:
+            wbits = 16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS
+            self._zlib = zlib.decompressobj(wbits)
+
+    def decompress(self, data: bytes) -> bytes:
+        if self._zlib is None:
+            self._zstd.write(data)
+        while self._zlib is not None and data:
+            self._output.write(self._zlib.decompress(data, DECOMPRESSION_CHUNK_SIZE))
+            data = self._zlib.unconsumed_tail
+        return self._output.take()
+
+    def flush(self) -> bytes:
+        if self._zlib is None:
+            self._zstd.flush()
+        else:
+            self._output.write(self._zlib.flush())
+        return self._output.take()
+
+
+def _decompressor(encoding: str, max_body_size: Optional[int]) -> Optional[Any]:
+    if encoding in ("gzip", "deflate") or (
+        encoding == "zstd" and _zstandard() is not None
+    ):
+        return _Decompressor(encoding, max_body_size)
+    return None
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    :param accept_encoding: Accept-Encoding header
+    :return: the preferred of zstd (when zstandard is installed) and gzip,
+        None if the client accepts neither
+    """
+    supported = ["zstd", "gzip"] if _zstandard() is not None else ["gzip"]
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, *params = [part.strip() for part in item.split(";")]
+        weight = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    weight = float(param[2:])
+                except ValueError:
+                    weight = 0.0
+        weights[name.lower()] = weight
+    best, best_weight = None, 0.0
+    for name in supported:
+        weight = weights.get(name, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with gzip or zstd as negotiated with Accept-Encoding,
+    and decompress request bodies sent with a gzip, deflate or zstd Content-Encoding
+    while they are read, so that streamed uploads stay streamed
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        zstd_level: int = 3,
+        max_body_size: Optional[int] = 32 * 1024 * 1024,
+    ):
+        """
+        :param minimum_size: smallest response body compressed, in bytes,
+            streamed responses are always compressed
+        :param gzip_level: gzip compression level, 1 (fast) to 9 (small)
+        :param zstd_level: zstd compression level, 1 (fast) to 22 (small)
+        :param max_body_size: largest decompressed request body, in bytes,
+            larger bodies are rejected with a 413, None for no limit
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.zstd_level = zstd_level
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+
+        content_encoding = headers.get("content-encoding", "").lower()
+        if content_encoding not in ("", "identity"):
+            decompressor = _decompressor(content_encoding, self.max_body_size)
+            if decompressor is None:
+                response = JSONResponse(
+                    status_code=415,
+                    content={
+                        "error": f"Unsupported Content-Encoding {content_encoding}"
+                    },
+                )
+                await response(scope, receive, send)
+                return
+            # the application sees the decompressed body
+            scope = {
+                **scope,
+                "headers": [
+                    (key, value)
+                    for key, value in scope["headers"]
+                    if key not in (b"content-encoding", b"content-length")
+                ],
+            }
+            receive = self._decompressing(receive, decompressor)
+
+        encoding = negotiate_encoding(headers.get("accept-encoding", ""))
+        started = False
+
+        async def send_tracked(message: Message) -> None:
+            nonlocal started
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        app_send = (
+            send_tracked
+            if encoding is None
+            else self._compressing(send_tracked, encoding)
+        )
+        try:
+            await self.app(scope, receive, app_send)
+        except RequestBodyTooLarge as e:
+            # raised outside of a request handler, e.g. by a streaming response
+            if started:
+                raise
+            response = JSONResponse(
+                status_code=e.status_code, content={"error": e.detail}
+            )
+            await response(scope, receive, send)
+
+    @staticmethod
+    def _decompressing(receive: Receive, decompressor: Any) -> Receive:
+        async def wrapped() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                # zstd decompressors refuse any input after the end of the frame
+                body = decompressor.decompress(chunk) if chunk else b""
+                if not message.get("more_body", False):
+                    body += decompressor.flush()
+                message = {**message, "body": body}
+            return message
+
+        return wrapped
+
+    def _compressing(self, send: Send, encoding: str) -> Send:
+        start: Optional[Message] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def wrapped(message: Message) -> None:
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                headers = MutableHeaders(raw=list(start.get("headers", [])))
+                start = {**start, "headers": headers.raw}
+                headers.add_vary_header("Accept-Encoding")
+                if (
+                    "content-encoding" in headers
+                    or headers.get("content-type", "").startswith(INCOMPRESSIBLE_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.zstd_level)
+                headers["Content-Encoding"] = encoding
+                body = compressor.compress(body, final=not more_body)
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(body))
+                await send(start)
+            else:
+                body = compressor.compress(body, final=not more_body)
+            await send(
+                {"type": "http.response.body", "body": body, "more_body": more_body}
+            )
+
+        return wrapped
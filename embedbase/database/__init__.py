@@ -1,5 +1,7 @@
 from embedbase.database.base import VectorDatabase
+from embedbase.database.batch import DocumentBatch
 
 __all__ = [
     "VectorDatabase",
+    "DocumentBatch",
 ]
@@ -1,10 +1,11 @@
-from typing import Coroutine, List, Optional, Union
+from typing import Coroutine, List, Optional, Tuple, Union
 
 from abc import ABC, abstractmethod
 
 from pandas import DataFrame
 from pydantic import BaseModel
 
+from embedbase.database.batch import DocumentBatch
 from embedbase.models import Document
 
 
@@ -26,6 +27,11 @@ class WhereResponse(Document):
     pass
 
 
+class ListResponse(Document):
+    # the documents are listed by (created_date, id)
+    created_date: Optional[str] = None
+
+
 class VectorDatabase(ABC):
     """
     Base class for all vector databases
@@ -56,14 +62,15 @@ class VectorDatabase(ABC):
     @abstractmethod
     async def update(
         self,
-        df: DataFrame,
+        df: Union[DocumentBatch, DataFrame],
         dataset_id: str,
         user_id: Optional[str] = None,
         batch_size: Optional[int] = 100,
         store_data: bool = True,
     ) -> Coroutine:
         """
-        :param df: dataframe
+        :param df: documents to upsert, a DocumentBatch or a pandas DataFrame
+            (use embedbase.database.batch.as_batch to normalize it)
         :param dataset_id: dataset id
         :param user_id: user id
         :param batch_size: batch size
@@ -90,6 +97,7 @@ class VectorDatabase(ABC):
         dataset_ids: List[str],
         user_id: Optional[str] = None,
         where: Optional[Union[dict, List[dict]]] = None,
+        min_score: Optional[float] = None,
     ) -> List[SearchResponse]:
         """
         :param vector: vector the similarity is calculated against
@@ -97,10 +105,32 @@ class VectorDatabase(ABC):
         :param dataset_id: dataset id
         :param user_id: user id
         :param where: where condition to filter results
+        :param min_score: minimum cosine similarity of the results, filtered by the database
         :return: list of documents
         """
         raise NotImplementedError
 
+    async def lexical_search(
+        self,
+        query: str,
+        top_k: Optional[int],
+        dataset_ids: List[str],
+        user_id: Optional[str] = None,
+        where: Optional[Union[dict, List[dict]]] = None,
+    ) -> List[SearchResponse]:
+        """
+        Keyword search, optional for databases supporting it
+        :param query: keywords
+        :param top_k: top k number of results returned
+        :param dataset_ids: dataset ids
+        :param user_id: user id
+        :param where: where condition to filter results
+        :return: list of documents, by decreasing relevance score
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support lexical search"
+        )
+
     @abstractmethod
     async def clear(self, dataset_id: str, user_id: Optional[str] = None) -> None:
         """
@@ -124,13 +154,16 @@ class VectorDatabase(ABC):
         user_id: Optional[str] = None,
         offset: int = 0,
         limit: int = 100,
-    ) -> List[Document]:
+        after: Optional[Tuple[str, str]] = None,
+    ) -> List[ListResponse]:
         """
-        Returns a list of Documents in a dataset
+        Returns a list of Documents in a dataset, ordered by (created_date, id)
         :param dataset_id: dataset id
         :param user_id: user id
         :param offset: offset
         :param limit: limit
+        :param after: (created_date, id) of the last document of the previous page,
+            to paginate without scanning the skipped documents
         :return: list of documents
         """
         raise NotImplementedError
@@ -0,0 +1,174 @@
+from typing import Any, Iterator, List, Optional, Sequence
+
+
+class DocumentRecord:
+    """
+    A row view over a DocumentBatch, exposing the same attributes
+    as the pandas rows the databases used to iterate over
+    """
+
+    __slots__ = ("id", "data", "embedding", "hash", "metadata")
+
+    def __init__(
+        self,
+        id: Optional[str],
+        data: Optional[str],
+        embedding: Optional[List[float]],
+        hash: Optional[str],
+        metadata: Optional[dict],
+    ):
+        self.id = id
+        self.data = data
+        self.embedding = embedding
+        self.hash = hash
+        self.metadata = metadata
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "data": self.data,
+            "embedding": self.embedding,
+            "hash": self.hash,
+            "metadata": self.metadata,
+        }
+
+
+class DocumentBatch:
+    """
+    Lightweight columnar container of documents passed from the app
+    to VectorDatabase.update, replacing the pandas DataFrame on the hot path
+    """
+
+    __slots__ = ("ids", "data", "embeddings", "hashes", "metadata")
+
+    COLUMNS = ("id", "data", "embedding", "hash", "metadata")
+
+    def __init__(
+        self,
+        ids: Optional[List[Optional[str]]] = None,
+        data: Optional[List[Optional[str]]] = None,
+        embeddings: Optional[List[Optional[List[float]]]] = None,
+        hashes: Optional[List[Optional[str]]] = None,
+        metadata: Optional[List[Optional[dict]]] = None,
+    ):
+        given = [c for c in (ids, data, embeddings, hashes, metadata) if c is not None]
+        length = len(given[0]) if given else 0
+        if any(len(c) != length for c in given):
+            raise ValueError("all columns of a DocumentBatch must have the same length")
+        self.ids = list(ids) if ids is not None else [None] * length
+        self.data = list(data) if data is not None else [None] * length
+        self.embeddings = (
+            list(embeddings) if embeddings is not None else [None] * length
+        )
+        self.hashes = list(hashes) if hashes is not None else [None] * length
+        self.metadata = list(metadata) if metadata is not None else [None] * length
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[DocumentRecord]:
+        return map(
+            DocumentRecord,
+            self.ids,
+            self.data,
+            self.embeddings,
+            self.hashes,
+            self.metadata,
+        )
+
+    def __getitem__(self, index: int) -> DocumentRecord:
+        return DocumentRecord(
+            self.ids[index],
+            self.data[index],
+            self.embeddings[index],
+            self.hashes[index],
+            self.metadata[index],
+        )
+
+    def take(self, indices: Sequence[int]) -> "DocumentBatch":
+        """
+        Return a new batch holding only the rows at the given indices
+        :param indices: row indices to keep
+        :return: a new DocumentBatch
+        """
+        return DocumentBatch(
+            ids=[self.ids[i] for i in indices],
+            data=[self.data[i] for i in indices],
+            embeddings=[self.embeddings[i] for i in indices],
+            hashes=[self.hashes[i] for i in indices],
+            metadata=[self.metadata[i] for i in indices],
+        )
+
+    def split(self, batch_size: int) -> Iterator["DocumentBatch"]:
+        """
+        Split the batch in contiguous chunks of at most batch_size rows
+        :param batch_size: maximum number of rows per chunk
+        :return: iterator of DocumentBatch
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least one")
+        for start in range(0, len(self), batch_size):
+            end = start + batch_size
+            yield DocumentBatch(
+                ids=self.ids[start:end],
+                data=self.data[start:end],
+                embeddings=self.embeddings[start:end],
+                hashes=self.hashes[start:end],
+                metadata=self.metadata[start:end],
+            )
+
+    def to_records(self) -> List[dict]:
+        """
+        Equivalent of DataFrame.to_dict(orient="records")
+        """
+        return [
+            {
+                "id": i,
+                "data": d,
+                "embedding": e,
+                "hash": h,
+                "metadata": m,
+            }
+            for i, d, e, h, m in zip(
+                self.ids, self.data, self.embeddings, self.hashes, self.metadata
+            )
+        ]
+
+    @classmethod
+    def from_dataframe(cls, df: Any) -> "DocumentBatch":
+        """
+        Build a batch from a pandas DataFrame with (a subset of) the columns
+        id, data, embedding, hash and metadata
+        """
+        columns = {
+            c: (df[c].tolist() if c in df.columns else [None] * len(df))
+            for c in cls.COLUMNS
+        }
+        return cls(
+            ids=columns["id"],
+            data=columns["data"],
+            embeddings=columns["embedding"],
+            hashes=columns["hash"],
+            metadata=columns["metadata"],
+        )
+
+    def to_dataframe(self) -> Any:
+        """
+        Convert the batch to a pandas DataFrame, for compatibility
+        """
+        # pylint: disable=import-outside-toplevel
+        from pandas import DataFrame
+
+        return DataFrame(data=self.to_records(), columns=list(self.COLUMNS))
+
+
+def as_batch(documents: Any) -> DocumentBatch:
+    """
+    Accept either a DocumentBatch or a pandas DataFrame
+    and return a DocumentBatch
+    :param documents: DocumentBatch or DataFrame
+    :return: DocumentBatch
+    """
+    if isinstance(documents, DocumentBatch):
+        return documents
+    return DocumentBatch.from_dataframe(documents)
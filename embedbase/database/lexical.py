@@ -0,0 +1,118 @@
+from typing import Dict, Hashable, List, Optional, Sequence, Set, Tuple
+
+import math
+import re
+from collections import Counter
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    Lowercased words (letters, digits and underscores) of a text,
+    so that product codes and names are kept as single terms
+    """
+    return _TOKEN.findall(text.lower()) if text else []
+
+
+class BM25Index:
+    """
+    Inverted index updated incrementally as documents are added and removed,
+    scoring documents with Okapi BM25
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # term -> {document id -> term frequency}
+        self._postings: Dict[str, Dict[Hashable, int]] = {}
+        # document id -> (distinct terms, length), to remove documents
+        self._documents: Dict[Hashable, Tuple[List[str], int]] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, doc_id: Hashable, text: Optional[str]) -> None:
+        """
+        Index a document, replacing its previous version if any
+        """
+        self.remove(doc_id)
+        terms = Counter(tokenize(text))
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = frequency
+        length = sum(terms.values())
+        self._documents[doc_id] = (list(terms), length)
+        self._total_length += length
+
+    def remove(self, doc_id: Hashable) -> None:
+        document = self._documents.pop(doc_id, None)
+        if document is None:
+            return
+        terms, length = document
+        self._total_length -= length
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+
+    def clear(self) -> None:
+        self._postings.clear()
+        self._documents.clear()
+        self._total_length = 0
+
+    def search(
+        self,
+        query: str,
+        top_k: int,
+        candidates: Optional[Set[Hashable]] = None,
+    ) -> List[Tuple[Hashable, float]]:
+        """
+        :param query: keywords
+        :param top_k: number of results
+        :param candidates: only score these documents, all of them if None
+        :return: (document id, score) by decreasing score, documents without
+            any query term are not returned
+        """
+        n = len(self._documents)
+        if n == 0:
+            return []
+        average_length = self._total_length / n or 1
+        scores: Dict[Hashable, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                if candidates is not None and doc_id not in candidates:
+                    continue
+                norm = self.k1 * (
+                    1 - self.b + self.b * self._documents[doc_id][1] / average_length
+                )
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (
+                    self.k1 + 1
+                ) / (frequency + norm)
+        return sorted(scores.items(), key=lambda e: e[1], reverse=True)[:top_k]
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[Hashable]],
+    weights: Optional[Sequence[float]] = None,
+    k: int = 60,
+) -> List[Tuple[Hashable, float]]:
+    """
+    Merge rankings with weighted reciprocal rank fusion:
+    score(d) = sum over rankings of weight / (k + rank of d)
+    :param rankings: ids ordered from best to worst, one list per ranking
+    :param weights: weight of every ranking, 1 by default
+    :param k: dampens the advantage of the first ranks
+    :return: (id, fused score) by decreasing score
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores: Dict[Hashable, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda e: e[1], reverse=True)
@@ -1,13 +1,19 @@
-from typing import List, Optional, Union
+from typing import List, Optional, Tuple, Union
+
+import datetime
+import heapq
 
 from embedbase.database.base import (
     Dataset,
+    ListResponse,
     SearchResponse,
     SelectResponse,
     VectorDatabase,
     WhereResponse,
 )
-from embedbase.models import Document
+from embedbase.database.batch import as_batch
+from embedbase.database.lexical import BM25Index
+from embedbase.filters import compile_predicate, parse_filter
 
 
 # Calculate cosine similarity
@@ -16,16 +22,23 @@ def cosine_similarity(np, a, b):
 
 
 # Semantic search function
-def semantic_search(np, documents, query_embedding, document_embeddings, top_n=3):
-    similarities = [
-        cosine_similarity(np, query_embedding, doc_emb)
-        for doc_emb in document_embeddings
-    ]
-    sorted_indexes = np.argsort(similarities)[::-1]
+def semantic_search(
+    np, documents, query_embedding, document_embeddings, top_n=3, min_score=None
+):
+    if not document_embeddings:
+        return []
+    matrix = np.stack(document_embeddings)
+    similarities = (matrix @ query_embedding) / (
+        np.linalg.norm(matrix, axis=1) * np.linalg.norm(query_embedding)
+    )
+    # drop the documents under the threshold before sorting
+    indexes = np.arange(len(similarities))
+    if min_score is not None:
+        indexes = indexes[similarities >= min_score]
+    sorted_indexes = indexes[np.argsort(similarities[indexes])[::-1]]
 
-    return [
-        (i, list(documents.keys())[i], similarities[i]) for i in sorted_indexes[:top_n]
-    ]
+    keys = list(documents.keys())
+    return [(i, keys[i], float(similarities[i])) for i in sorted_indexes[:top_n]]
 
 
 class MemoryDatabase(VectorDatabase):
@@ -36,6 +49,7 @@ class MemoryDatabase(VectorDatabase):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.storage = {}
+        self._lexical = BM25Index()
         try:
             # pylint: disable=import-outside-toplevel
             import numpy as np
@@ -58,8 +72,11 @@ class MemoryDatabase(VectorDatabase):
             raise NotImplementedError(
                 "where is not implemented in memory db yet, if you need it, ping us on discord and we will ship instantly"
             )
-        for _, row in df.iterrows():
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        for row in as_batch(df):
             doc_id = row.id
+            # as in postgres, updates keep the creation date
+            previous = self.storage.get(doc_id)
             self.storage[doc_id] = {
                 "data": row.data if store_data else None,
                 "embedding": self._np.array(row.embedding),
@@ -67,7 +84,12 @@ class MemoryDatabase(VectorDatabase):
                 "dataset_id": dataset_id,
                 "user_id": user_id,
                 "hash": row.hash,
+                "created_date": previous["created_date"] if previous else now,
             }
+            if store_data:
+                self._lexical.add(doc_id, row.data)
+            else:
+                self._lexical.remove(doc_id)
 
     async def select(
         self,
@@ -112,44 +134,52 @@ class MemoryDatabase(VectorDatabase):
         else:
             return []
 
-    async def search(self, vector, top_k, dataset_ids, user_id=None, where=None):
-        storage = self.storage
-        # make a copy of storage filtered by where
-        if where:
-            # raise if where is not a dict
-            if not isinstance(where, dict):
-                raise ValueError("currently only dict is supported for where")
-            storage = self.storage.copy()
-            for k, v in where.items():
-                # search in metadata
-                storage = {
-                    k1: v1
-                    for k1, v1 in storage.items()
-                    if k in v1["metadata"] and v1["metadata"][k] == v
-                }
+    def _filter(self, dataset_ids, user_id=None, where=None) -> dict:
+        """
+        :param dataset_ids: datasets to read, all of them if None
+        :return: the stored documents of the datasets and user matching where
+        """
+        matches = compile_predicate(parse_filter(where))
+        return {
+            doc_id: doc
+            for doc_id, doc in self.storage.items()
+            if (dataset_ids is None or doc["dataset_id"] in dataset_ids)
+            and (user_id is None or doc["user_id"] == user_id)
+            and matches(doc["metadata"])
+        }
+
+    def _search_response(self, doc_id, score) -> SearchResponse:
+        doc = self.storage[doc_id]
+        return SearchResponse(
+            id=doc_id,
+            score=score,
+            data=doc["data"],
+            metadata=doc["metadata"],
+            embedding=doc["embedding"].tolist(),
+            hash=doc["hash"],
+            dataset_ids=[doc["dataset_id"]],
+        )
+
+    async def search(
+        self, vector, top_k, dataset_ids, user_id=None, where=None, min_score=None
+    ):
+        storage = self._filter(dataset_ids, user_id, where)
         query_embedding = self._np.array(vector)
         similarities = semantic_search(
             self._np,
             storage,
             query_embedding,
-            [
-                doc["embedding"]
-                for doc in storage.values()
-                if doc["dataset_id"] in dataset_ids
-                and (user_id is None or doc["user_id"] == user_id)
-            ],
+            [doc["embedding"] for doc in storage.values()],
             top_n=top_k,
+            min_score=min_score,
         )
+        return [self._search_response(doc_id, sim) for idx, doc_id, sim in similarities]
+
+    async def lexical_search(self, query, top_k, dataset_ids, user_id=None, where=None):
+        candidates = set(self._filter(dataset_ids, user_id, where))
         return [
-            SearchResponse(
-                id=doc_id,
-                score=sim,
-                data=storage[doc_id]["data"],
-                metadata=storage[doc_id]["metadata"],
-                embedding=storage[doc_id]["embedding"].tolist(),
-                hash=storage[doc_id]["hash"],
-            )
-            for idx, doc_id, sim in similarities
+            self._search_response(doc_id, score)
+            for doc_id, score in self._lexical.search(query, top_k, candidates)
         ]
 
     async def delete(self, ids, dataset_id, user_id=None):
@@ -163,6 +193,7 @@ class MemoryDatabase(VectorDatabase):
                 and (user_id is None or self.storage[doc_id]["user_id"] == user_id)
             ):
                 del self.storage[doc_id]
+                self._lexical.remove(doc_id)
 
     async def get_datasets(self, user_id=None):
         datasets = {}
@@ -190,6 +221,7 @@ class MemoryDatabase(VectorDatabase):
         ]
         for doc_id in doc_ids_to_remove:
             del self.storage[doc_id]
+            self._lexical.remove(doc_id)
 
     async def list(
         self,
@@ -197,8 +229,28 @@ class MemoryDatabase(VectorDatabase):
         user_id: Optional[str] = None,
         offset: int = 0,
         limit: int = 100,
-    ) -> List[Document]:
-        raise NotImplementedError
+        after: Optional[Tuple[str, str]] = None,
+    ) -> List[ListResponse]:
+        keys = (
+            (doc["created_date"], doc_id)
+            for doc_id, doc in self._filter([dataset_id], user_id).items()
+        )
+        if after:
+            keys = (key for key in keys if key > tuple(after))
+        # a partial sort, the page is small compared to the dataset
+        page = heapq.nsmallest(offset + limit, keys)[offset:]
+        return [
+            ListResponse(
+                id=doc_id,
+                data=self.storage[doc_id]["data"],
+                embedding=self.storage[doc_id]["embedding"].tolist(),
+                hash=self.storage[doc_id]["hash"],
+                metadata=self.storage[doc_id]["metadata"],
+                dataset_ids=[dataset_id],
+                created_date=created_date,
+            )
+            for created_date, doc_id in page
+        ]
 
     async def where(
         self,
@@ -212,4 +264,17 @@ class MemoryDatabase(VectorDatabase):
         :param where: where condition to filter results
         :return: list of documents
         """
-        raise NotImplementedError
+        storage = self._filter(
+            None if dataset_id is None else [dataset_id], user_id, where
+        )
+        return [
+            WhereResponse(
+                id=doc_id,
+                data=doc["data"],
+                embedding=doc["embedding"].tolist(),
+                hash=doc["hash"],
+                metadata=doc["metadata"],
+                dataset_ids=[doc["dataset_id"]],
+            )
+            for doc_id, doc in storage.items()
+        ]
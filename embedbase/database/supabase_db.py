@@ -1,21 +1,22 @@
-from typing import List, Optional, Union
+from typing import List, Optional, Tuple, Union
 
 import ast
 import asyncio
 import itertools
+import json
 
-import pandas as pd
-from pandas import DataFrame, Series
+from pandas import DataFrame
 
 from embedbase.database import VectorDatabase
 from embedbase.database.base import (
     Dataset,
+    ListResponse,
     SearchResponse,
     SelectResponse,
     WhereResponse,
 )
-from embedbase.models import Document
-from embedbase.utils import BatchGenerator
+from embedbase.database.batch import DocumentBatch, DocumentRecord, as_batch
+from embedbase.filters import equalities, parse_filter, to_json
 
 
 class Supabase(VectorDatabase):
@@ -102,14 +103,13 @@ class Supabase(VectorDatabase):
 
     async def update(
         self,
-        df: DataFrame,
+        df: Union[DocumentBatch, DataFrame],
         dataset_id: str,
         user_id: Optional[str] = None,
         batch_size: Optional[int] = 100,
         store_data: bool = True,
     ):
-        df_batcher = BatchGenerator(batch_size)
-        batches = [batch_df for batch_df in df_batcher(df)]
+        batches = list(as_batch(df).split(batch_size))
 
         # create dataset in datasets table if not exist
 
@@ -134,9 +134,9 @@ class Supabase(VectorDatabase):
         dataset_final_id = data[0]["id"]
 
         async def _insert(
-            batch_df: DataFrame, dataset_final_id: str = dataset_final_id
+            batch: DocumentBatch, dataset_final_id: str = dataset_final_id
         ):
-            def _d(row: Series):
+            def _d(row: DocumentRecord):
                 data = {
                     "id": row.id,
                     "embedding": row.embedding,
@@ -154,11 +154,11 @@ class Supabase(VectorDatabase):
 
             (
                 self.supabase.table("documents")
-                .upsert([_d(row) for _, row in batch_df.iterrows()])
+                .upsert([_d(row) for row in batch])
                 .execute()
             )
 
-        await asyncio.gather(*[_insert(batch_df) for batch_df in batches])
+        await asyncio.gather(*[_insert(batch) for batch in batches])
 
     async def delete(
         self,
@@ -171,6 +171,21 @@ class Supabase(VectorDatabase):
             req = req.eq("user_id", user_id)
         req.in_("id", ids).execute()
 
+    @staticmethod
+    def _metadata_filter(where) -> dict:
+        """
+        :return: the filter parameters of the match_documents
+            and filter_documents functions
+        """
+        node = parse_filter(where)
+        if node is None:
+            return {}
+        # the equalities are also sent as a containment, which the metadata index serves
+        return {
+            "metadata_filter": to_json(node),
+            "metadata_containment": equalities(node) or None,
+        }
+
     async def search(
         self,
         vector: List[float],
@@ -178,29 +193,18 @@ class Supabase(VectorDatabase):
         dataset_ids: List[str],
         user_id: Optional[str] = None,
         where=None,
+        min_score: Optional[float] = None,
     ):
         d = {
             "query_embedding": vector,
-            "similarity_threshold": 0.1,  # TODO: make this configurable
+            "similarity_threshold": 0.1 if min_score is None else min_score,
             "match_count": top_k,
             "query_dataset_ids": dataset_ids,
         }
         if user_id:
             d["query_user_id"] = user_id
-        query = self.supabase.rpc(
-            "match_documents",
-            d,
-        )
-
-        if where:
-            # raise if where is not a dict
-            if not isinstance(where, dict):
-                raise ValueError("currently only dict is supported for where")
-            metadata_field = list(where.keys())[0]
-            metadata_value = where[metadata_field]
-            d["metadata_field"] = metadata_field
-            d["metadata_value"] = metadata_value
-        response = query.execute().data
+        d.update(self._metadata_filter(where))
+        response = self.supabase.rpc("match_documents", d).execute().data
         return [
             SearchResponse(
                 id=row["id"],
@@ -209,6 +213,7 @@ class Supabase(VectorDatabase):
                 hash=row["hash"],
                 metadata=row["metadata"],
                 score=row["score"],
+                dataset_ids=[row["dataset_id"]] if row.get("dataset_id") else [],
             )
             for row in response
         ]
@@ -241,20 +246,29 @@ class Supabase(VectorDatabase):
         user_id: Optional[str] = None,
         offset: int = 0,
         limit: int = 100,
-    ) -> List[Document]:
+        after: Optional[Tuple[str, str]] = None,
+    ) -> List[ListResponse]:
         req = self.supabase.table("documents").select("*").eq("dataset_id", dataset_id)
         if user_id:
             req = req.eq("user_id", user_id)
-        req = req.range(offset, offset + limit)
+        if after:
+            created_date, doc_id = (json.dumps(value) for value in after)
+            # (created_date, id) > after, values quoted for postgrest
+            req = req.or_(
+                f"created_date.gt.{created_date},"
+                + f"and(created_date.eq.{created_date},id.gt.{doc_id})"
+            )
+        req = req.order("created_date").order("id").range(offset, offset + limit - 1)
         data = req.execute().data
         return [
-            Document(
+            ListResponse(
                 id=row["id"],
                 data=row["data"],
                 embedding=ast.literal_eval(row["embedding"]),
                 hash=row["hash"],
                 metadata=row["metadata"],
                 dataset_ids=[row["dataset_id"]],
+                created_date=row["created_date"],
             )
             for row in data
         ]
@@ -271,18 +285,13 @@ class Supabase(VectorDatabase):
         :param where: where condition to filter results
         :return: list of documents
         """
-        q = self.supabase.table("documents").select("*")
+        d = self._metadata_filter(where)
         # update only for this user id and dataset id if given
         if user_id:
-            q = q.eq("user_id", user_id)
+            d["query_user_id"] = user_id
         if dataset_id:
-            q = q.eq("dataset_id", dataset_id)
-        metadata_keys = list(where.keys())
-        metadata_values = list(where.values())
-        for key, value in zip(metadata_keys, metadata_values):
-            q = q.eq(f"metadata->>{key}", value)
-
-        docs = q.execute().data
+            d["query_dataset_id"] = dataset_id
+        docs = self.supabase.rpc("filter_documents", d).execute().data
         return [
             WhereResponse(
                 id=row["id"],
@@ -1,5 +1,11 @@
 from embedbase.embedding.base import Embedder
+from embedbase.embedding.batching import MicroBatchEmbedder
+from embedbase.embedding.cache import EmbeddingCache
+from embedbase.embedding.router import RoutedEmbedder
 
 __all__ = [
     "Embedder",
+    "EmbeddingCache",
+    "MicroBatchEmbedder",
+    "RoutedEmbedder",
 ]
@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import List, Union
+from typing import List, Optional, Union
+
+import asyncio
 
 
 class Embedder(ABC):
@@ -7,6 +9,16 @@ class Embedder(ABC):
     Base class for all embedders
     """
 
+    # inputs per length bucket in embed_bucketed, None to embed inputs as given
+    bucket_size: Optional[int] = None
+
+    def __init__(self, bucket_size: Optional[int] = None):
+        """
+        :param bucket_size: enable length-bucketed batching with buckets of this size
+        """
+        if bucket_size is not None:
+            self.bucket_size = bucket_size
+
     @property
     @abstractmethod
     def dimensions(self) -> int:
@@ -24,6 +36,15 @@ class Embedder(ABC):
         :return: True if text is too big, False otherwise
         """
 
+    async def are_too_big(self, texts: List[str]) -> List[bool]:
+        """
+        Check if texts are too big to be embedded, embedders can override it
+        to check a batch at once without blocking the event loop
+        :param texts: texts to check
+        :return: True for every text that is too big, False otherwise
+        """
+        return [self.is_too_big(text) for text in texts]
+
     @abstractmethod
     async def embed(self, data: Union[List[str], str]) -> List[List[float]]:
         """
@@ -31,3 +52,52 @@ class Embedder(ABC):
         :param data: list of strings or a string
         :return: list of embeddings
         """
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """
+        Estimate the number of tokens of a text without a tokenizer:
+        about 4 bytes per token for English, at least one token per word
+        """
+        return max(len(text.split()), -(-len(text.encode()) // 4))
+
+    async def count_tokens(self, texts: List[str]) -> List[int]:
+        """
+        Count the tokens of texts, embedders with a tokenizer override it,
+        the default is an estimate
+        :param texts: texts to count
+        :return: number of tokens of every text
+        """
+        return [self.estimate_tokens(text) for text in texts]
+
+    def token_length(self, text: str) -> int:
+        """
+        Estimate the length of a text in tokens, used to sort inputs in buckets
+        :param text: text to measure
+        :return: estimated number of tokens
+        """
+        return len(text)
+
+    async def embed_bucketed(self, data: List[str]) -> List[List[float]]:
+        """
+        Embed a list of strings following the batching policy: with a bucket_size,
+        inputs are sorted by length and embedded in buckets of similar lengths
+        (less padding for transformer models), the results are in input order
+        :param data: list of strings
+        :return: list of embeddings
+        """
+        if not self.bucket_size or len(data) <= self.bucket_size:
+            return await self.embed(data)
+        order = sorted(range(len(data)), key=lambda i: self.token_length(data[i]))
+        buckets = [
+            order[start : start + self.bucket_size]
+            for start in range(0, len(order), self.bucket_size)
+        ]
+        results = await asyncio.gather(
+            *[self.embed([data[i] for i in bucket]) for bucket in buckets]
+        )
+        embeddings: List[List[float]] = [[] for _ in data]
+        for bucket, bucket_embeddings in zip(buckets, results):
+            for i, embedding in zip(bucket, bucket_embeddings):
+                embeddings[i] = embedding
+        return embeddings
@@ -0,0 +1,121 @@
+from typing import Callable, List, Optional, Tuple, Union
+
+import asyncio
+
+from embedbase.embedding.base import Embedder
+
+
+class MicroBatchEmbedder(Embedder):
+    """
+    Wraps an Embedder to coalesce concurrent `embed` calls
+    (typically one query per search request) into a single upstream call.
+    Pending calls are sent together after `max_wait_ms`
+    or as soon as the batch reaches `max_batch_size` inputs or `max_batch_tokens`.
+
+    Usage:
+    ```py
+    app = get_app().use_embedder(MicroBatchEmbedder(OpenAI(key)))
+    ```
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        max_wait_ms: float = 5,
+        max_batch_size: int = 64,
+        max_batch_tokens: Optional[int] = 8_000,
+        estimate_tokens: Callable[[str], int] = lambda text: len(text) // 4 + 1,
+    ):
+        """
+        :param embedder: the embedder to send the batches to
+        :param max_wait_ms: how long a call waits for others to join its batch
+        :param max_batch_size: maximum number of inputs per batch
+        :param max_batch_tokens: maximum number of tokens per batch
+        :param estimate_tokens: token count estimate of an input, for max_batch_tokens
+        """
+        super().__init__()
+        self.embedder = embedder
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.estimate_tokens = estimate_tokens
+        self._pending: List[Tuple[List[str], asyncio.Future]] = []
+        self._pending_size = 0
+        self._pending_tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def dimensions(self) -> int:
+        return self.embedder.dimensions
+
+    def is_too_big(self, text: str) -> bool:
+        return self.embedder.is_too_big(text)
+
+    async def are_too_big(self, texts: List[str]) -> List[bool]:
+        return await self.embedder.are_too_big(texts)
+
+    async def count_tokens(self, texts: List[str]) -> List[int]:
+        return await self.embedder.count_tokens(texts)
+
+    def _is_full(self, size: int, tokens: int) -> bool:
+        return self._pending_size + size > self.max_batch_size or (
+            self.max_batch_tokens is not None
+            and self._pending_tokens + tokens > self.max_batch_tokens
+        )
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        pending = self._pending
+        self._pending = []
+        self._pending_size = 0
+        self._pending_tokens = 0
+        asyncio.ensure_future(self._send(pending))
+
+    async def _send(self, pending: List[Tuple[List[str], asyncio.Future]]) -> None:
+        try:
+            embeddings = await self.embedder.embed_bucketed(
+                [text for texts, _ in pending for text in texts]
+            )
+        except Exception as e:  # pylint: disable=broad-except
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        start = 0
+        for texts, future in pending:
+            if not future.done():
+                future.set_result(embeddings[start : start + len(texts)])
+            start += len(texts)
+
+    async def embed(self, data: Union[List[str], str]) -> List[List[float]]:
+        texts = [data] if isinstance(data, str) else list(data)
+        if not texts:
+            return []
+        tokens = sum(self.estimate_tokens(text) for text in texts)
+        # flush first so that a call never makes the batch exceed the caps,
+        # a call bigger than the caps on its own is sent alone
+        if self._pending and self._is_full(len(texts), tokens):
+            self._flush()
+
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._pending.append((texts, future))
+        self._pending_size += len(texts)
+        self._pending_tokens += tokens
+
+        if (
+            self.max_wait <= 0
+            or self._pending_size >= self.max_batch_size
+            or (
+                self.max_batch_tokens is not None
+                and self._pending_tokens >= self.max_batch_tokens
+            )
+        ):
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
@@ -0,0 +1,179 @@
+from typing import Dict, List, Optional, Sequence, Union
+
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from embedbase.embedding.base import Embedder
+from embedbase.hashing import DEFAULT_HASH_SCHEME, hash_documents
+
+# sqlite limits the number of parameters of a query
+_SQLITE_CHUNK = 500
+
+
+def _namespace(embedder: Embedder) -> str:
+    # the model of the instance, e.g. Cohere(model=...), over the class default
+    name = getattr(embedder, "model", None)
+    if not isinstance(name, str):
+        name = getattr(embedder, "EMBEDDING_MODEL", type(embedder).__name__)
+    return f"{name}:{embedder.dimensions}"
+
+
+class EmbeddingCache(Embedder):
+    """
+    Wraps an Embedder with a content-addressed cache keyed by (model, hash),
+    independent of the vector database so that embeddings survive
+    dataset deletion and query embeddings are reused.
+    A bounded in-process LRU sits in front of an optional SQLite file
+    storing the embeddings as float32 blobs.
+
+    Usage:
+    ```py
+    app = get_app().use_embedder(EmbeddingCache(OpenAI(key), path="embeddings.db"))
+    ```
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        path: Optional[str] = "embedbase_embeddings.db",
+        max_memory_items: int = 10_000,
+        model: Optional[str] = None,
+        hash_scheme: str = DEFAULT_HASH_SCHEME,
+    ):
+        """
+        :param embedder: the embedder computing the embeddings missing from the cache
+        :param path: SQLite file of the disk tier, None to only cache in memory
+        :param max_memory_items: number of embeddings kept in memory
+        :param model: cache namespace, defaults to the embedder model
+            (or class name) and dimensions
+        :param hash_scheme: one of embedbase.hashing.HASH_SCHEMES
+        """
+        super().__init__()
+        self.embedder = embedder
+        self.model = model or _namespace(embedder)
+        self.hash_scheme = hash_scheme
+        self.max_memory_items = max_memory_items
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._conn = None
+        self._lock = threading.Lock()
+        if path is not None:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            with self._lock, self._conn:
+                self._conn.execute(
+                    """
+create table if not exists embeddings (
+    model text not null,
+    hash text not null,
+    embedding blob not null,
+    primary key (model, hash)
+)"""
+                )
+
+    @property
+    def dimensions(self) -> int:
+        return self.embedder.dimensions
+
+    def is_too_big(self, text: str) -> bool:
+        return self.embedder.is_too_big(text)
+
+    async def are_too_big(self, texts: List[str]) -> List[bool]:
+        return await self.embedder.are_too_big(texts)
+
+    async def count_tokens(self, texts: List[str]) -> List[int]:
+        return await self.embedder.count_tokens(texts)
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    def stats(self) -> dict:
+        """
+        :return: hit and miss counters, counted per input
+        """
+        total = self.hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "memory_items": len(self._memory),
+        }
+
+    def _remember(self, key: str, embedding: List[float]) -> None:
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    async def _run(self, fn, *args):
+        def _locked():
+            with self._lock, self._conn:
+                return fn(*args)
+
+        return await asyncio.get_event_loop().run_in_executor(None, _locked)
+
+    def _read(self, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        found = {}
+        for i in range(0, len(hashes), _SQLITE_CHUNK):
+            chunk = hashes[i : i + _SQLITE_CHUNK]
+            rows = self._conn.execute(
+                "select hash, embedding from embeddings where model = ? and hash in "
+                f"({', '.join('?' * len(chunk))})",
+                (self.model, *chunk),
+            ).fetchall()
+            for h, blob in rows:
+                found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def _write(self, embeddings: Dict[str, List[float]]) -> None:
+        self._conn.executemany(
+            "insert or replace into embeddings(model, hash, embedding) values (?, ?, ?)",
+            [
+                (self.model, h, np.asarray(e, dtype=np.float32).tobytes())
+                for h, e in embeddings.items()
+            ],
+        )
+
+    async def embed(self, data: Union[List[str], str]) -> List[List[float]]:
+        texts = [data] if isinstance(data, str) else list(data)
+        hashes = await hash_documents(texts, self.hash_scheme)
+
+        found: Dict[str, List[float]] = {}
+        for h in hashes:
+            if h in self._memory:
+                self._memory.move_to_end(h)
+                found[h] = self._memory[h]
+        self.memory_hits += sum(1 for h in hashes if h in found)
+
+        missing = list(dict.fromkeys(h for h in hashes if h not in found))
+        if missing and self._conn is not None:
+            on_disk = await self._run(self._read, missing)
+            self.disk_hits += sum(1 for h in hashes if h in on_disk)
+            for h, e in on_disk.items():
+                self._remember(h, e)
+            found.update(on_disk)
+
+        # embed each missing content once, even if repeated in the input
+        to_embed = {}
+        for h, text in zip(hashes, texts):
+            if h not in found:
+                self.misses += 1
+                to_embed.setdefault(h, text)
+        if to_embed:
+            embeddings = await self.embedder.embed_bucketed(list(to_embed.values()))
+            computed = dict(zip(to_embed.keys(), embeddings))
+            for h, e in computed.items():
+                self._remember(h, e)
+            if self._conn is not None:
+                await self._run(self._write, computed)
+            found.update(computed)
+
+        return [found[h] for h in hashes]
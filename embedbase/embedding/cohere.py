@@ -1,36 +1,49 @@
-from typing import Any, List, Union
-from tenacity import (
-    retry,
-    stop_after_attempt,
-    wait_exponential,
-)
-
-from embedbase.embedding.base import Embedder
+from typing import List, Optional, Union
 
+import asyncio
 
-@retry(
-    wait=wait_exponential(multiplier=1, min=1, max=3),
-    stop=stop_after_attempt(3),
+from embedbase.embedding.base import Embedder
+from embedbase.embedding.throttle import (
+    RateLimiter,
+    parse_retry_after,
+    retry_async,
+    split_batches,
 )
-def embed_retry(
-    co: Any,
-    data: List[str],
-) -> List[dict]:
-    """
-    Embed a list of sentences and retry on failure
-    :param data: list of sentences to embed
-    :param provider: which provider to use
-    :return: list of embeddings
-    """
-    return co.embed(data).embeddings
 
 
 class Cohere(Embedder):
     """
     Cohere Embedder
+    Inputs are split in batches of the per-call limit sent concurrently,
+    bounded by a semaphore and requests/tokens per minute limits
     """
 
-    def __init__(self, cohere_api_key: str):
+    EMBEDDING_MODEL = "embed-english-v2.0"
+    # the embed models context, in tokens
+    EMBEDDING_CTX_LENGTH = 512
+    # texts per embed call
+    MAX_BATCH_SIZE = 96
+
+    def __init__(
+        self,
+        cohere_api_key: str,
+        model: str = EMBEDDING_MODEL,
+        dimensions: int = 4096,
+        max_concurrency: int = 8,
+        requests_per_minute: Optional[float] = 10_000,
+        tokens_per_minute: Optional[float] = None,
+        max_batch_size: int = MAX_BATCH_SIZE,
+    ):
+        """
+        :param cohere_api_key: Cohere API key
+        :param model: embed model, 4096 dimensions for embed-english-v2.0,
+            1024 for embed-english-light-v2.0 and 768 for embed-multilingual-v2.0
+        :param dimensions: dimensions of the model embeddings
+        :param max_concurrency: concurrent requests
+        :param requests_per_minute: rate limit of the API key
+        :param tokens_per_minute: rate limit of the API key, in estimated tokens
+        :param max_batch_size: texts per request
+        """
         super().__init__()
         try:
             import cohere
@@ -39,15 +52,57 @@ class Cohere(Embedder):
                 "Cohere is not installed. Install it with `pip install cohere`"
             )
 
-        self.co = cohere.Client(cohere_api_key)
-        raise NotImplementedError()
+        self._cohere = cohere
+        self.api_key = cohere_api_key
+        self.model = model
+        self._dimensions = dimensions
+        self.max_batch_size = max_batch_size
+        self.limiter = RateLimiter(
+            max_concurrency=max_concurrency,
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+        )
+        self._co = None
 
     @property
     def dimensions(self) -> int:
-        return 4096
+        return self._dimensions
 
     def is_too_big(self, text: str) -> bool:
-        raise NotImplementedError()
+        return self.estimate_tokens(text) > self.EMBEDDING_CTX_LENGTH
+
+    def _client(self):
+        # created lazily to bind to the running event loop
+        if self._co is None:
+            self._co = self._cohere.AsyncClient(self.api_key)
+        return self._co
+
+    def _should_retry(self, e: Exception) -> bool:
+        status = getattr(e, "http_status", None)
+        # client errors other than rate limiting will fail again
+        return status is None or status == 429 or status >= 500
+
+    async def _embed_batch(self, data: List[str], tokens: int) -> List[List[float]]:
+        async def _embed():
+            async with self.limiter.limit(tokens):
+                return await self._client().embed(texts=data, model=self.model)
+
+        response = await retry_async(
+            _embed,
+            should_retry=self._should_retry,
+            retry_after=lambda e: parse_retry_after(getattr(e, "headers", None)),
+        )
+        return [list(e) for e in response.embeddings]
 
     async def embed(self, data: Union[List[str], str]) -> List[List[float]]:
-        return embed_retry(self.co, data)
+        if isinstance(data, str):
+            data = [data]
+        sizes = [self.estimate_tokens(text) for text in data]
+        batches = split_batches(sizes, self.max_batch_size)
+        results = await asyncio.gather(
+            *[
+                self._embed_batch(data[start:end], sum(sizes[start:end]))
+                for start, end in batches
+            ]
+        )
+        return [embedding for result in results for embedding in result]
@@ -0,0 +1,258 @@
+from typing import List, Optional, Tuple, Union
+
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from embedbase.embedding.base import Embedder
+
+
+class _SentenceTransformerModel:
+    def __init__(self, model: str):
+        try:
+            # pylint: disable=import-outside-toplevel
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            # pylint: disable=raise-missing-from
+            raise ImportError(
+                "Please install sentence-transformers with `pip install sentence-transformers`"
+            )
+        self.model = SentenceTransformer(model)
+        self.dimensions = self.model.get_sentence_embedding_dimension()
+        self.max_seq_length = self.model.get_max_seq_length()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, batch_size=len(texts))
+
+
+class _OnnxModel:
+    """
+    Sentence embeddings (mean pooling, normalized) computed with ONNX Runtime
+    from an exported model, optionally quantized to int8 on first use
+    """
+
+    def __init__(self, model: str, onnx_path: str, quantize: bool = False):
+        try:
+            # pylint: disable=import-outside-toplevel
+            import onnxruntime
+            from transformers import AutoTokenizer
+        except ImportError:
+            # pylint: disable=raise-missing-from
+            raise ImportError(
+                "Please install onnxruntime and transformers with "
+                + "`pip install onnxruntime transformers`"
+            )
+        if quantize:
+            onnx_path = _quantize(onnx_path)
+        self.tokenizer = AutoTokenizer.from_pretrained(model)
+        options = onnxruntime.SessionOptions()
+        # the pool provides the parallelism, one intra-op thread per worker
+        options.intra_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            onnx_path, options, providers=["CPUExecutionProvider"]
+        )
+        self._inputs = {i.name for i in self.session.get_inputs()}
+        self.max_seq_length = min(self.tokenizer.model_max_length, 512)
+        self.dimensions = self.encode(["dimensions"]).shape[1]
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        inputs = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np",
+        )
+        outputs = self.session.run(
+            None, {k: v for k, v in inputs.items() if k in self._inputs}
+        )
+        mask = inputs["attention_mask"][..., None].astype(np.float32)
+        embeddings = (outputs[0] * mask).sum(axis=1) / np.clip(
+            mask.sum(axis=1), 1e-9, None
+        )
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def _quantize(onnx_path: str) -> str:
+    # pylint: disable=import-outside-toplevel
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantized_path = os.path.splitext(onnx_path)[0] + ".int8.onnx"
+    if not os.path.exists(quantized_path):
+        quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8)
+    return quantized_path
+
+
+def _load_model(model: str, onnx_path: Optional[str], quantize: bool):
+    if onnx_path:
+        return _OnnxModel(model, onnx_path, quantize)
+    return _SentenceTransformerModel(model)
+
+
+# model of the current worker process, when inference runs in a process pool
+_worker_model = None
+
+
+def _init_worker(model: str, onnx_path: Optional[str], quantize: bool) -> None:
+    global _worker_model  # pylint: disable=global-statement
+    _worker_model = _load_model(model, onnx_path, quantize)
+
+
+def _worker_info() -> Tuple[int, int]:
+    return _worker_model.dimensions, _worker_model.max_seq_length
+
+
+def _worker_encode(texts: List[str]) -> np.ndarray:
+    return _worker_model.encode(texts)
+
+
+class LocalEmbedder(Embedder):
+    """
+    Embedder running a sentence-transformers (or exported ONNX) model on the CPU,
+    off the event loop. Texts from concurrent `embed` calls go through a bounded queue
+    and are grouped in batches sorted by length to minimize padding,
+    encoded by a pool of `workers` threads or processes.
+
+    Usage:
+    ```py
+    app = get_app().use_embedder(LocalEmbedder())
+    # or with an int8 quantized ONNX export, in 2 processes
+    app = get_app().use_embedder(
+        LocalEmbedder(onnx_path="model.onnx", quantize=True, pool="process", workers=2)
+    )
+    ```
+    """
+
+    EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+    def __init__(
+        self,
+        model: str = EMBEDDING_MODEL,
+        onnx_path: Optional[str] = None,
+        quantize: bool = False,
+        pool: str = "thread",
+        workers: int = 1,
+        max_batch_size: int = 64,
+        max_queue_size: int = 1024,
+        max_wait_ms: float = 2,
+        **kwargs,
+    ):
+        """
+        :param model: sentence-transformers model name (or tokenizer of the ONNX model)
+        :param onnx_path: exported ONNX model to run with ONNX Runtime instead of PyTorch
+        :param quantize: quantize the ONNX model weights to int8
+        :param pool: run inference in a "thread" or "process" pool
+        :param workers: number of batches encoded concurrently
+        :param max_batch_size: maximum number of texts encoded at once
+        :param max_queue_size: texts waiting for a worker, embed waits when full
+        :param max_wait_ms: how long a batch waits to be filled
+        """
+        # queued texts are dispatched in order, so buckets of similar lengths
+        # make the batches encoded by the workers
+        kwargs.setdefault("bucket_size", max_batch_size)
+        super().__init__(**kwargs)
+        if pool not in ("thread", "process"):
+            raise ValueError(f"Unknown pool {pool}, pick thread or process")
+        # the ONNX model (quantized or not) computes slightly different embeddings
+        self.model = model
+        if onnx_path is not None:
+            self.model += "-onnx-int8" if quantize else "-onnx"
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.max_queue_size = max_queue_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._dispatchers: List[asyncio.Future] = []
+
+        self._model = None
+        self._executor: Executor
+        if pool == "process":
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(model, onnx_path, quantize),
+            )
+            self._dimensions, self._max_seq_length = self._executor.submit(
+                _worker_info
+            ).result()
+        else:
+            self._model = _load_model(model, onnx_path, quantize)
+            self._executor = ThreadPoolExecutor(max_workers=workers)
+            self._dimensions = self._model.dimensions
+            self._max_seq_length = self._model.max_seq_length
+
+    @property
+    def dimensions(self) -> int:
+        return self._dimensions
+
+    def is_too_big(self, text: str) -> bool:
+        return len(text) > self._max_seq_length
+
+    async def _next_batch(self) -> List[Tuple[str, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_event_loop().time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # take what is already queued, then wait for more until the deadline
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - asyncio.get_event_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_event_loop()
+        fn = _worker_encode if self._model is None else self._model.encode
+        while True:
+            batch = await self._next_batch()
+            # similar lengths in a batch means less padding
+            batch.sort(key=lambda item: len(item[0]))
+            try:
+                embeddings = await loop.run_in_executor(
+                    self._executor, fn, [text for text, _ in batch]
+                )
+            except Exception as e:  # pylint: disable=broad-except
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(np.asarray(embedding).tolist())
+
+    def _start(self) -> None:
+        # created lazily to bind to the running event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        if not self._dispatchers:
+            self._dispatchers = [
+                asyncio.ensure_future(self._dispatch()) for _ in range(self.workers)
+            ]
+
+    async def embed(self, data: Union[List[str], str]) -> List[List[float]]:
+        texts = [data] if isinstance(data, str) else list(data)
+        self._start()
+        loop = asyncio.get_event_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            # waits while the queue is full
+            await self._queue.put((text, future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def close(self) -> None:
+        """
+        Stop the dispatchers and the worker pool
+        """
+        for dispatcher in self._dispatchers:
+            dispatcher.cancel()
+        self._dispatchers = []
+        self._executor.shutdown(wait=False)
@@ -1,79 +1,174 @@
-from typing import List, Union, Optional
+from typing import Any, List, Optional, Union
 
-from tenacity import (
-    retry,
-    retry_if_not_exception_type,
-    stop_after_attempt,
-    wait_exponential,
-)
+import asyncio
 
 from embedbase.embedding.base import Embedder
-
-try:
-    import openai
-except:
-    pass
-
-
-@retry(
-    wait=wait_exponential(multiplier=1, min=1, max=3),
-    stop=stop_after_attempt(3),
-    # TODO: send pr/issue on https://github.com/openai/openai-python/blob/94428401b4f71596e4a1331102a6beee9d8f0bc4/openai/__init__.py#L25
-    # To expose openai.AuthenticationError
-    retry=retry_if_not_exception_type(openai.InvalidRequestError),
+from embedbase.embedding.throttle import (
+    RateLimiter,
+    parse_retry_after,
+    retry_async,
+    split_batches,
 )
-def embed_retry(
-    data: List[str],
-) -> List[dict]:
-    """
-    Embed a list of sentences and retry on failure
-    :param data: list of sentences to embed
-    :param provider: which provider to use
-    :return: list of embeddings
-    """
-    return [
-        e["embedding"]
-        for e in openai.Embedding.create(input=data, model="text-embedding-ada-002")[
-            "data"
-        ]
-    ]
+from embedbase.hashing import hash_document, hash_documents
+from embedbase.search_cache import LRUCache
 
 
 class OpenAI(Embedder):
     """
     OpenAI Embedder
+    Large inputs are split in sub-batches (by number of inputs and tokens)
+    sent concurrently, bounded by a semaphore and requests/tokens per minute limits
     """
 
     EMBEDDING_MODEL = "text-embedding-ada-002"
     EMBEDDING_CTX_LENGTH = 8191
     EMBEDDING_ENCODING = "cl100k_base"
+    # inputs and tokens sent in a single request
+    MAX_BATCH_SIZE = 2048
+    MAX_BATCH_TOKENS = 100_000
 
     def __init__(
-        self, openai_api_key: str, openai_organization: Optional[str] = None
+        self,
+        openai_api_key: str,
+        openai_organization: Optional[str] = None,
+        max_concurrency: int = 8,
+        requests_per_minute: Optional[float] = 3_000,
+        tokens_per_minute: Optional[float] = 1_000_000,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_batch_tokens: int = MAX_BATCH_TOKENS,
+        api_base: Optional[str] = None,
+        token_cache_size: int = 100_000,
+        encoding: Optional[Any] = None,
     ):
+        """
+        :param encoding: tiktoken encoding counting the tokens,
+            cl100k_base (downloaded on first use) by default
+        """
         super().__init__()
         try:
             import openai
-            import tiktoken
+
+            if encoding is None:
+                import tiktoken
+
+                encoding = tiktoken.get_encoding(self.EMBEDDING_ENCODING)
         except ImportError:
             raise ImportError(
                 "OpenAI is not installed. Install it with `pip install openai tiktoken`"
             )
 
-        self.encoding = tiktoken.get_encoding(self.EMBEDDING_ENCODING)
+        self._openai = openai
+        self.encoding = encoding
         openai.api_key = openai_api_key
         openai.organization = openai_organization
+        self.api_key = openai_api_key
+        self.organization = openai_organization
+        self.api_base = api_base
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        # token counts by content hash, computed once for is_too_big
+        # and reused to split the batches sent to the API
+        self.token_counts = LRUCache(token_cache_size)
+        self.limiter = RateLimiter(
+            max_concurrency=max_concurrency,
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+        )
 
     @property
     def dimensions(self) -> int:
         return 1536
 
+    def _may_be_too_big(self, text: str) -> bool:
+        # a token covers at least one byte, so a text with fewer utf-8 bytes
+        # than the context length cannot be too big (a character is at most 4 bytes)
+        if len(text) * 4 <= self.EMBEDDING_CTX_LENGTH:
+            return False
+        return len(text.encode()) > self.EMBEDDING_CTX_LENGTH
+
     def is_too_big(self, text: str) -> bool:
-        tokens = self.encoding.encode(text)
-        if len(tokens) > self.EMBEDDING_CTX_LENGTH:
-            return True
+        if not self._may_be_too_big(text):
+            return False
+        key = hash_document(text, "blake2b")
+        count = self.token_counts.get(key)
+        if count is None:
+            count = len(self.encoding.encode_ordinary(text))
+            self.token_counts.set(key, count)
+        return count > self.EMBEDDING_CTX_LENGTH
+
+    async def are_too_big(self, texts: List[str]) -> List[bool]:
+        too_big = [False] * len(texts)
+        candidates = [i for i, text in enumerate(texts) if self._may_be_too_big(text)]
+        if candidates:
+            counts = await self.count_tokens([texts[i] for i in candidates])
+            for i, count in zip(candidates, counts):
+                too_big[i] = count > self.EMBEDDING_CTX_LENGTH
+        return too_big
+
+    async def count_tokens(self, texts: List[str]) -> List[int]:
+        """
+        Count the tokens of texts, memoized by content hash,
+        the missing ones are tokenized in batch on the default thread pool
+        :param texts: texts to count
+        :return: number of tokens of every text
+        """
+        keys = await hash_documents(texts, "blake2b")
+        counts = [self.token_counts.get(key) for key in keys]
+        missing = [i for i, count in enumerate(counts) if count is None]
+        if missing:
+            encoded = await asyncio.get_event_loop().run_in_executor(
+                None, self.encoding.encode_ordinary_batch, [texts[i] for i in missing]
+            )
+            for i, tokens in zip(missing, encoded):
+                counts[i] = len(tokens)
+                self.token_counts.set(keys[i], counts[i])
+        return counts
+
+    def _should_retry(self, e: Exception) -> bool:
+        # TODO: send pr/issue on https://github.com/openai/openai-python/blob/94428401b4f71596e4a1331102a6beee9d8f0bc4/openai/__init__.py#L25
+        # To expose openai.AuthenticationError
+        return not isinstance(
+            e,
+            (
+                self._openai.error.InvalidRequestError,
+                self._openai.error.AuthenticationError,
+                self._openai.error.PermissionError,
+            ),
+        )
 
-        return False
+    async def _embed_batch(self, data: List[str], tokens: int) -> List[List[float]]:
+        async def _create():
+            async with self.limiter.limit(tokens):
+                return await self._openai.Embedding.acreate(
+                    input=data,
+                    model=self.EMBEDDING_MODEL,
+                    api_key=self.api_key,
+                    organization=self.organization,
+                    api_base=self.api_base,
+                )
+
+        response = await retry_async(
+            _create,
+            should_retry=self._should_retry,
+            retry_after=lambda e: parse_retry_after(getattr(e, "headers", None)),
+        )
+        return [
+            e["embedding"] for e in sorted(response["data"], key=lambda e: e["index"])
+        ]
 
     async def embed(self, data: Union[List[str], str]) -> List[List[float]]:
-        return embed_retry(data)
+        if isinstance(data, str):
+            data = [data]
+        # a token covers at least one utf-8 byte, the texts are only tokenized
+        # when this upper bound would split them in several requests
+        sizes = [len(text.encode()) for text in data]
+        if len(data) > 1 and sum(sizes) > self.max_batch_tokens:
+            sizes = await self.count_tokens(data)
+        batches = split_batches(sizes, self.max_batch_size, self.max_batch_tokens)
+        results = await asyncio.gather(
+            *[
+                self._embed_batch(data[start:end], sum(sizes[start:end]))
+                for start, end in batches
+            ]
+        )
+        return [embedding for result in results for embedding in result]
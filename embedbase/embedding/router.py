@@ -0,0 +1,260 @@
+from typing import Deque, Dict, List, Optional, Sequence, Tuple, Union
+
+import asyncio
+import time
+from collections import deque
+
+from embedbase.embedding.base import Embedder
+
+
+class LatencyHistogram:
+    """
+    Latency histogram with fixed buckets (in seconds),
+    quantiles and error rates are computed over the most recent samples
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf"))
+
+    def __init__(self, window: int = 1000, max_age: Optional[float] = 60.0):
+        """
+        :param window: most recent samples kept
+        :param max_age: seconds a recent sample is kept, None for no limit
+        """
+        self.counts = [0] * len(self.BUCKETS)
+        self.errors = 0
+        self.max_age = max_age
+        # (time, latency) of the recent requests, the latency is None on errors
+        self._recent: Deque[Tuple[float, Optional[float]]] = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        self._expire()
+        return len(self._recent)
+
+    def _expire(self) -> None:
+        if self.max_age is None:
+            return
+        horizon = time.monotonic() - self.max_age
+        while self._recent and self._recent[0][0] < horizon:
+            self._recent.popleft()
+
+    def observe(self, seconds: float) -> None:
+        for i, bound in enumerate(self.BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self._recent.append((time.monotonic(), seconds))
+
+    def error(self) -> None:
+        self.errors += 1
+        self._recent.append((time.monotonic(), None))
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        :param q: quantile between 0 and 1
+        :return: latency quantile of the recent samples, None without samples
+        """
+        self._expire()
+        ordered = sorted(s for _, s in self._recent if s is not None)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def error_rate(self) -> float:
+        """
+        :return: share of the recent requests that failed
+        """
+        self._expire()
+        if not self._recent:
+            return 0.0
+        return sum(s is None for _, s in self._recent) / len(self._recent)
+
+    def stats(self) -> dict:
+        return {
+            "count": sum(self.counts),
+            "errors": self.errors,
+            "error_rate": self.error_rate(),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {
+                str(bound): count for bound, count in zip(self.BUCKETS, self.counts)
+            },
+        }
+
+
+class RoutedEmbedder(Embedder):
+    """
+    Embedder routing requests over several backends of the same dimensions, by priority.
+    When a backend is slower than its usual p95 latency, a hedged request is sent
+    to the next backend and the first answer wins; on errors the next backend is tried.
+    Backends failing or much slower than the others recently are tried last
+    until their samples age out.
+
+    Usage:
+    ```py
+    app = get_app().use_embedder(RoutedEmbedder([OpenAI(key), OpenAI(other_key)]))
+    ```
+    """
+
+    def __init__(
+        self,
+        backends: Sequence[Embedder],
+        hedge_quantile: float = 0.95,
+        hedge_delay: float = 1.0,
+        min_hedge_delay: float = 0.05,
+        min_samples: int = 20,
+        names: Optional[Sequence[str]] = None,
+        max_error_rate: float = 0.5,
+        slow_factor: float = 2.0,
+        window_seconds: Optional[float] = 60.0,
+    ):
+        """
+        :param backends: embedders, by priority
+        :param hedge_quantile: latency quantile of a backend after which a hedged request is sent
+        :param hedge_delay: hedging delay (seconds) until a backend has min_samples latencies
+        :param min_hedge_delay: lower bound of the hedging delay (seconds)
+        :param min_samples: latencies recorded before using the quantile
+        :param names: names of the backends in stats, defaults to their class names
+        :param max_error_rate: recent error rate above which a backend is demoted
+        :param slow_factor: a backend is demoted when its p95 latency is this many
+            times the p95 of the fastest healthy backend
+        :param window_seconds: age of the samples used to demote backends
+        """
+        super().__init__()
+        if not backends:
+            raise ValueError("RoutedEmbedder needs at least one backend")
+        dimensions = {backend.dimensions for backend in backends}
+        if len(dimensions) > 1:
+            raise ValueError(
+                f"Backends produce embeddings of different dimensions {dimensions}"
+            )
+        self.backends = list(backends)
+        self.names = (
+            list(names)
+            if names
+            else [f"{i}:{type(backend).__name__}" for i, backend in enumerate(backends)]
+        )
+        self.hedge_quantile = hedge_quantile
+        self.hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.slow_factor = slow_factor
+        self.histograms = [
+            LatencyHistogram(max_age=window_seconds) for _ in self.backends
+        ]
+        self.hedges = 0
+        self.failovers = 0
+
+    @property
+    def dimensions(self) -> int:
+        return self.backends[0].dimensions
+
+    def is_too_big(self, text: str) -> bool:
+        # the text must fit in any backend we may fail over to
+        return any(backend.is_too_big(text) for backend in self.backends)
+
+    async def count_tokens(self, texts: List[str]) -> List[int]:
+        return await self.backends[0].count_tokens(texts)
+
+    def _delay(self, i: int) -> float:
+        histogram = self.histograms[i]
+        if len(histogram) < self.min_samples:
+            return self.hedge_delay
+        return max(self.min_hedge_delay, histogram.quantile(self.hedge_quantile))
+
+    def _failing(self, i: int) -> bool:
+        histogram = self.histograms[i]
+        return (
+            len(histogram) >= self.min_samples
+            and histogram.error_rate() > self.max_error_rate
+        )
+
+    def _order(self) -> List[int]:
+        """
+        :return: backends to try, by priority with the degraded ones last
+        """
+        healthy = [
+            i
+            for i, histogram in enumerate(self.histograms)
+            if len(histogram) >= self.min_samples and not self._failing(i)
+        ]
+        fastest = min(
+            (self.histograms[i].quantile(0.95) for i in healthy), default=None
+        )
+
+        def degraded(i: int) -> bool:
+            if self._failing(i):
+                return True
+            if fastest is None or i not in healthy:
+                return False
+            limit = self.slow_factor * max(fastest, self.min_hedge_delay)
+            return self.histograms[i].quantile(0.95) > limit
+
+        return sorted(range(len(self.backends)), key=lambda i: (degraded(i), i))
+
+    async def _timed(self, i: int, data: List[str]) -> List[List[float]]:
+        start = time.monotonic()
+        failed = False
+        try:
+            return await self.backends[i].embed_bucketed(data)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # also record the requests cancelled after losing a hedge,
+            # their latency is at least the time they ran
+            if failed:
+                self.histograms[i].error()
+            else:
+                self.histograms[i].observe(time.monotonic() - start)
+
+    async def embed(self, data: Union[List[str], str]) -> List[List[float]]:
+        texts = [data] if isinstance(data, str) else list(data)
+        candidates = self._order()
+        pending: Dict[asyncio.Future, int] = {}
+        started: List[int] = []
+        error: Optional[BaseException] = None
+
+        def start_next():
+            i = candidates.pop(0)
+            started.append(i)
+            pending[asyncio.ensure_future(self._timed(i, texts))] = i
+
+        start_next()
+        try:
+            while pending:
+                # hedge when the latest request exceeds its backend usual latency
+                timeout = self._delay(started[-1]) if candidates else None
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    self.hedges += 1
+                    start_next()
+                    continue
+                for task in done:
+                    pending.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                if not pending and candidates:
+                    self.failovers += 1
+                    start_next()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error
+
+    def stats(self) -> dict:
+        """
+        :return: latency histograms of every backend and hedging/failover counters
+        """
+        return {
+            "hedges": self.hedges,
+            "failovers": self.failovers,
+            "backends": {
+                name: histogram.stats()
+                for name, histogram in zip(self.names, self.histograms)
+            },
+        }
@@ -0,0 +1,156 @@
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple, TypeVar
+
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate_per_minute`,
+    holding at most `capacity` tokens (one minute worth by default)
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        """
+        Wait until `amount` tokens are available and take them,
+        requests bigger than the capacity only wait for a full bucket
+        :param amount: number of tokens
+        """
+        # created lazily to bind to the running event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        amount = min(amount, self.capacity)
+        # the lock makes waiters take tokens in arrival order
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+
+class RateLimiter:
+    """
+    Bounds the concurrency of the requests to a provider
+    and their rate in requests and tokens per minute
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    @asynccontextmanager
+    async def limit(self, tokens: int = 0):
+        """
+        Hold a concurrency slot and wait for the rate limits before sending a request
+        :param tokens: number of tokens sent in the request
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            if self._requests:
+                await self._requests.acquire(1)
+            if self._tokens and tokens:
+                await self._tokens.acquire(tokens)
+            yield
+
+
+async def retry_async(
+    fn: Callable[[], Awaitable[T]],
+    should_retry: Callable[[Exception], bool] = lambda _: True,
+    retry_after: Callable[[Exception], Optional[float]] = lambda _: None,
+    attempts: int = 3,
+    min_wait: float = 1,
+    max_wait: float = 3,
+) -> T:
+    """
+    Await `fn()` and retry on failure with exponential backoff and jitter,
+    without blocking the event loop
+    :param fn: coroutine function to call
+    :param should_retry: whether an exception is worth retrying
+    :param retry_after: delay requested by the provider (Retry-After), if any
+    :param attempts: maximum number of attempts
+    :param min_wait: minimum backoff in seconds
+    :param max_wait: maximum backoff in seconds
+    :return: result of fn
+    """
+    for attempt in range(attempts):
+        try:
+            return await fn()
+        except Exception as e:  # pylint: disable=broad-except
+            if attempt == attempts - 1 or not should_retry(e):
+                raise
+            delay = retry_after(e)
+            if delay is None:
+                delay = min(max_wait, min_wait * 2**attempt) * (
+                    0.5 + random.random() / 2
+                )
+            await asyncio.sleep(delay)
+    raise RuntimeError("unreachable")
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """
+    :param headers: response headers
+    :return: the Retry-After delay in seconds if given as a number
+    """
+    if not headers:
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def split_batches(
+    sizes: Sequence[int], max_count: int, max_tokens: Optional[int] = None
+) -> List[Tuple[int, int]]:
+    """
+    Greedily split consecutive inputs into batches of at most `max_count` inputs
+    and `max_tokens` tokens (an input bigger than max_tokens is sent alone)
+    :param sizes: token count of every input
+    :param max_count: maximum number of inputs per batch
+    :param max_tokens: maximum number of tokens per batch
+    :return: list of (start, end) ranges, in order
+    """
+    batches = []
+    start = 0
+    tokens = 0
+    for i, size in enumerate(sizes):
+        full = i - start >= max_count or (
+            max_tokens is not None and tokens + size > max_tokens
+        )
+        if full and i > start:
+            batches.append((start, i))
+            start = i
+            tokens = 0
+        tokens += size
+    if start < len(sizes):
+        batches.append((start, len(sizes)))
+    return batches
@@ -0,0 +1,118 @@
+from typing import Any, List, Optional, Union
+
+import base64
+from enum import Enum
+
+import numpy as np
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+# keys of the responses holding lists of documents with an embedding
+DOCUMENTS_KEYS = ("results", "similarities", "documents")
+
+
+class EmbeddingEncoding(str, Enum):
+    # json numbers
+    FLOAT = "float"
+    # little-endian floats, base64 encoded in json and raw bytes in msgpack
+    FLOAT32 = "float32"
+    FLOAT16 = "float16"
+
+
+DTYPES = {EmbeddingEncoding.FLOAT32: "<f4", EmbeddingEncoding.FLOAT16: "<f2"}
+
+
+def _msgpack():
+    try:
+        import msgpack
+
+        return msgpack
+    except ImportError:
+        return None
+
+
+def accepts_msgpack(request: Request) -> bool:
+    """
+    :return: whether the client asked for MessagePack in its Accept header
+        and msgpack is installed, responses fall back to json otherwise
+    """
+    accept = request.headers.get("accept", "")
+    return _msgpack() is not None and any(
+        media.split(";")[0].strip() in MSGPACK_MEDIA_TYPES
+        for media in accept.split(",")
+    )
+
+
+def encode_embedding(
+    embedding: Any, encoding: EmbeddingEncoding, binary: bool = False
+) -> Union[List[float], str, bytes]:
+    """
+    :param embedding: list of floats
+    :param encoding: encoding of the embedding
+    :param binary: return raw bytes rather than base64, for binary formats
+    """
+    if encoding == EmbeddingEncoding.FLOAT or embedding is None:
+        return embedding
+    raw = np.asarray(embedding, dtype=DTYPES[encoding]).tobytes()
+    return raw if binary else base64.b64encode(raw).decode()
+
+
+def decode_embedding(
+    value: Union[List[float], str, bytes], encoding: EmbeddingEncoding
+) -> np.ndarray:
+    """
+    Decode an embedding of a response, bytes are read without copy
+    """
+    if encoding == EmbeddingEncoding.FLOAT:
+        return np.asarray(value, dtype=np.float32)
+    if isinstance(value, str):
+        value = base64.b64decode(value)
+    return np.frombuffer(value, dtype=DTYPES[encoding])
+
+
+def encode_documents(
+    documents: List[dict], encoding: EmbeddingEncoding, binary: bool = False
+) -> List[dict]:
+    """
+    :return: copies of the documents with their embedding encoded
+    """
+    if encoding == EmbeddingEncoding.FLOAT:
+        return documents
+    return [
+        {**doc, "embedding": encode_embedding(doc["embedding"], encoding, binary)}
+        if "embedding" in doc
+        else doc
+        for doc in documents
+    ]
+
+
+def encoded_response(
+    request: Request,
+    content: dict,
+    encoding: Optional[EmbeddingEncoding] = None,
+    status_code: int = 200,
+) -> Response:
+    """
+    Respond in MessagePack when the client accepts it, json otherwise,
+    with the embeddings of the documents in the requested encoding,
+    float32 by default in MessagePack and json numbers in json
+    """
+    binary = accepts_msgpack(request)
+    if encoding is None:
+        encoding = EmbeddingEncoding.FLOAT32 if binary else EmbeddingEncoding.FLOAT
+    content = {
+        key: encode_documents(value, encoding, binary)
+        if key in DOCUMENTS_KEYS
+        else value
+        for key, value in content.items()
+    }
+    headers = {"X-Embedding-Encoding": encoding.value}
+    if binary:
+        return Response(
+            _msgpack().packb(content, use_bin_type=True),
+            status_code=status_code,
+            headers=headers,
+            media_type=MSGPACK_MEDIA_TYPES[0],
+        )
+    return JSONResponse(content, status_code=status_code, headers=headers)
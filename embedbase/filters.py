@@ -0,0 +1,223 @@
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+import json
+
+# comparisons are only made between values of the same json type
+COMPARISONS = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+OPERATORS = ("$eq", "$in", "$exists", *COMPARISONS)
+GROUPS = ("$and", "$or")
+
+
+class Condition(NamedTuple):
+    field: str
+    op: str
+    value: Any
+
+
+class Group(NamedTuple):
+    op: str
+    clauses: List[Union[Condition, "Group"]]
+
+
+Filter = Union[Condition, Group]
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _condition(field: str, op: str, value: Any) -> Condition:
+    if op not in OPERATORS:
+        raise ValueError(f"Unknown operator {op} on {field}, use one of {OPERATORS}")
+    if op == "$in" and not isinstance(value, list):
+        raise ValueError(f"$in on {field} expects a list")
+    if op == "$exists" and not isinstance(value, bool):
+        raise ValueError(f"$exists on {field} expects a boolean")
+    if op in COMPARISONS and not (_is_number(value) or isinstance(value, str)):
+        raise ValueError(f"{op} on {field} expects a number or a string")
+    return Condition(field, op, value)
+
+
+def _and(clauses: List[Filter]) -> Optional[Filter]:
+    # nested conjunctions are flattened
+    clauses = [
+        c
+        for clause in clauses
+        for c in (clause.clauses if clause.op == "$and" else [clause])
+    ]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else Group("$and", clauses)
+
+
+def parse_filter(where: Optional[Union[dict, List[dict]]]) -> Optional[Filter]:
+    """
+    Parse a filter on the documents metadata:
+    - {"source": "amazon"} or {"source": {"$eq": "amazon"}}
+    - {"lang": {"$in": ["en", "fr"]}}
+    - {"price": {"$gt": 10, "$lte": 100}}, also $gte and $lt
+    - {"author": {"$exists": True}}
+    - {"$or": [{"source": "amazon"}, {"stars": {"$gte": 4}}]}, also $and
+    Several fields of a dict, and the dicts of a list, must all match
+    :param where: filter
+    :return: filter tree, None when every document matches
+    :raise ValueError: the filter is malformed
+    """
+    if not where:
+        return None
+    if isinstance(where, list):
+        return _and([_parse_clause(w) for w in where])
+    if not isinstance(where, dict):
+        raise ValueError("A filter must be a dict or a list of dicts")
+    clauses: List[Filter] = []
+    for key, value in where.items():
+        if key in GROUPS:
+            if not isinstance(value, list) or not value:
+                raise ValueError(f"{key} expects a non empty list of filters")
+            clauses.append(Group(key, [_parse_clause(v) for v in value]))
+        elif key.startswith("$"):
+            raise ValueError(f"Unknown operator {key}, use one of {GROUPS}")
+        elif isinstance(value, dict) and any(k.startswith("$") for k in value):
+            clauses.extend(_condition(key, op, v) for op, v in value.items())
+        else:
+            clauses.append(Condition(key, "$eq", value))
+    return _and(clauses)
+
+
+def _parse_clause(where: Any) -> Filter:
+    if not isinstance(where, dict) or not where:
+        raise ValueError(
+            "Filters combined with $and, $or or a list must be non empty dicts"
+        )
+    return parse_filter(where)
+
+
+def equalities(node: Optional[Filter]) -> Dict[str, Any]:
+    """
+    :return: the field values that every document matching the filter has,
+        from its top level equality conditions
+    """
+    if isinstance(node, Condition):
+        return {node.field: node.value} if node.op == "$eq" else {}
+    if isinstance(node, Group) and node.op == "$and":
+        values = {}
+        for clause in node.clauses:
+            values.update(equalities(clause))
+        return values
+    return {}
+
+
+def _equals(a: Any, b: Any) -> bool:
+    # as in json, true is not 1
+    return a == b and isinstance(a, bool) == isinstance(b, bool)
+
+
+def _same_type(a: Any, b: Any) -> bool:
+    return (_is_number(a) and _is_number(b)) or (
+        isinstance(a, str) and isinstance(b, str)
+    )
+
+
+_MISSING = object()
+
+
+def compile_predicate(node: Optional[Filter]) -> Callable[[Optional[dict]], bool]:
+    """
+    Compile a filter to a function telling if a document metadata matches it
+    """
+    if node is None:
+        return lambda metadata: True
+    if isinstance(node, Group):
+        predicates = [compile_predicate(clause) for clause in node.clauses]
+        combine = all if node.op == "$and" else any
+        return lambda metadata: combine(p(metadata) for p in predicates)
+
+    field, op, operand = node
+
+    def test(value: Any) -> bool:
+        if op == "$exists":
+            return (value is not _MISSING) == operand
+        if value is _MISSING:
+            return False
+        if op == "$eq":
+            return _equals(value, operand)
+        if op == "$in":
+            return any(_equals(value, v) for v in operand)
+        if not _same_type(value, operand):
+            return False
+        if op == "$gt":
+            return value > operand
+        if op == "$gte":
+            return value >= operand
+        if op == "$lt":
+            return value < operand
+        return value <= operand
+
+    return lambda metadata: test((metadata or {}).get(field, _MISSING))
+
+
+def _is_scalar(value: Any) -> bool:
+    return value is None or isinstance(value, (str, int, float, bool))
+
+
+def compile_sql(
+    node: Optional[Filter], column: str = "metadata", prefix: str = "filter_"
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Compile a filter to a SQL condition on a json or jsonb column,
+    with psycopg named parameters. Equalities and $exists compile to
+    jsonb containment and key existence, served by a GIN index on (column::jsonb)
+    :param node: filter
+    :param column: metadata column
+    :param prefix: prefix of the parameters names
+    :return: condition and its parameters
+    """
+    params: Dict[str, Any] = {}
+    document = f"({column}::jsonb)"
+
+    def param(value: Any) -> str:
+        name = f"{prefix}{len(params)}"
+        params[name] = value
+        return f"%({name})s"
+
+    def compile_node(node: Filter) -> str:
+        if isinstance(node, Group):
+            separator = " and " if node.op == "$and" else " or "
+            return "(" + separator.join(compile_node(c) for c in node.clauses) + ")"
+        field, op, operand = node
+        if op == "$exists":
+            return f"{'' if operand else 'not '}{document} ? {param(field)}"
+        if op == "$in":
+            if not operand:
+                return "false"
+            return (
+                "("
+                + " or ".join(compile_node(Condition(field, "$eq", v)) for v in operand)
+                + ")"
+            )
+        if op == "$eq" and _is_scalar(operand):
+            return f"{document} @> {param(json.dumps({field: operand}))}::jsonb"
+        value = f"{param(json.dumps(operand))}::jsonb"
+        field_value = f"({document} -> {param(field)})"
+        if op == "$eq":
+            return f"{field_value} = {value}"
+        return (
+            f"(jsonb_typeof({field_value}) = jsonb_typeof({value})"
+            + f" and {field_value} {COMPARISONS[op]} {value})"
+        )
+
+    if node is None:
+        return "true", params
+    return compile_node(node), params
+
+
+def to_json(node: Optional[Filter]) -> Optional[dict]:
+    """
+    :return: the filter tree as json, as evaluated by the metadata_matches
+        function of the supabase migrations
+    """
+    if node is None:
+        return None
+    if isinstance(node, Group):
+        return {"op": node.op, "clauses": [to_json(c) for c in node.clauses]}
+    return {"field": node.field, "op": node.op, "value": node.value}
@@ -0,0 +1,88 @@
+from typing import Callable, Dict, List
+
+import asyncio
+import hashlib
+import os
+
+# total size in characters above which a batch is hashed on a thread pool
+# instead of the event loop (hashlib releases the GIL for large buffers)
+PARALLEL_HASH_THRESHOLD = int(os.environ.get("PARALLEL_HASH_THRESHOLD", "1000000"))
+PARALLEL_HASH_CHUNKS = int(os.environ.get("PARALLEL_HASH_CHUNKS", "8"))
+
+
+def _sha256(data: bytes) -> str:
+    # no prefix, to stay compatible with the hashes already stored
+    return hashlib.sha256(data).hexdigest()
+
+
+def _blake2b(data: bytes) -> str:
+    return "blake2b:" + hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _xxh3(data: bytes) -> str:
+    try:
+        # pylint: disable=import-outside-toplevel
+        import xxhash
+    except ImportError:
+        # pylint: disable=raise-missing-from
+        raise ImportError("Please install xxhash with `pip install xxhash`")
+    return "xxh3:" + xxhash.xxh3_128_hexdigest(data)
+
+
+# the scheme is part of the stored hash (except for sha256, the historical one)
+# so embeddings cached under a scheme are never mixed up with another one
+HASH_SCHEMES: Dict[str, Callable[[bytes], str]] = {
+    "sha256": _sha256,
+    "blake2b": _blake2b,
+    "xxh3": _xxh3,
+}
+
+DEFAULT_HASH_SCHEME = os.environ.get("HASH_SCHEME", "sha256")
+
+
+def get_hasher(scheme: str = DEFAULT_HASH_SCHEME) -> Callable[[bytes], str]:
+    if scheme not in HASH_SCHEMES:
+        raise ValueError(
+            f"Unknown hash scheme {scheme}, pick one of {', '.join(HASH_SCHEMES)}"
+        )
+    return HASH_SCHEMES[scheme]
+
+
+def hash_document(data: str, scheme: str = DEFAULT_HASH_SCHEME) -> str:
+    """
+    Hash the content of a document
+    :param data: content of the document
+    :param scheme: one of HASH_SCHEMES
+    :return: hex digest, prefixed by the scheme unless it is sha256
+    """
+    return get_hasher(scheme)(data.encode())
+
+
+def _hash_all(hasher: Callable[[bytes], str], data: List[str]) -> List[str]:
+    return [hasher(x.encode()) for x in data]
+
+
+async def hash_documents(
+    data: List[str], scheme: str = DEFAULT_HASH_SCHEME
+) -> List[str]:
+    """
+    Hash the content of a list of documents, large batches are split
+    in chunks hashed concurrently on the default thread pool
+    so that the event loop is not blocked
+    :param data: contents of the documents
+    :param scheme: one of HASH_SCHEMES
+    :return: hashes, in the same order
+    """
+    hasher = get_hasher(scheme)
+    if sum(len(x) for x in data) < PARALLEL_HASH_THRESHOLD:
+        return _hash_all(hasher, data)
+
+    loop = asyncio.get_event_loop()
+    chunk_size = -(-len(data) // PARALLEL_HASH_CHUNKS)
+    chunks = await asyncio.gather(
+        *[
+            loop.run_in_executor(None, _hash_all, hasher, data[i : i + chunk_size])
+            for i in range(0, len(data), chunk_size)
+        ]
+    )
+    return [h for chunk in chunks for h in chunk]
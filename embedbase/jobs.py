@@ -0,0 +1,284 @@
+from typing import List, Optional, Tuple
+
+import asyncio
+import datetime
+import json
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from enum import Enum
+
+from pydantic import BaseModel
+
+
+class JobKind(str, Enum):
+    ADD = "add"
+    UPDATE = "update"
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+FINISHED = (JobStatus.SUCCEEDED, JobStatus.FAILED)
+
+
+class Job(BaseModel):
+    id: str
+    kind: JobKind
+    dataset_id: str
+    user_id: Optional[str] = None
+    status: JobStatus = JobStatus.QUEUED
+    total: int = 0
+    processed: int = 0
+    ids: List[str] = []
+    error: Optional[str] = None
+    created: int
+    updated: int
+
+    @classmethod
+    def new(
+        cls, kind: JobKind, dataset_id: str, user_id: Optional[str], total: int
+    ) -> "Job":
+        now = int(datetime.datetime.now().timestamp())
+        return cls(
+            id=uuid.uuid4().hex,
+            kind=kind,
+            dataset_id=dataset_id,
+            user_id=user_id,
+            total=total,
+            created=now,
+            updated=now,
+        )
+
+    def touch(self) -> "Job":
+        self.updated = int(datetime.datetime.now().timestamp())
+        return self
+
+
+class JobQueue(ABC):
+    """
+    Base class for the queues holding background ingestion jobs
+    """
+
+    @abstractmethod
+    async def put(self, job: Job, payload: dict) -> None:
+        """
+        Enqueue a job with its request payload
+        :param job: job to enqueue
+        :param payload: request body of the job
+        :raises asyncio.QueueFull: if the queue is full
+        """
+
+    @abstractmethod
+    async def get(self) -> Tuple[Job, dict]:
+        """
+        Wait for the next queued job and mark it as running
+        :return: job and its request payload
+        """
+
+    @abstractmethod
+    async def save(self, job: Job) -> None:
+        """
+        Persist the status and progress of a job
+        :param job: job to save
+        """
+
+    @abstractmethod
+    async def fetch(self, job_id: str) -> Optional[Job]:
+        """
+        :param job_id: job id
+        :return: the job or None if it does not exist
+        """
+
+
+class MemoryJobQueue(JobQueue):
+    """
+    In-process bounded job queue, jobs are lost on restart
+    """
+
+    def __init__(self, maxsize: int = 100, retention: int = 1000):
+        """
+        :param maxsize: most queued jobs
+        :param retention: most finished jobs kept for polling, the oldest are forgotten
+        """
+        self._maxsize = maxsize
+        self._retention = retention
+        self._queue: Optional[asyncio.Queue] = None
+        self._jobs = {}
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+
+    def _get_queue(self) -> asyncio.Queue:
+        # created lazily to bind to the running event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self._maxsize)
+        return self._queue
+
+    async def put(self, job: Job, payload: dict) -> None:
+        self._get_queue().put_nowait((job.id, payload))
+        self._jobs[job.id] = job
+
+    async def get(self) -> Tuple[Job, dict]:
+        job_id, payload = await self._get_queue().get()
+        job = self._jobs[job_id]
+        job.status = JobStatus.RUNNING
+        return job.touch(), payload
+
+    async def save(self, job: Job) -> None:
+        self._jobs[job.id] = job.touch()
+        if job.status in FINISHED:
+            self._finished[job.id] = None
+            while len(self._finished) > self._retention:
+                job_id, _ = self._finished.popitem(last=False)
+                self._jobs.pop(job_id, None)
+
+    async def fetch(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    Bounded job queue persisted in a SQLite file so that jobs survive restarts,
+    jobs that were running when the process stopped are queued again
+    and resume after the documents they already processed
+    """
+
+    def __init__(
+        self,
+        path: str = "embedbase_jobs.db",
+        maxsize: int = 100,
+        poll_interval=1.0,
+        retention: int = 1000,
+    ):
+        """
+        :param path: SQLite file
+        :param maxsize: most queued jobs
+        :param poll_interval: seconds between checks for jobs queued by other processes
+        :param retention: most finished jobs kept for polling, the oldest are deleted
+        """
+        self._maxsize = maxsize
+        self._retention = retention
+        self._poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+create table if not exists jobs (
+    id text primary key,
+    status text not null,
+    job text not null,
+    payload text,
+    created integer not null
+)"""
+            )
+            self._conn.execute(
+                "update jobs set status = ? where status = ?",
+                (JobStatus.QUEUED.value, JobStatus.RUNNING.value),
+            )
+        self._new_job: Optional[asyncio.Event] = None
+
+    async def _run(self, fn, *args):
+        def _locked():
+            with self._lock, self._conn:
+                return fn(*args)
+
+        return await asyncio.get_event_loop().run_in_executor(None, _locked)
+
+    def _event(self) -> asyncio.Event:
+        if self._new_job is None:
+            self._new_job = asyncio.Event()
+        return self._new_job
+
+    async def put(self, job: Job, payload: dict) -> None:
+        def _put():
+            (queued,) = self._conn.execute(
+                "select count(*) from jobs where status = ?",
+                (JobStatus.QUEUED.value,),
+            ).fetchone()
+            if queued >= self._maxsize:
+                raise asyncio.QueueFull()
+            self._conn.execute(
+                "insert into jobs(id, status, job, payload, created) values (?, ?, ?, ?, ?)",
+                (
+                    job.id,
+                    job.status.value,
+                    job.json(),
+                    json.dumps(payload),
+                    job.created,
+                ),
+            )
+
+        await self._run(_put)
+        self._event().set()
+
+    async def get(self) -> Tuple[Job, dict]:
+        def _claim():
+            row = self._conn.execute(
+                "select id, job, payload from jobs where status = ? order by created limit 1",
+                (JobStatus.QUEUED.value,),
+            ).fetchone()
+            if row is None:
+                return None
+            job = Job.parse_raw(row[1])
+            job.status = JobStatus.RUNNING
+            job.touch()
+            self._conn.execute(
+                "update jobs set status = ?, job = ? where id = ?",
+                (job.status.value, job.json(), job.id),
+            )
+            return job, json.loads(row[2])
+
+        while True:
+            claimed = await self._run(_claim)
+            if claimed is not None:
+                return claimed
+            event = self._event()
+            event.clear()
+            try:
+                await asyncio.wait_for(event.wait(), self._poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def save(self, job: Job) -> None:
+        job.touch()
+        finished = job.status in FINISHED
+        q = "update jobs set status = ?, job = ? where id = ?"
+        if finished:
+            # the request payload is not needed anymore
+            q = "update jobs set status = ?, job = ?, payload = null where id = ?"
+
+        def _save():
+            self._conn.execute(q, (job.status.value, job.json(), job.id))
+            if finished:
+                self._prune()
+
+        await self._run(_save)
+
+    def _prune(self) -> None:
+        statuses = tuple(status.value for status in FINISHED)
+        self._conn.execute(
+            """
+delete from jobs where status in (?, ?) and id not in (
+    select id from jobs where status in (?, ?) order by created desc, rowid desc limit ?
+)""",
+            (*statuses, *statuses, self._retention),
+        )
+
+    async def fetch(self, job_id: str) -> Optional[Job]:
+        row = await self._run(
+            lambda: self._conn.execute(
+                "select status, job from jobs where id = ?", (job_id,)
+            ).fetchone()
+        )
+        if row is None:
+            return None
+        job = Job.parse_raw(row[1])
+        # the status column is the source of truth (reset on restart)
+        job.status = JobStatus(row[0])
+        return job
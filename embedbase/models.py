@@ -1,6 +1,10 @@
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 
-from pydantic import BaseModel, validator
+from enum import Enum
+
+from pydantic import BaseModel, Field, root_validator, validator
+
+from embedbase.filters import parse_filter
 
 
 class Document(BaseModel):
@@ -26,9 +30,23 @@ class AddDocument(BaseModel):
         return v
 
 
+class ReturnMode(str, Enum):
+    # only the number of documents
+    MINIMAL = "minimal"
+    # ids and hashes of the documents
+    IDS = "ids"
+    # documents with their data, metadata and embedding
+    FULL = "full"
+
+
 class AddRequest(BaseModel):
     documents: List[AddDocument]
     store_data: bool = True
+    # documents sent back in the response, "return" in json
+    return_mode: ReturnMode = Field(ReturnMode.FULL, alias="return")
+
+    class Config:
+        allow_population_by_field_name = True
 
 
 class UpdateDocument(BaseModel):
@@ -39,6 +57,11 @@ class UpdateDocument(BaseModel):
 
 class UpdateRequest(BaseModel):
     documents: List[UpdateDocument]
+    # documents sent back in the response, "return" in json
+    return_mode: ReturnMode = Field(ReturnMode.FULL, alias="return")
+
+    class Config:
+        allow_population_by_field_name = True
 
 
 class DeleteRequest(BaseModel):
@@ -48,8 +71,68 @@ class DeleteRequest(BaseModel):
 class SearchRequest(BaseModel):
     query: str
     top_k: int = 6
-    # todo add validation on metdata (create Metdata class as in sdk-py)
+    # filter on the metadata, see embedbase.filters.parse_filter
     where: Optional[Union[dict, List[dict]]] = None
+    # weights of the vector and keyword (BM25) rankings, fused with reciprocal rank fusion
+    # a vector_weight of 0 runs a keyword only search, without embedding the query
+    vector_weight: float = 1.0
+    lexical_weight: float = 0.0
+    # re-rank with maximal marginal relevance: pick a diverse top_k
+    # among fetch_k candidates (4 * top_k by default), mmr_lambda trading
+    # relevance (1) for diversity (0)
+    mmr: bool = False
+    fetch_k: Optional[int] = None
+    mmr_lambda: float = 0.5
+    # minimum cosine similarity of the vector matches, applied by the database
+    # (keyword matches are not thresholded)
+    min_score: Optional[float] = None
+
+    @validator("where")
+    def where_must_be_a_valid_filter(cls, v):
+        parse_filter(v)
+        return v
+
+    @validator("vector_weight", "lexical_weight")
+    def weights_must_be_positive(cls, v):
+        assert v >= 0, "weights must be positive"
+        return v
+
+    @validator("mmr_lambda")
+    def mmr_lambda_must_be_between_0_and_1(cls, v):
+        assert 0 <= v <= 1, "mmr_lambda must be between 0 and 1"
+        return v
+
+    @root_validator(skip_on_failure=True)
+    def a_ranking_must_be_used(cls, values):
+        assert (
+            values["vector_weight"] > 0 or values["lexical_weight"] > 0
+        ), "vector_weight or lexical_weight must be positive"
+        return values
+
+
+class FederatedSearchRequest(SearchRequest):
+    dataset_ids: List[str]
+    # scores of a dataset results are multiplied by its weight (1 by default)
+    weights: Optional[Dict[str, float]] = None
+    # maximum number of results from a dataset
+    quotas: Optional[Dict[str, int]] = None
+
+    @validator("dataset_ids")
+    def dataset_ids_must_not_be_empty(cls, v):
+        assert v, "dataset_ids must not be empty"
+        return v
+
+
+class ContextRequest(SearchRequest):
+    # token budget of the context, counted with the embedder tokenizer
+    max_tokens: int
+    # joins the documents, its tokens count in the budget
+    separator: str = "\n\n"
+
+    @validator("max_tokens")
+    def max_tokens_must_be_positive(cls, v):
+        assert v > 0, "max_tokens must be positive"
+        return v
 
 
 class ReplaceDocument(BaseModel):
@@ -59,5 +142,10 @@ class ReplaceDocument(BaseModel):
 
 class ReplaceRequest(BaseModel):
     documents: List[ReplaceDocument]
-    # todo add validation on metdata (create Metdata class as in sdk-py)
+    # filter on the metadata, see embedbase.filters.parse_filter
     where: Optional[Union[dict, List[dict]]] = None
+
+    @validator("where")
+    def where_must_be_a_valid_filter(cls, v):
+        parse_filter(v)
+        return v
@@ -0,0 +1,155 @@
+from typing import List, Optional, Sequence, Union
+
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+Vectors = Union[np.ndarray, Sequence[Sequence[float]]]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+
+class Projection(ABC):
+    """
+    Reduces the dimensions of the embeddings before they are stored and searched,
+    the vector database must be created with `projection.dimensions`
+    """
+
+    kind: str
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+
+    @abstractmethod
+    def _transform(self, vectors: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def transform(self, vectors: Vectors) -> np.ndarray:
+        """
+        Project and normalize embeddings
+        :param vectors: embeddings of the embedder dimensions
+        :return: unit vectors of `dimensions` dimensions
+        """
+        return _normalize(self._transform(np.asarray(vectors, dtype=np.float32)))
+
+    def transform_list(self, vectors: Vectors) -> List[List[float]]:
+        return self.transform(vectors).tolist()
+
+    def recall(self, vectors: Vectors, k: int = 10, queries: int = 100) -> float:
+        """
+        Measure the quality loss of the projection: the fraction of the k nearest
+        neighbours (cosine) in the original space that are still found
+        in the projected space, averaged over `queries` sample vectors
+        :param vectors: sample of embeddings of the embedder dimensions
+        :param k: number of neighbours
+        :param queries: number of sample vectors used as queries
+        :return: recall@k between 0 and 1
+        """
+        original = _normalize(np.asarray(vectors, dtype=np.float32))
+        projected = self.transform(original)
+        k = min(k, len(original) - 1)
+        if k <= 0:
+            return 1.0
+        found = 0
+        for i in range(min(queries, len(original))):
+            # the query itself is excluded from its neighbours
+            expected = np.argsort(-(original @ original[i]))[1 : k + 1]
+            actual = np.argsort(-(projected @ projected[i]))[1 : k + 1]
+            found += len(np.intersect1d(expected, actual))
+        return found / (k * min(queries, len(original)))
+
+    def save(self, path: str) -> None:
+        """
+        Store the projection in a .npz file, to be loaded with `load_projection`
+        """
+        np.savez(path, kind=self.kind, **self._arrays())
+
+    def _arrays(self) -> dict:
+        return {"dimensions": self.dimensions}
+
+
+class Truncation(Projection):
+    """
+    Keep the first dimensions, for Matryoshka embedding models
+    trained to keep most of the information in the leading dimensions
+    """
+
+    kind = "truncation"
+
+    def _transform(self, vectors: np.ndarray) -> np.ndarray:
+        return vectors[:, : self.dimensions]
+
+
+class PCA(Projection):
+    """
+    Project on the principal components of a sample of embeddings,
+    the embeddings are not centered so that the projection preserves
+    the dot products (and cosine similarities) in the span of the components
+    """
+
+    kind = "pca"
+
+    def __init__(self, components: np.ndarray):
+        super().__init__(components.shape[0])
+        self.components = components.astype(np.float32)
+
+    @classmethod
+    def fit(cls, vectors: Vectors, dimensions: int) -> "PCA":
+        """
+        :param vectors: sample of embeddings, at least `dimensions` of them
+        :param dimensions: number of dimensions to keep
+        """
+        x = np.asarray(vectors, dtype=np.float32)
+        if len(x) < dimensions:
+            raise ValueError(
+                f"Fitting {dimensions} components needs at least {dimensions} vectors,"
+                + f" got {len(x)}"
+            )
+        _, _, vt = np.linalg.svd(x, full_matrices=False)
+        return cls(vt[:dimensions])
+
+    def _transform(self, vectors: np.ndarray) -> np.ndarray:
+        return vectors @ self.components.T
+
+    def _arrays(self) -> dict:
+        return {"components": self.components}
+
+
+def load_projection(path: str) -> Projection:
+    """
+    Load a projection stored with `Projection.save`
+    """
+    with np.load(path) as f:
+        kind = str(f["kind"])
+        if kind == PCA.kind:
+            return PCA(f["components"])
+        if kind == Truncation.kind:
+            return Truncation(int(f["dimensions"]))
+    raise ValueError(f"Unknown projection {kind}")
+
+
+def fit_projection(
+    vectors: Vectors,
+    dimensions: int,
+    method: str = "pca",
+    path: Optional[str] = None,
+) -> Projection:
+    """
+    Create a projection to `dimensions` dimensions, store it in `path` if given
+    :param vectors: sample of embeddings (ignored by truncation)
+    :param dimensions: number of dimensions to keep
+    :param method: "pca" or "truncation"
+    :param path: .npz file to store the projection in
+    """
+    if method == PCA.kind:
+        projection: Projection = PCA.fit(vectors, dimensions)
+    elif method == Truncation.kind:
+        projection = Truncation(dimensions)
+    else:
+        raise ValueError(f"Unknown projection {method}, pick pca or truncation")
+    if path:
+        projection.save(path)
+    return projection
@@ -0,0 +1,139 @@
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import json
+import time
+from collections import OrderedDict
+
+from embedbase.hashing import hash_document
+
+
+class LRUCache:
+    """
+    Size-bounded mapping evicting the least recently used entries,
+    and optionally the entries older than ttl seconds, counting hits and misses
+    """
+
+    def __init__(self, maxsize: int = 1000, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # values with the time they expire at
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if key not in self._data:
+            self.misses += 1
+            return None
+        value, expires = self._data[key]
+        if expires < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else float("inf")
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio,
+        }
+
+
+class SearchCache:
+    """
+    Two level cache for semantic search: query text to embedding,
+    and search parameters to results.
+    Results are keyed by the dataset version, bumped on every write
+    handled by this process, so stale entries are never read again
+    and age out of the LRU. Writes made by other processes or straight
+    to the database are not seen: with several instances, results can be
+    stale for up to results_ttl seconds, or leave the results level disabled
+    """
+
+    def __init__(
+        self,
+        embeddings_size: int = 1000,
+        results_size: int = 0,
+        results_ttl: Optional[float] = 60,
+    ):
+        """
+        :param embeddings_size: most query embeddings kept
+        :param results_size: most search results kept, 0 disables the results level
+        :param results_ttl: seconds the search results are kept, None for no limit
+        """
+        self.embeddings = LRUCache(embeddings_size)
+        self.results = LRUCache(results_size, results_ttl)
+        self._versions: Dict[str, int] = {}
+
+    def version(self, dataset_id: str) -> int:
+        return self._versions.get(dataset_id, 0)
+
+    def bump(self, dataset_id: str) -> None:
+        """
+        Invalidate the cached results of a dataset, to call after writing to it
+        :param dataset_id: dataset written to
+        """
+        self._versions[dataset_id] = self.version(dataset_id) + 1
+
+    def clear(self) -> None:
+        self.embeddings.clear()
+        self.results.clear()
+
+    @staticmethod
+    def query_key(query: str) -> str:
+        return hash_document(query or "", "blake2b")
+
+    def results_key(
+        self,
+        dataset_id: str,
+        user_id: Optional[str],
+        where: Optional[Any],
+        top_k: int,
+        query: str,
+        *options: Hashable,
+    ) -> tuple:
+        """
+        :param options: other search parameters changing the results
+        :return: key of the results of a search, including the current dataset version
+        """
+        return (
+            dataset_id,
+            self.version(dataset_id),
+            user_id,
+            json.dumps(where, sort_keys=True, default=str),
+            top_k,
+            self.query_key(query),
+            *options,
+        )
+
+    def stats(self) -> dict:
+        return {
+            "embeddings": self.embeddings.stats(),
+            "results": self.results.stats(),
+        }
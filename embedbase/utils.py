@@ -1,5 +1,8 @@
-from typing import Iterator
+from typing import Any, AsyncIterator, Awaitable, Iterator, List, Optional, Tuple
 from fastapi import Request
+import asyncio
+import base64
+import json
 import numpy as np
 import pandas as pd
 from pandas import DataFrame
@@ -61,6 +64,125 @@ def batched(iterable, n):
         yield batch
 
 
+def maximal_marginal_relevance(
+    query_embedding: List[float],
+    embeddings: List[List[float]],
+    top_k: int,
+    lambda_mult: float = 0.5,
+) -> List[int]:
+    """
+    Select a relevant and diverse subset of embeddings: each pick maximizes
+    lambda_mult * similarity to the query - (1 - lambda_mult) * max similarity
+    to the embeddings already picked (cosine similarities)
+    :param query_embedding: embedding of the query
+    :param embeddings: candidates embeddings
+    :param top_k: number of embeddings to select
+    :param lambda_mult: 1 for relevance only, 0 for diversity only
+    :return: indexes of the selected embeddings, in selection order
+    """
+    if not embeddings or top_k <= 0:
+        return []
+    x = np.asarray(embeddings, dtype=np.float32)
+    x = x / np.clip(np.linalg.norm(x, axis=1, keepdims=True), 1e-12, None)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    relevance = x @ query
+    similarity = x @ x.T
+
+    selected = [int(np.argmax(relevance))]
+    # similarity of every candidate to its closest selected embedding
+    redundancy = similarity[selected[0]].copy()
+    while len(selected) < min(top_k, len(x)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        i = int(np.argmax(scores))
+        selected.append(i)
+        redundancy = np.maximum(redundancy, similarity[i])
+    return selected
+
+
+async def read_ndjson(
+    req: Request, max_line_size: Optional[int] = None
+) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """
+    Incrementally read a newline-delimited body from the request stream
+    yielding (line number, line) for every non-empty line
+    :param max_line_size: longest line kept in memory, in bytes,
+        longer lines are dropped and yielded as (line number, None)
+    """
+    buffer = b""
+    line_number = 0
+    # inside a line that was dropped for being too long
+    dropping = False
+    async for chunk in req.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if dropping or (max_line_size is not None and len(line) > max_line_size):
+                dropping = False
+                yield line_number, None
+            elif line.strip():
+                yield line_number, line
+        if max_line_size is not None and len(buffer) > max_line_size:
+            dropping = True
+            buffer = b""
+    if dropping:
+        yield line_number + 1, None
+    elif buffer.strip():
+        yield line_number + 1, buffer
+
+
+async def gather_or_cancel(*aws: Awaitable) -> List[Any]:
+    """
+    Like asyncio.gather but the first error cancels the awaitables
+    still running before it is raised
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        if tasks:
+            done, pending = await asyncio.wait(
+                tasks, return_when=asyncio.FIRST_EXCEPTION
+            )
+            for task in pending:
+                task.cancel()
+            for task in tasks:
+                if task in done and task.exception() is not None:
+                    raise task.exception()
+        return [task.result() for task in tasks]
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    finally:
+        # wait for the cancelled tasks to unwind
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def encode_cursor(created_date: str, doc_id: str) -> str:
+    """
+    Opaque pagination cursor pointing after a document
+    """
+    return base64.urlsafe_b64encode(
+        json.dumps([created_date, doc_id]).encode()
+    ).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    :return: (created_date, id) of the document the cursor points after
+    :raise ValueError: the cursor is invalid
+    """
+    try:
+        created_date, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        # pylint: disable=raise-missing-from
+        raise ValueError("Invalid cursor")
+    if not isinstance(created_date, str) or not isinstance(doc_id, str):
+        raise ValueError("Invalid cursor")
+    return created_date, doc_id
+
+
 def get_user_id(req: Request) -> str:
     return req.scope.get("uid")
 
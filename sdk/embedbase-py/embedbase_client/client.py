@@ -19,6 +19,18 @@ from embedbase_client.model import (
 from embedbase_client.split import merge_and_return_tokens, split_text
 from embedbase_client.utils import sync_stream
 
+# where operators, by their name in the api filters
+OPERATORS = {
+    "==": "$eq",
+    "=": "$eq",
+    ">": "$gt",
+    ">=": "$gte",
+    "<": "$lt",
+    "<=": "$lte",
+    "in": "$in",
+    "exists": "$exists",
+}
+
 
 class SyncSearchBuilder:
     def __init__(
@@ -87,9 +99,19 @@ class SyncSearchBuilder:
         ]
 
     def where(self, field: str, operator: str, value: Any) -> "SyncSearchBuilder":
-        # self.options["where"] = {field: {operator: value}}
-        self.options["where"] = {}
-        self.options["where"][field] = value
+        """
+        Filter the results on their metadata, conditions of several calls must all match.
+
+        Args:
+            field: The metadata field.
+            operator: One of ==, >, >=, <, <=, in, exists (or $eq, $gt, $gte, $lt, $lte, $in, $exists).
+            value: The value compared to the field, a list for in and a boolean for exists.
+
+        Example usage:
+            results = embedbase.search("my_dataset", "What is Python?").where("stars", ">=", 4).get()
+        """
+        operator = OPERATORS.get(operator, operator)
+        self.options.setdefault("where", {}).setdefault(field, {})[operator] = value
         return self
 
 
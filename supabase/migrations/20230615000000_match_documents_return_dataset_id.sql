@@ -0,0 +1,42 @@
+-- return the dataset of every match, to merge searches across datasets
+drop function if exists match_documents(vector, float, int, text[], text, text, text);
+
+create or replace function match_documents (
+  query_embedding vector(1536),
+  similarity_threshold float,
+  match_count int,
+  query_dataset_ids text[],
+  query_user_id text default null,
+  metadata_field text default null,
+  metadata_value text default null
+)
+returns table (
+  id text,
+  data text,
+  score float,
+  hash text,
+  embedding vector(1536),
+  metadata json,
+  dataset_id text
+)
+language plpgsql
+as $$
+begin
+  return query
+  select
+    documents.id,
+    documents.data,
+    (1 - (documents.embedding <=> query_embedding)) as similarity,
+    documents.hash,
+    documents.embedding,
+    documents.metadata,
+    documents.dataset_id
+  from documents
+  where 1 - (documents.embedding <=> query_embedding) > similarity_threshold
+    and documents.dataset_id = any(query_dataset_ids)
+    and (query_user_id is null or query_user_id = documents.user_id or documents.public is true)
+    and (metadata_field is null or documents.metadata->>metadata_field = metadata_value) -- filter by metadata
+  order by documents.embedding <=> query_embedding
+  limit match_count;
+end;
+$$;
@@ -0,0 +1,116 @@
+-- filter documents on their metadata with the filter trees of embedbase.filters
+-- ({"field", "op", "value"} conditions and {"op": "$and" | "$or", "clauses"} groups)
+create or replace function metadata_matches(metadata jsonb, filter jsonb)
+returns boolean
+language plpgsql
+immutable
+as $$
+declare
+  clause jsonb;
+  value jsonb;
+  operand jsonb := filter->'value';
+  op text := filter->>'op';
+begin
+  if op = '$and' then
+    for clause in select jsonb_array_elements(filter->'clauses') loop
+      if not metadata_matches(metadata, clause) then
+        return false;
+      end if;
+    end loop;
+    return true;
+  elsif op = '$or' then
+    for clause in select jsonb_array_elements(filter->'clauses') loop
+      if metadata_matches(metadata, clause) then
+        return true;
+      end if;
+    end loop;
+    return false;
+  end if;
+
+  value := metadata -> (filter->>'field');
+  if op = '$exists' then
+    return (value is not null) = (operand::text)::boolean;
+  elsif value is null then
+    return false;
+  elsif op = '$eq' then
+    return value = operand;
+  elsif op = '$in' then
+    return exists (select 1 from jsonb_array_elements(operand) e where e = value);
+  -- comparisons are only made between values of the same json type
+  elsif jsonb_typeof(value) <> jsonb_typeof(operand) then
+    return false;
+  elsif op = '$gt' then
+    return value > operand;
+  elsif op = '$gte' then
+    return value >= operand;
+  elsif op = '$lt' then
+    return value < operand;
+  elsif op = '$lte' then
+    return value <= operand;
+  end if;
+  return false;
+end;
+$$;
+
+-- serves metadata_containment, the equalities every match must have
+create index if not exists documents_metadata_idx on documents using gin ((metadata::jsonb));
+
+drop function if exists match_documents(vector, float, int, text[], text, text, text);
+
+create or replace function match_documents (
+  query_embedding vector(1536),
+  similarity_threshold float,
+  match_count int,
+  query_dataset_ids text[],
+  query_user_id text default null,
+  metadata_filter jsonb default null,
+  metadata_containment jsonb default null
+)
+returns table (
+  id text,
+  data text,
+  score float,
+  hash text,
+  embedding vector(1536),
+  metadata json,
+  dataset_id text
+)
+language plpgsql
+as $$
+begin
+  return query
+  select
+    documents.id,
+    documents.data,
+    (1 - (documents.embedding <=> query_embedding)) as similarity,
+    documents.hash,
+    documents.embedding,
+    documents.metadata,
+    documents.dataset_id
+  from documents
+  where 1 - (documents.embedding <=> query_embedding) >= similarity_threshold
+    and documents.dataset_id = any(query_dataset_ids)
+    and (query_user_id is null or query_user_id = documents.user_id or documents.public is true)
+    and (metadata_containment is null or documents.metadata::jsonb @> metadata_containment)
+    and (metadata_filter is null or metadata_matches(documents.metadata::jsonb, metadata_filter))
+  order by documents.embedding <=> query_embedding
+  limit match_count;
+end;
+$$;
+
+create or replace function filter_documents (
+  query_dataset_id text default null,
+  query_user_id text default null,
+  metadata_filter jsonb default null,
+  metadata_containment jsonb default null
+)
+returns setof documents
+language sql
+as $$
+  select *
+  from documents
+  where (query_dataset_id is null or documents.dataset_id = query_dataset_id)
+    and (query_user_id is null or documents.user_id = query_user_id)
+    and (metadata_containment is null or documents.metadata::jsonb @> metadata_containment)
+    and (metadata_filter is null or metadata_matches(documents.metadata::jsonb, metadata_filter));
+$$;
@@ -0,0 +1,2 @@
+-- keyset pagination of the documents of a dataset, by (created_date, id)
+create index if not exists documents_dataset_created_idx on documents (dataset_id, created_date, id);
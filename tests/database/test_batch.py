@@ -0,0 +1,68 @@
+"""
+Tests of the columnar DocumentBatch passed to the databases.
+"""
+import hashlib
+import uuid
+
+import pandas as pd
+import pytest
+
+from embedbase.database.batch import DocumentBatch, as_batch
+from embedbase.database.memory_db import MemoryDatabase
+
+unit_testing_dataset = "unit_test_batch"
+
+d = [
+    "Bob is a human",
+    "The quick brown fox jumps over the lazy dog",
+    "The lion is the king of the savannah",
+]
+
+
+def make_batch() -> DocumentBatch:
+    return DocumentBatch(
+        ids=[str(uuid.uuid4()) for _ in d],
+        data=d,
+        embeddings=[[float(i)] * 4 for i in range(len(d))],
+        hashes=[hashlib.sha256(x.encode()).hexdigest() for x in d],
+        metadata=[{"i": i} for i in range(len(d))],
+    )
+
+
+def test_dataframe_round_trip():
+    batch = make_batch()
+    df = batch.to_dataframe()
+    assert list(df.columns) == ["id", "data", "embedding", "hash", "metadata"]
+    assert df.to_dict(orient="records") == batch.to_records()
+    assert as_batch(df).to_records() == batch.to_records()
+    assert as_batch(batch) is batch
+
+
+def test_missing_dataframe_columns_are_none():
+    batch = as_batch(pd.DataFrame({"data": d}))
+    assert len(batch) == 3
+    assert batch.ids == [None] * 3
+    assert batch.data == d
+
+
+def test_columns_must_have_the_same_length():
+    with pytest.raises(ValueError):
+        DocumentBatch(ids=["a"], data=["a", "b"])
+
+
+def test_take_and_split():
+    batch = make_batch()
+    taken = batch.take([2, 0])
+    assert taken.data == [d[2], d[0]]
+    assert [len(b) for b in batch.split(2)] == [2, 1]
+    assert [row.data for row in batch] == d
+
+
+@pytest.mark.asyncio
+async def test_memory_db_accepts_batch_and_dataframe():
+    batch = make_batch()
+    for documents in [batch, batch.to_dataframe()]:
+        db = MemoryDatabase(dimensions=4)
+        await db.update(documents, unit_testing_dataset)
+        results = await db.select(ids=batch.ids, dataset_id=unit_testing_dataset)
+        assert sorted(r.data for r in results) == sorted(d)
@@ -0,0 +1,28 @@
+from embedbase.database.lexical import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_keeps_codes():
+    assert tokenize("Order SKU-4821_b now!") == ["order", "sku", "4821_b", "now"]
+
+
+def test_bm25_ranks_rare_terms_and_updates_incrementally():
+    index = BM25Index()
+    index.add("a", "the cat sat on the mat")
+    index.add("b", "the dog sat on the log")
+    index.add("c", "the cat chased the dog")
+
+    assert [doc_id for doc_id, _ in index.search("cat mat", 3)] == ["a", "c"]
+    assert index.search("cat", 3, candidates={"c"})[0][0] == "c"
+
+    index.add("a", "nothing to see")
+    assert [doc_id for doc_id, _ in index.search("mat", 3)] == []
+    index.remove("c")
+    assert index.search("cat", 3) == []
+    assert len(index) == 2
+
+
+def test_reciprocal_rank_fusion_promotes_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], [1.0, 1.0])
+    assert [item for item, _ in fused] == ["b", "a", "d", "c"]
+    fused = reciprocal_rank_fusion([["a", "b"], ["b", "a"]], [2.0, 1.0])
+    assert fused[0][0] == "a"
@@ -0,0 +1,72 @@
+from typing import List, Union
+
+import asyncio
+
+import pytest
+
+from embedbase.embedding.base import Embedder
+from embedbase.embedding.batching import MicroBatchEmbedder
+
+
+class CountingEmbedder(Embedder):
+    def __init__(self, fail: bool = False):
+        super().__init__()
+        self.calls = []
+        self.fail = fail
+
+    @property
+    def dimensions(self) -> int:
+        return 1
+
+    def is_too_big(self, text: str) -> bool:
+        return False
+
+    async def embed(self, data: Union[List[str], str]) -> List[List[float]]:
+        self.calls.append(list(data))
+        if self.fail:
+            raise RuntimeError("upstream down")
+        return [[float(len(text))] for text in data]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_are_coalesced():
+    inner = CountingEmbedder()
+    embedder = MicroBatchEmbedder(inner, max_wait_ms=20)
+    queries = ["a" * i for i in range(1, 11)]
+
+    results = await asyncio.gather(*[embedder.embed(q) for q in queries])
+
+    assert results == [[[float(len(q))]] for q in queries]
+    assert len(inner.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_batches_are_flushed_at_the_size_cap():
+    inner = CountingEmbedder()
+    embedder = MicroBatchEmbedder(inner, max_wait_ms=1000, max_batch_size=4)
+
+    results = await asyncio.wait_for(
+        asyncio.gather(*[embedder.embed(["x", "yy"]) for _ in range(4)]), 0.5
+    )
+
+    assert results == [[[1.0], [2.0]]] * 4
+    assert [len(c) for c in inner.calls] == [4, 4]
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_caller():
+    embedder = MicroBatchEmbedder(CountingEmbedder(fail=True))
+    results = await asyncio.gather(
+        embedder.embed("a"), embedder.embed("b"), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_length_buckets_restore_input_order():
+    inner = CountingEmbedder()
+    inner.bucket_size = 2
+    data = ["ccc", "a", "dddd", "bb", "eeeee"]
+
+    assert await inner.embed_bucketed(data) == [[float(len(t))] for t in data]
+    assert inner.calls == [["a", "bb"], ["ccc", "dddd"], ["eeeee"]]
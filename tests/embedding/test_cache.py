@@ -0,0 +1,60 @@
+import pytest
+
+from embedbase.embedding.cache import EmbeddingCache
+from tests.embedding.test_batching import CountingEmbedder
+
+
+@pytest.mark.asyncio
+async def test_cache_tiers_and_counters(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    inner = CountingEmbedder()
+    cache = EmbeddingCache(inner, path=path, max_memory_items=1)
+
+    assert await cache.embed(["a", "bb", "a"]) == [[1.0], [2.0], [1.0]]
+    # duplicated content is embedded once
+    assert inner.calls == [["a", "bb"]]
+    assert cache.stats()["misses"] == 3
+
+    # "bb" is still in memory, "a" was evicted and comes from disk
+    assert await cache.embed(["a", "bb"]) == [[1.0], [2.0]]
+    assert cache.memory_hits == 1 and cache.disk_hits == 1
+    assert len(inner.calls) == 1
+
+    # survives a restart
+    other = CountingEmbedder()
+    restarted = EmbeddingCache(other, path=path)
+    assert await restarted.embed("bb") == [[2.0]]
+    assert other.calls == []
+    assert restarted.stats()["hit_ratio"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_cache_is_keyed_by_model(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    await EmbeddingCache(CountingEmbedder(), path=path, model="m1").embed("a")
+    inner = CountingEmbedder()
+    await EmbeddingCache(inner, path=path, model="m2").embed("a")
+    assert inner.calls == [["a"]]
+
+
+class ModelEmbedder(CountingEmbedder):
+    def __init__(self, model: str, dimensions: int = 1):
+        super().__init__()
+        self.model = model
+        self._dimensions = dimensions
+
+    @property
+    def dimensions(self) -> int:
+        return self._dimensions
+
+
+@pytest.mark.asyncio
+async def test_default_namespace_is_the_instance_model_and_dimensions(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    await EmbeddingCache(ModelEmbedder("m1"), path=path).embed("a")
+    for embedder in (ModelEmbedder("m2"), ModelEmbedder("m1", dimensions=2)):
+        await EmbeddingCache(embedder, path=path).embed("a")
+        assert embedder.calls == [["a"]]
+    embedder = ModelEmbedder("m1")
+    await EmbeddingCache(embedder, path=path).embed("a")
+    assert embedder.calls == []
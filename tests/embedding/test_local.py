@@ -0,0 +1,33 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from embedbase.embedding.local import LocalEmbedder
+
+
+class FakeModel:
+    dimensions = 2
+    max_seq_length = 256
+
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts):
+        self.batches.append(list(texts))
+        return np.array([[len(t), 0] for t in texts], dtype=np.float32)
+
+
+@pytest.mark.asyncio
+async def test_local_embedder_batches_concurrent_calls_by_length(monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr("embedbase.embedding.local._load_model", lambda *_: model)
+    embedder = LocalEmbedder(max_batch_size=4, max_wait_ms=20)
+
+    texts = ["ccc", "a", "dddd", "bb", "eeeee"]
+    results = await asyncio.gather(embedder.embed(texts[:2]), embedder.embed(texts[2:]))
+
+    assert results == [[[3.0, 0.0], [1.0, 0.0]], [[4.0, 0.0], [2.0, 0.0], [5.0, 0.0]]]
+    # batches are capped and sorted by length
+    assert model.batches == [["a", "bb", "ccc", "dddd"], ["eeeee"]]
+    await embedder.close()
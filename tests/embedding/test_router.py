@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from embedbase.embedding.router import RoutedEmbedder
+from tests.embedding.test_batching import CountingEmbedder
+
+
+class SlowEmbedder(CountingEmbedder):
+    def __init__(self, delay: float, value: float, fail: bool = False):
+        super().__init__(fail=fail)
+        self.delay = delay
+        self.value = value
+
+    async def embed(self, data):
+        await asyncio.sleep(self.delay)
+        await super().embed(data)
+        return [[self.value] for _ in data]
+
+
+@pytest.mark.asyncio
+async def test_hedged_request_wins_when_the_primary_stalls():
+    slow, fast = SlowEmbedder(1, 1.0), SlowEmbedder(0, 2.0)
+    router = RoutedEmbedder([slow, fast], hedge_delay=0.02)
+
+    assert await asyncio.wait_for(router.embed("a"), 0.5) == [[2.0]]
+    assert router.hedges == 1
+    assert router.stats()["backends"]["1:SlowEmbedder"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failover_on_errors():
+    broken, backup = SlowEmbedder(0, 1.0, fail=True), SlowEmbedder(0, 2.0)
+    router = RoutedEmbedder([broken, backup])
+
+    assert await router.embed(["a", "b"]) == [[2.0], [2.0]]
+    assert router.failovers == 1
+    assert router.histograms[0].errors == 1
+
+    with pytest.raises(RuntimeError):
+        await RoutedEmbedder([broken]).embed("a")
+
+
+@pytest.mark.asyncio
+async def test_degraded_backends_are_tried_last():
+    slow, fast = SlowEmbedder(1, 1.0), SlowEmbedder(0, 2.0)
+    router = RoutedEmbedder(
+        [slow, fast], hedge_delay=0.02, min_hedge_delay=0.001, min_samples=2
+    )
+    for _ in range(2):
+        assert await router.embed("a") == [[2.0]]
+        # let the losing request record its cancellation
+        await asyncio.sleep(0.01)
+    assert router.histograms[0].quantile(0.95) >= 0.02
+    assert router._order() == [1, 0]
+
+    hedges = router.hedges
+    assert await asyncio.wait_for(router.embed("a"), 0.5) == [[2.0]]
+    assert router.hedges == hedges
+
+    broken, backup = SlowEmbedder(0, 1.0, fail=True), SlowEmbedder(0, 2.0)
+    router = RoutedEmbedder([broken, backup], min_samples=2)
+    for _ in range(3):
+        await router.embed("a")
+    assert len(broken.calls) == 2
+    assert router.failovers == 2
+    assert router.stats()["backends"]["0:SlowEmbedder"]["error_rate"] == 1.0
+
+
+def test_backends_must_have_the_same_dimensions():
+    class Wide(CountingEmbedder):
+        @property
+        def dimensions(self) -> int:
+            return 2
+
+    with pytest.raises(ValueError):
+        RoutedEmbedder([CountingEmbedder(), Wide()])
@@ -0,0 +1,205 @@
+"""
+Tests of the embedders rate limiting and sub-batching, against a local mock server.
+"""
+from types import SimpleNamespace
+
+import asyncio
+import sys
+import time
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+from embedbase.embedding.cohere import Cohere
+from embedbase.embedding.openai import OpenAI
+from embedbase.embedding.throttle import RateLimiter, TokenBucket, split_batches
+
+
+def test_split_batches_by_count_and_tokens():
+    assert split_batches([1] * 5, max_count=2) == [(0, 2), (2, 4), (4, 5)]
+    assert split_batches([3, 3, 3, 10, 1], max_count=10, max_tokens=6) == [
+        (0, 2),
+        (2, 3),
+        (3, 4),
+        (4, 5),
+    ]
+    assert split_batches([], max_count=2) == []
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(rate_per_minute=600, capacity=1)
+    start = time.monotonic()
+    for _ in range(3):
+        await bucket.acquire(1)
+    # 10 tokens per second, the two last acquisitions wait 0.1s each
+    assert time.monotonic() - start >= 0.15
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_bounds_concurrency():
+    limiter = RateLimiter(max_concurrency=2)
+    running = 0
+    peak = 0
+
+    async def task():
+        nonlocal running, peak
+        async with limiter.limit():
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    await asyncio.gather(*[task() for _ in range(6)])
+    assert peak == 2
+
+
+class ByteEncoding:
+    """
+    Offline stand-in for a tiktoken encoding, one token per utf-8 byte
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode_ordinary(self, text):
+        self.calls += 1
+        return list(text.encode())
+
+    def encode_ordinary_batch(self, texts):
+        return [self.encode_ordinary(text) for text in texts]
+
+
+@pytest_asyncio.fixture
+async def mock_openai():
+    requests = []
+
+    async def embeddings(request):
+        body = await request.json()
+        requests.append(body["input"])
+        if len(requests) == 1:
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "requests"}},
+                status=429,
+                headers={"Retry-After": "0"},
+            )
+        data = [
+            {"object": "embedding", "index": i, "embedding": [float(len(text))] * 3}
+            for i, text in enumerate(body["input"])
+        ]
+        return web.json_response(
+            {
+                "object": "list",
+                # out of order on purpose
+                "data": list(reversed(data)),
+                "model": body["model"],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            }
+        )
+
+    app = web.Application()
+    app.router.add_post("/v1/embeddings", embeddings)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]  # pylint: disable=protected-access
+    yield f"http://127.0.0.1:{port}/v1", requests
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_openai_sub_batches_concurrently_and_preserves_order(mock_openai):
+    api_base, requests = mock_openai
+    encoding = ByteEncoding()
+    embedder = OpenAI("sk-test", max_batch_size=3, api_base=api_base, encoding=encoding)
+    data = ["a" * i for i in range(1, 8)]
+
+    embeddings = await embedder.embed(data)
+
+    assert embeddings == [[float(len(text))] * 3 for text in data]
+    # one rate limited request retried, then 3 sub-batches
+    assert len(requests) == 4
+    assert sorted(len(r) for r in requests[1:]) == [1, 3, 3]
+    # small inputs are split on their byte length without tokenizing them
+    assert encoding.calls == 0
+
+    embedder.max_batch_tokens = 10
+    await embedder.embed(["a" * 6] * 3)
+    assert encoding.calls == 3
+    assert sorted(len(r) for r in requests[4:]) == [1, 1, 1]
+
+
+@pytest.mark.asyncio
+async def test_openai_token_counts_are_memoized():
+    embedder = OpenAI("sk-test", encoding=ByteEncoding())
+    short, long = "hello world", "hello world " * 5000
+
+    assert await embedder.are_too_big([short, long]) == [False, True]
+    # the short text is never tokenized
+    assert len(embedder.token_counts) == 1
+    assert embedder.is_too_big(long)
+    assert (await embedder.count_tokens([long]))[0] > embedder.EMBEDDING_CTX_LENGTH
+    assert embedder.token_counts.hits == 2
+
+
+def test_cohere_token_estimate():
+    assert Cohere.estimate_tokens("Bob is a human") == 4
+    # non-ascii text counts its utf-8 bytes
+    assert Cohere.estimate_tokens("é" * 8) == 4
+    assert Cohere.estimate_tokens("word " * 600) > Cohere.EMBEDDING_CTX_LENGTH
+
+
+class RateLimited(Exception):
+    http_status = 429
+    headers = {"Retry-After": "0"}
+
+
+class FakeCohereClient:
+    """
+    Stand-in for cohere.AsyncClient embedding every text as [len(text)],
+    the first call is rate limited
+    """
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.batches = []
+        self.running = 0
+        self.peak = 0
+        self.rate_limited = False
+
+    async def embed(self, texts, model):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(0.01)
+            if not self.rate_limited:
+                self.rate_limited = True
+                raise RateLimited()
+            self.batches.append(list(texts))
+            return SimpleNamespace(embeddings=[[float(len(t))] for t in texts])
+        finally:
+            self.running -= 1
+
+
+@pytest.mark.asyncio
+async def test_cohere_batches_concurrently_preserves_order_and_retries(monkeypatch):
+    monkeypatch.setitem(
+        sys.modules, "cohere", SimpleNamespace(AsyncClient=FakeCohereClient)
+    )
+    embedder = Cohere("key", max_concurrency=2, max_batch_size=3)
+    texts = ["a" * (i + 1) for i in range(10)]
+
+    assert await embedder.embed(texts) == [[float(i + 1)] for i in range(10)]
+    client = embedder._client()
+    assert sorted(len(batch) for batch in client.batches) == [1, 3, 3, 3]
+    assert sorted(t for batch in client.batches for t in batch) == sorted(texts)
+    # the rate limited batch was sent again, at most two requests at a time
+    assert client.rate_limited
+    assert client.peak == 2
+
+    embedder = Cohere("key")
+    await embedder.embed(["a"] * 100)
+    batches = embedder._client().batches
+    assert sorted(len(batch) for batch in batches) == [4, Cohere.MAX_BATCH_SIZE]
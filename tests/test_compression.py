@@ -0,0 +1,163 @@
+import asyncio
+import gzip
+import json
+import zlib
+
+import pytest
+from httpx import AsyncClient
+
+from embedbase.api import get_app
+from embedbase.compression import negotiate_encoding
+from embedbase.database.memory_db import MemoryDatabase
+from tests.test_ingest import FakeEmbedder
+
+unit_testing_dataset = "unit_test_compression"
+
+
+def test_negotiate_encoding(monkeypatch):
+    monkeypatch.setattr("embedbase.compression._zstandard", lambda: None)
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("*") == "gzip"
+    assert negotiate_encoding("gzip;q=0, br") is None
+    assert negotiate_encoding("") is None
+
+
+@pytest.mark.asyncio
+async def test_compressed_requests_and_responses():
+    app = (
+        get_app()
+        .use_db(MemoryDatabase(dimensions=8))
+        .use_embedder(FakeEmbedder())
+        .use_compression(minimum_size=500)
+        .run()
+    )
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        lines = "\n".join(
+            json.dumps({"data": f"document {i}"}) for i in range(20)
+        ).encode()
+        response = await client.post(
+            f"/v1/{unit_testing_dataset}/bulk",
+            content=gzip.compress(lines),
+            headers={"Content-Encoding": "gzip", "Accept-Encoding": "gzip"},
+        )
+        # streamed responses are compressed whatever their size
+        assert response.headers["content-encoding"] == "gzip"
+        assert json.loads(response.text.splitlines()[-1])["indexed"] == 20
+
+        response = await client.post(
+            f"/v1/{unit_testing_dataset}/search",
+            json={"query": "document", "top_k": 10},
+            headers={"Accept-Encoding": "gzip"},
+        )
+        assert response.headers["content-encoding"] == "gzip"
+        assert "accept-encoding" in response.headers["vary"].lower()
+        assert len(response.json()["similarities"]) == 10
+
+        response = await client.get("/health", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
+        response = await client.post(
+            f"/v1/{unit_testing_dataset}/search",
+            content=b"{}",
+            headers={"Content-Encoding": "br"},
+        )
+        assert response.status_code == 415
+
+
+@pytest.mark.asyncio
+async def test_zstd_compression():
+    zstandard = pytest.importorskip("zstandard")
+    app = (
+        get_app()
+        .use_db(MemoryDatabase(dimensions=8))
+        .use_embedder(FakeEmbedder())
+        .use_compression(minimum_size=0)
+        .run()
+    )
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        body = json.dumps({"documents": [{"data": "hello"}]}).encode()
+        response = await client.post(
+            f"/v1/{unit_testing_dataset}",
+            content=zstandard.ZstdCompressor().compress(body),
+            headers={"Content-Encoding": "zstd", "Accept-Encoding": "gzip, zstd"},
+        )
+        assert response.headers["content-encoding"] == "zstd"
+        content = (
+            zstandard.ZstdDecompressor().decompressobj().decompress(response.content)
+        )
+        assert json.loads(content)["results"][0]["data"] == "hello"
+
+        response = await client.post(
+            f"/v1/{unit_testing_dataset}",
+            content=zstandard.ZstdCompressor().compress(b" " * 100_000_000),
+            headers={"Content-Encoding": "zstd"},
+        )
+        assert response.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_decompressed_bodies_are_capped(monkeypatch):
+    monkeypatch.setattr("embedbase.app.UPLOAD_BATCH_SIZE", 10)
+    app = (
+        get_app()
+        .use_db(MemoryDatabase(dimensions=8))
+        .use_embedder(FakeEmbedder())
+        .use_compression(max_body_size=100_000)
+        .run()
+    )
+    # a few kilobytes expanding to megabytes
+    bomb = gzip.compress(b" " * 10_000_000)
+    assert len(bomb) < 20_000
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        response = await client.post(
+            f"/v1/{unit_testing_dataset}",
+            content=bomb,
+            headers={"Content-Encoding": "gzip", "Content-Type": "application/json"},
+        )
+        assert response.status_code == 413
+
+        lines = "\n".join(
+            json.dumps({"data": f"document {i} " + " " * 900}) for i in range(500)
+        ).encode()
+        # nothing was indexed yet when the limit is reached
+        response = await asyncio.wait_for(
+            client.post(
+                f"/v1/{unit_testing_dataset}/bulk",
+                content=gzip.compress(lines),
+                headers={"Content-Encoding": "gzip"},
+            ),
+            2,
+        )
+        assert response.status_code == 413
+
+        async def gzipped_lines():
+            compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+            for line in lines.splitlines(keepends=True):
+                yield compressor.compress(line) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield compressor.flush()
+
+        # the response started with the first batches, it ends with an error
+        response = await asyncio.wait_for(
+            client.post(
+                f"/v1/{unit_testing_dataset}/bulk?batch=1",
+                content=gzipped_lines(),
+                headers={"Content-Encoding": "gzip"},
+            ),
+            2,
+        )
+        progress = [json.loads(line) for line in response.text.splitlines()]
+        assert progress[0]["indexed"] > 0
+        assert progress[-1]["done"] is False
+        assert "larger than 100000 bytes" in progress[-1]["error"]
+
+        body = json.dumps({"documents": [{"data": "hello"}]}).encode()
+        for encoding, compressed in [
+            ("gzip", gzip.compress(body)),
+            ("deflate", zlib.compress(body)),
+        ]:
+            response = await client.post(
+                f"/v1/{unit_testing_dataset}",
+                content=compressed,
+                headers={"Content-Encoding": encoding},
+            )
+            assert response.status_code == 200
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from httpx import AsyncClient
+
+from embedbase.api import get_app
+from embedbase.database.memory_db import MemoryDatabase
+from embedbase.encoding import EmbeddingEncoding, decode_embedding, encode_embedding
+from tests.test_ingest import FakeEmbedder
+
+unit_testing_dataset = "unit_test_encoding"
+
+
+def test_encode_embedding_round_trip():
+    embedding = [0.1, -0.5, 0.25, 1.0]
+    for encoding in EmbeddingEncoding:
+        decoded = decode_embedding(encode_embedding(embedding, encoding), encoding)
+        assert np.allclose(decoded, embedding, atol=1e-3)
+    raw = encode_embedding(embedding, EmbeddingEncoding.FLOAT16, binary=True)
+    assert len(raw) == 2 * len(embedding)
+
+
+@pytest.mark.asyncio
+async def test_responses_encode_embeddings():
+    app = (
+        get_app()
+        .use_db(MemoryDatabase(dimensions=8))
+        .use_embedder(FakeEmbedder())
+        .run()
+    )
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        response = await client.post(
+            f"/v1/{unit_testing_dataset}",
+            params={"encoding": "float32"},
+            json={"documents": [{"data": "hello"}]},
+        )
+        assert response.headers["x-embedding-encoding"] == "float32"
+        embedding = response.json()["results"][0]["embedding"]
+        assert isinstance(embedding, str)
+        expected = decode_embedding(embedding, EmbeddingEncoding.FLOAT32)
+
+        response = await client.post(
+            f"/v1/{unit_testing_dataset}/search",
+            params={"encoding": "float16"},
+            json={"query": "hello"},
+        )
+        embedding = response.json()["similarities"][0]["embedding"]
+        assert np.allclose(
+            decode_embedding(embedding, EmbeddingEncoding.FLOAT16), expected, atol=1e-3
+        )
+
+        response = await client.get(f"/v1/{unit_testing_dataset}")
+        assert np.allclose(response.json()["documents"][0]["embedding"], expected)
+
+        response = await client.get(
+            f"/v1/{unit_testing_dataset}", params={"encoding": "float64"}
+        )
+        assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_msgpack_responses():
+    msgpack = pytest.importorskip("msgpack")
+    app = (
+        get_app()
+        .use_db(MemoryDatabase(dimensions=8))
+        .use_embedder(FakeEmbedder())
+        .run()
+    )
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        await client.post(
+            f"/v1/{unit_testing_dataset}", json={"documents": [{"data": "hello"}]}
+        )
+        response = await client.post(
+            f"/v1/{unit_testing_dataset}/search",
+            headers={"Accept": "application/msgpack"},
+            json={"query": "hello"},
+        )
+        assert response.headers["content-type"] == "application/msgpack"
+        content = msgpack.unpackb(response.content)
+        embedding = content["similarities"][0]["embedding"]
+        assert len(decode_embedding(embedding, EmbeddingEncoding.FLOAT32)) == 8
@@ -0,0 +1,127 @@
+import pytest
+from httpx import AsyncClient
+
+from embedbase.api import get_app
+from embedbase.database.memory_db import MemoryDatabase
+from embedbase.filters import (
+    Condition,
+    Group,
+    compile_predicate,
+    compile_sql,
+    equalities,
+    parse_filter,
+)
+from tests.test_ingest import FakeEmbedder
+
+
+def test_parse_filter():
+    assert parse_filter(None) is None
+    assert parse_filter({}) is None
+    assert parse_filter({"source": "amazon"}) == Condition("source", "$eq", "amazon")
+    assert parse_filter([{"a": 1}, {"b": {"$gt": 2, "$lte": 5}}]) == Group(
+        "$and",
+        [Condition("a", "$eq", 1), Condition("b", "$gt", 2), Condition("b", "$lte", 5)],
+    )
+    node = parse_filter({"$or": [{"a": 1}, {"b": {"$exists": False}}], "c": 2})
+    assert equalities(node) == {"c": 2}
+    for invalid in [
+        {"a": {"$ne": 1}},
+        {"$not": [{"a": 1}]},
+        {"$or": []},
+        {"$or": [{}]},
+        {"a": {"$in": 1}},
+        {"a": {"$gt": [1]}},
+        {"a": {"$exists": 1}},
+        "a",
+    ]:
+        with pytest.raises(ValueError):
+            parse_filter(invalid)
+
+
+def test_compile_predicate():
+    matches = compile_predicate(
+        parse_filter(
+            {
+                "lang": {"$in": ["en", "fr"]},
+                "$or": [{"stars": {"$gte": 4}}, {"featured": True}],
+                "deleted": {"$exists": False},
+            }
+        )
+    )
+    assert matches({"lang": "en", "stars": 4})
+    assert matches({"lang": "fr", "stars": 1, "featured": True})
+    assert not matches({"lang": "de", "stars": 5})
+    assert not matches({"lang": "en", "stars": "5"})
+    assert not matches({"lang": "en", "stars": 5, "deleted": None})
+    assert not matches({"lang": "en", "featured": 1})
+    assert not matches(None)
+
+
+def test_compile_sql():
+    condition, params = compile_sql(
+        parse_filter(
+            {"source": "amazon", "stars": {"$gt": 3}, "tags": {"$exists": True}}
+        )
+    )
+    assert condition == (
+        "((metadata::jsonb) @> %(filter_0)s::jsonb"
+        " and (jsonb_typeof(((metadata::jsonb) -> %(filter_2)s))"
+        " = jsonb_typeof(%(filter_1)s::jsonb)"
+        " and ((metadata::jsonb) -> %(filter_2)s) > %(filter_1)s::jsonb)"
+        " and (metadata::jsonb) ? %(filter_3)s)"
+    )
+    assert params == {
+        "filter_0": '{"source": "amazon"}',
+        "filter_1": "3",
+        "filter_2": "stars",
+        "filter_3": "tags",
+    }
+    assert compile_sql(None) == ("true", {})
+    assert compile_sql(parse_filter({"a": {"$in": []}}))[0] == "false"
+
+
+@pytest.mark.asyncio
+async def test_search_and_replace_with_filters():
+    app = (
+        get_app()
+        .use_db(MemoryDatabase(dimensions=8))
+        .use_embedder(FakeEmbedder())
+        .run()
+    )
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        await client.post(
+            "/v1/unit_test_filters",
+            json={
+                "documents": [
+                    {"data": f"review {i}", "metadata": {"stars": i, "shop": "a"}}
+                    for i in range(1, 6)
+                ]
+            },
+        )
+        response = await client.post(
+            "/v1/unit_test_filters/search",
+            json={"query": "review", "where": {"stars": {"$gte": 4}}},
+        )
+        stars = [s["metadata"]["stars"] for s in response.json()["similarities"]]
+        assert sorted(stars) == [4, 5]
+        response = await client.post(
+            "/v1/unit_test_filters/search",
+            json={"query": "review", "where": {"stars": {"$between": [1, 2]}}},
+        )
+        assert response.status_code == 422
+
+        response = await client.post(
+            "/v1/unit_test_filters/replace",
+            json={
+                "where": {"shop": "a", "stars": {"$lt": 3}},
+                "documents": [{"data": "merged review"}],
+            },
+        )
+        assert response.status_code == 200
+        response = await client.post(
+            "/v1/unit_test_filters/search",
+            json={"query": "review", "where": {"shop": "a"}},
+        )
+        metadatas = [s["metadata"] for s in response.json()["similarities"]]
+        assert len(metadatas) == 4
+        assert {"shop": "a"} in metadatas
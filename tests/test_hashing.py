@@ -0,0 +1,27 @@
+import hashlib
+
+import pytest
+
+from embedbase.hashing import hash_document, hash_documents
+
+d = ["Bob is a human", "The quick brown fox jumps over the lazy dog"] * 50
+
+
+def test_sha256_is_backward_compatible():
+    assert hash_document(d[0]) == hashlib.sha256(d[0].encode()).hexdigest()
+
+
+def test_scheme_is_kept_in_the_hash():
+    assert hash_document(d[0], "blake2b").startswith("blake2b:")
+    assert hash_document(d[0], "blake2b") != hash_document(d[0], "sha256")
+    with pytest.raises(ValueError):
+        hash_document(d[0], "md5")
+
+
+@pytest.mark.asyncio
+async def test_parallel_hashing_preserves_order(monkeypatch):
+    expected = [hash_document(x, "blake2b") for x in d]
+    assert await hash_documents(d, "blake2b") == expected
+    # force the thread pool path
+    monkeypatch.setattr("embedbase.hashing.PARALLEL_HASH_THRESHOLD", 0)
+    assert await hash_documents(d, "blake2b") == expected
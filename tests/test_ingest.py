@@ -0,0 +1,373 @@
+"""
+Tests of the ingestion endpoints with an in-memory database and a fake embedder.
+"""
+import asyncio
+import json
+
+import pytest
+from httpx import AsyncClient
+
+from embedbase.api import get_app
+from embedbase.database.batch import DocumentBatch
+from embedbase.database.memory_db import MemoryDatabase
+from embedbase.embedding.base import Embedder
+from embedbase.jobs import Job, JobKind, JobStatus, MemoryJobQueue, SQLiteJobQueue
+
+unit_testing_dataset = "unit_test_ingest"
+
+
+# pylint: disable=missing-docstring
+class FakeEmbedder(Embedder):
+    def __init__(self, dimensions: int = 8, **kwargs):
+        super().__init__(**kwargs)
+        self._dimensions = dimensions
+        self.calls = []
+
+    @property
+    def dimensions(self) -> int:
+        return self._dimensions
+
+    def is_too_big(self, text: str) -> bool:
+        return len(text) > 1000
+
+    async def embed(self, data):
+        # pylint: disable=import-outside-toplevel
+        import numpy as np
+
+        data = [data] if isinstance(data, str) else data
+        self.calls.append(data)
+        return np.random.rand(len(data), self._dimensions).tolist()
+
+
+@pytest.mark.asyncio
+async def test_bulk_add_streams_progress_per_batch(monkeypatch):
+    monkeypatch.setattr("embedbase.app.UPLOAD_BATCH_SIZE", 3)
+    db = MemoryDatabase(dimensions=8)
+    app = get_app().use_db(db).use_embedder(FakeEmbedder()).run()
+
+    async def body():
+        for i in range(7):
+            yield (json.dumps({"data": f"doc {i % 5}"}) + "\n").encode()
+        yield b'{"data": ""}\n'
+        yield b'{"data": "x' + b"x" * 2000 + b'"}\n{"data": "tail"}'
+
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        response = await client.post(f"/v1/{unit_testing_dataset}/bulk", content=body())
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+    progress, summary = lines[:-1], lines[-1]
+    assert [p["batch"] for p in progress] == [0, 1, 2]
+    # "doc 0" and "doc 1" are sent twice, the second time they are already stored
+    assert summary["done"] is True
+    assert summary["indexed"] == 6
+    assert sum(len(p["ids"]) for p in progress) == 6
+    assert [e["line"] for p in progress for e in p["errors"]] == [8, 9]
+    assert len(db.storage) == 6
+
+
+@pytest.mark.asyncio
+async def test_bulk_add_rejects_lines_over_the_maximum_size(monkeypatch):
+    monkeypatch.setattr("embedbase.app.BULK_MAX_LINE_SIZE", 64)
+    db = MemoryDatabase(dimensions=8)
+    app = get_app().use_db(db).use_embedder(FakeEmbedder()).run()
+
+    async def body():
+        yield b'{"data": "first"}\n{"data": "'
+        for _ in range(10):
+            yield b"x" * 50
+        yield b'"}\n{"data": "last"}\n{"data": "'
+        yield b"y" * 100
+
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        response = await client.post(f"/v1/{unit_testing_dataset}/bulk", content=body())
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+    assert lines[-1]["indexed"] == 2
+    errors = [e for p in lines[:-1] for e in p["errors"]]
+    assert [e["line"] for e in errors] == [2, 4]
+    assert "longer than 64 bytes" in errors[0]["error"]
+
+
+@pytest.mark.asyncio
+async def test_bulk_add_reports_reading_errors(monkeypatch):
+    monkeypatch.setattr("embedbase.app.UPLOAD_BATCH_SIZE", 2)
+    embedder = FakeEmbedder()
+    checks = []
+
+    async def are_too_big(texts):
+        checks.append(texts)
+        if len(checks) > 1:
+            raise RuntimeError("tokenizer unavailable")
+        return [False] * len(texts)
+
+    embedder.are_too_big = are_too_big
+    app = get_app().use_db(MemoryDatabase(dimensions=8)).use_embedder(embedder).run()
+    body = "\n".join(json.dumps({"data": f"doc {i}"}) for i in range(4))
+
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        response = await asyncio.wait_for(
+            client.post(f"/v1/{unit_testing_dataset}/bulk", content=body), 2
+        )
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert lines[0]["indexed"] == 2
+        assert lines[-1]["done"] is False
+        assert lines[-1]["error"] == "tokenizer unavailable"
+        assert lines[-1]["indexed"] == 2
+
+        response = await asyncio.wait_for(
+            client.post(f"/v1/{unit_testing_dataset}/bulk", content=body), 2
+        )
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert len(lines) == 1 and lines[0]["done"] is False
+
+
+async def wait_for_job(client, job_id):
+    for _ in range(100):
+        response = await client.get(f"/v1/jobs/{job_id}")
+        assert response.status_code == 200
+        job = response.json()["job"]
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        await asyncio.sleep(0.01)
+    raise TimeoutError(job_id)
+
+
+@pytest.mark.asyncio
+async def test_background_add_and_update_jobs(monkeypatch):
+    monkeypatch.setattr("embedbase.app.UPLOAD_BATCH_SIZE", 2)
+    db = MemoryDatabase(dimensions=8)
+    app = get_app().use_db(db).use_embedder(FakeEmbedder()).run()
+
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        response = await client.post(
+            f"/v1/{unit_testing_dataset}?background=true",
+            json={"documents": [{"data": f"doc {i}"} for i in range(5)]},
+        )
+        assert response.status_code == 202
+        job = await wait_for_job(client, response.json()["job_id"])
+        assert job["status"] == "succeeded"
+        assert job["kind"] == "add"
+        assert job["processed"] == job["total"] == 5
+        assert sorted(job["ids"]) == sorted(db.storage.keys())
+
+        response = await client.put(
+            f"/v1/{unit_testing_dataset}?background=true",
+            json={"documents": [{"id": job["ids"][0], "data": "updated"}]},
+        )
+        assert response.status_code == 202
+        job = await wait_for_job(client, response.json()["job_id"])
+        assert job["status"] == "succeeded"
+        assert db.storage[job["ids"][0]]["data"] == "updated"
+
+        response = await client.get("/v1/jobs/unknown")
+        assert response.status_code == 404
+
+    # stop the job workers
+    for handler in app.router.on_shutdown:
+        await handler()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_job_queue_survives_restart(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    queue = SQLiteJobQueue(path, maxsize=1)
+    job = Job.new(JobKind.ADD, unit_testing_dataset, None, total=1)
+    await queue.put(job, {"documents": [{"data": "a"}]})
+    with pytest.raises(asyncio.QueueFull):
+        await queue.put(Job.new(JobKind.ADD, unit_testing_dataset, None, 1), {})
+
+    running, _ = await queue.get()
+    assert running.status == JobStatus.RUNNING
+
+    # a new process picks up the job that was running
+    queue = SQLiteJobQueue(path, maxsize=1)
+    assert (await queue.fetch(job.id)).status == JobStatus.QUEUED
+    claimed, payload = await queue.get()
+    assert claimed.id == job.id
+    assert payload == {"documents": [{"data": "a"}]}
+
+
+@pytest.mark.asyncio
+async def test_resumed_job_skips_processed_documents(monkeypatch):
+    monkeypatch.setattr("embedbase.app.UPLOAD_BATCH_SIZE", 2)
+    db = MemoryDatabase(dimensions=8)
+    embedbase = get_app().use_db(db).use_embedder(FakeEmbedder())
+    job = Job.new(JobKind.ADD, unit_testing_dataset, None, total=4)
+    # the process stopped after the first batch
+    job.processed, job.ids = 2, ["a", "b"]
+    await embedbase._run_job(
+        job, {"documents": [{"data": f"doc {i}"} for i in range(4)]}
+    )
+    assert job.status == JobStatus.SUCCEEDED
+    assert job.processed == job.total
+    assert job.ids[:2] == ["a", "b"] and len(job.ids) == 4
+    assert sorted(d["data"] for d in db.storage.values()) == ["doc 2", "doc 3"]
+
+
+@pytest.mark.asyncio
+async def test_memory_job_queue_forgets_oldest_finished_jobs():
+    queue = MemoryJobQueue(maxsize=10, retention=2)
+    jobs = [Job.new(JobKind.ADD, unit_testing_dataset, None, 1) for _ in range(3)]
+    for job in jobs:
+        await queue.put(job, {})
+        running, _ = await queue.get()
+        running.status = JobStatus.SUCCEEDED
+        await queue.save(running)
+    assert await queue.fetch(jobs[0].id) is None
+    assert all([await queue.fetch(job.id) for job in jobs[1:]])
+
+
+@pytest.mark.asyncio
+async def test_sqlite_job_queue_deletes_oldest_finished_jobs(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.db"), maxsize=10, retention=2)
+    jobs = [Job.new(JobKind.ADD, unit_testing_dataset, None, 1) for _ in range(3)]
+    for job in jobs:
+        await queue.put(job, {})
+        running, _ = await queue.get()
+        running.status = JobStatus.SUCCEEDED
+        await queue.save(running)
+    assert await queue.fetch(jobs[0].id) is None
+    assert all([await queue.fetch(job.id) for job in jobs[1:]])
+
+
+class FlakyJobQueue(MemoryJobQueue):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = 1
+
+    async def save(self, job: Job) -> None:
+        if job.status in (JobStatus.SUCCEEDED, JobStatus.FAILED) and self.failures:
+            self.failures -= 1
+            raise RuntimeError("disk full")
+        await super().save(job)
+
+
+@pytest.mark.asyncio
+async def test_job_worker_survives_unexpected_errors():
+    embedbase = get_app().use_db(MemoryDatabase(dimensions=8))
+    embedbase = embedbase.use_embedder(FakeEmbedder())
+    app = embedbase.use_job_queue(FlakyJobQueue(), concurrency=1).run()
+
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        jobs = []
+        for _ in range(2):
+            response = await client.post(
+                f"/v1/{unit_testing_dataset}?background=true",
+                json={"documents": [{"data": "doc"}]},
+            )
+            jobs.append(await wait_for_job(client, response.json()["job_id"]))
+        assert jobs[0]["status"] == "failed"
+        assert jobs[0]["error"] == "disk full"
+        assert jobs[1]["status"] == "succeeded"
+
+    for handler in app.router.on_shutdown:
+        await handler()
+
+
+@pytest.mark.asyncio
+async def test_jobs_clear_clears_a_dataset_named_jobs():
+    db = MemoryDatabase(dimensions=8)
+    app = get_app().use_db(db).use_embedder(FakeEmbedder()).run()
+
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        response = await client.post("/v1/jobs", json={"documents": [{"data": "a"}]})
+        assert response.status_code == 200
+        response = await client.get("/v1/jobs/clear")
+        assert response.status_code == 200
+        assert not db.storage
+
+
+@pytest.mark.asyncio
+async def test_add_embeds_and_writes_in_chunks(monkeypatch):
+    monkeypatch.setattr("embedbase.app.EMBEDDING_BATCH_SIZE", 2)
+    db = MemoryDatabase(dimensions=8)
+    embedder = FakeEmbedder()
+    writes = []
+    update = db.update
+
+    async def spy_update(df, *args, **kwargs):
+        writes.append(len(df))
+        await update(df, *args, **kwargs)
+
+    monkeypatch.setattr(db, "update", spy_update)
+    app = get_app().use_db(db).use_embedder(embedder).run()
+
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        response = await client.post(
+            f"/v1/{unit_testing_dataset}",
+            json={"documents": [{"data": f"doc {i}"} for i in range(5)]},
+        )
+        assert response.status_code == 200
+        assert all(len(r["embedding"]) == 8 for r in response.json()["results"])
+
+    assert sorted(len(call) for call in embedder.calls) == [1, 2, 2]
+    # nothing was cached, so one write per embedded chunk
+    assert sorted(writes) == [1, 2, 2]
+    assert len(db.storage) == 5
+
+
+@pytest.mark.asyncio
+async def test_failed_chunk_cancels_the_other_chunks(monkeypatch):
+    monkeypatch.setattr("embedbase.app.EMBEDDING_BATCH_SIZE", 1)
+    embedder = FakeEmbedder()
+    cancelled = []
+
+    async def embed(data):
+        if data == ["bad"]:
+            raise RuntimeError("rate limited")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.extend(data)
+            raise
+
+    embedder.embed = embed
+    embedbase = get_app().use_db(MemoryDatabase(dimensions=8)).use_embedder(embedder)
+    batch = DocumentBatch(data=["a", "bad", "b"])
+
+    async def write(_):
+        pass
+
+    with pytest.raises(RuntimeError, match="rate limited"):
+        await asyncio.wait_for(embedbase._embed_and_write(batch, range(3), write), 2)
+    assert sorted(cancelled) == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_add_and_update_return_modes():
+    db = MemoryDatabase(dimensions=8)
+    app = get_app().use_db(db).use_embedder(FakeEmbedder()).run()
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        documents = [{"data": "hello"}, {"data": "world"}]
+        response = await client.post(
+            f"/v1/{unit_testing_dataset}",
+            json={"documents": documents, "return": "minimal"},
+        )
+        assert response.json()["count"] == 2
+        assert "results" not in response.json()
+
+        response = await client.post(
+            f"/v1/{unit_testing_dataset}",
+            json={"documents": documents, "return": "ids"},
+        )
+        results = response.json()["results"]
+        assert [set(r) for r in results] == [{"id", "hash"}, {"id", "hash"}]
+        # the documents were already stored, their stored ids are returned
+        assert {r["id"] for r in results} == set(db.storage)
+
+        response = await client.put(
+            f"/v1/{unit_testing_dataset}",
+            json={
+                "documents": [{"id": results[0]["id"], "data": "bye"}],
+                "return": "full",
+            },
+        )
+        assert response.json()["results"][0]["data"] == "bye"
+        assert len(response.json()["results"][0]["embedding"]) == 8
+
+        response = await client.post(
+            f"/v1/{unit_testing_dataset}",
+            json={"documents": documents, "return": "everything"},
+        )
+        assert response.status_code == 422
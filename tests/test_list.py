@@ -0,0 +1,56 @@
+import json
+
+import pytest
+from httpx import AsyncClient
+
+import embedbase.app
+from embedbase.api import get_app
+from embedbase.database.memory_db import MemoryDatabase
+from tests.test_ingest import FakeEmbedder
+
+unit_testing_dataset = "unit_test_list"
+
+
+@pytest.mark.asyncio
+async def test_list_pages_with_cursor_and_exports(monkeypatch):
+    monkeypatch.setattr(embedbase.app, "EXPORT_PAGE_SIZE", 2)
+    app = (
+        get_app()
+        .use_db(MemoryDatabase(dimensions=8))
+        .use_embedder(FakeEmbedder())
+        .run()
+    )
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        for i in range(7):
+            await client.post(
+                f"/v1/{unit_testing_dataset}",
+                json={"documents": [{"data": f"document {i}"}]},
+            )
+
+        pages = []
+        params = {"limit": 3}
+        while True:
+            response = await client.get(f"/v1/{unit_testing_dataset}", params=params)
+            assert response.status_code == 200
+            pages.append([d["data"] for d in response.json()["documents"]])
+            cursor = response.json()["next_cursor"]
+            if cursor is None:
+                break
+            params = {"limit": 3, "cursor": cursor}
+        assert pages == [
+            ["document 0", "document 1", "document 2"],
+            ["document 3", "document 4", "document 5"],
+            ["document 6"],
+        ]
+
+        response = await client.get(
+            f"/v1/{unit_testing_dataset}", params={"cursor": "not a cursor"}
+        )
+        assert response.status_code == 400
+
+        response = await client.get(
+            f"/v1/{unit_testing_dataset}", params={"stream": "true"}
+        )
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [d["data"] for d in lines] == [f"document {i}" for i in range(7)]
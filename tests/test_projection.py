@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from httpx import AsyncClient
+
+from embedbase.api import get_app
+from embedbase.database.memory_db import MemoryDatabase
+from embedbase.projection import PCA, Truncation, fit_projection, load_projection
+from tests.test_ingest import FakeEmbedder
+
+
+def low_rank_sample(n=200, dimensions=32, rank=4):
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(n, rank)) @ rng.normal(size=(rank, dimensions))
+
+
+def test_pca_keeps_neighbours_of_low_rank_embeddings(tmp_path):
+    vectors = low_rank_sample()
+    path = str(tmp_path / "projection.npz")
+    projection = fit_projection(vectors, 4, path=path)
+
+    assert projection.transform(vectors).shape == (200, 4)
+    assert projection.recall(vectors, k=5) > 0.95
+    loaded = load_projection(path)
+    assert isinstance(loaded, PCA)
+    assert np.allclose(loaded.transform(vectors), projection.transform(vectors))
+
+    with pytest.raises(ValueError):
+        PCA.fit(vectors[:2], 4)
+
+
+def test_truncation_normalizes_leading_dimensions():
+    projected = Truncation(2).transform([[3.0, 4.0, 100.0]])
+    assert np.allclose(projected, [[0.6, 0.8]])
+
+
+@pytest.mark.asyncio
+async def test_documents_and_queries_are_projected():
+    projection = Truncation(4)
+    db = MemoryDatabase(dimensions=4)
+    app = (
+        get_app()
+        .use_db(db)
+        .use_embedder(FakeEmbedder(dimensions=8))
+        .use_projection(projection)
+        .run()
+    )
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        response = await client.post(
+            "/v1/unit_test_projection",
+            json={"documents": [{"data": "Bob is a human"}]},
+        )
+        assert response.status_code == 200
+        assert len(response.json()["results"][0]["embedding"]) == 4
+        response = await client.post(
+            "/v1/unit_test_projection/search", json={"query": "Bob"}
+        )
+        assert len(response.json()["similarities"][0]["embedding"]) == 4
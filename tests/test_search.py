@@ -0,0 +1,343 @@
+"""
+Tests of the search endpoints with an in-memory database and a fake embedder.
+"""
+import pytest
+from httpx import AsyncClient
+
+from embedbase.api import get_app
+from embedbase.database.memory_db import MemoryDatabase
+from embedbase.embedding.batching import MicroBatchEmbedder
+from embedbase.search_cache import LRUCache, SearchCache
+from tests.test_ingest import FakeEmbedder
+
+unit_testing_dataset = "unit_test_search"
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.hits == 2 and cache.misses == 1
+
+
+def test_lru_cache_expires_entries_after_ttl(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("embedbase.search_cache.time.monotonic", lambda: now[0])
+    cache = LRUCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    now[0] = 9
+    assert cache.get("a") == 1
+    now[0] = 11
+    assert cache.get("a") is None and len(cache) == 0
+    assert SearchCache().results.maxsize == 0
+
+
+@pytest.mark.asyncio
+async def test_search_cache_is_invalidated_by_writes():
+    embedder = FakeEmbedder()
+    embedbase = (
+        get_app()
+        .use_db(MemoryDatabase(dimensions=8))
+        .use_embedder(embedder)
+        .use_search_cache(SearchCache(results_size=1000))
+    )
+    app = embedbase.run()
+
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        await client.post(
+            f"/v1/{unit_testing_dataset}",
+            json={"documents": [{"data": "Bob is a human"}]},
+        )
+        calls = len(embedder.calls)
+
+        search = {"query": "who is Bob?", "top_k": 3}
+        first = await client.post(f"/v1/{unit_testing_dataset}/search", json=search)
+        second = await client.post(f"/v1/{unit_testing_dataset}/search", json=search)
+        assert first.json()["similarities"] == second.json()["similarities"]
+        # the query was embedded once
+        assert len(embedder.calls) == calls + 1
+        assert embedbase.search_cache.results.hits == 1
+
+        await client.post(
+            f"/v1/{unit_testing_dataset}",
+            json={"documents": [{"data": "Alice is a human"}]},
+        )
+        calls = len(embedder.calls)
+        third = await client.post(f"/v1/{unit_testing_dataset}/search", json=search)
+        assert len(third.json()["similarities"]) == 2
+        # results were recomputed, the query embedding was reused
+        assert len(embedder.calls) == calls
+        assert embedbase.search_cache.stats()["embeddings"]["hits"] == 1
+
+        await client.request(
+            "DELETE",
+            f"/v1/{unit_testing_dataset}",
+            json={"ids": [s["id"] for s in third.json()["similarities"]]},
+        )
+        fourth = await client.post(f"/v1/{unit_testing_dataset}/search", json=search)
+        assert fourth.json()["similarities"] == []
+
+
+@pytest.mark.asyncio
+async def test_federated_search_merges_datasets_with_weights_and_quotas():
+    embedder = FakeEmbedder()
+    app = get_app().use_db(MemoryDatabase(dimensions=8)).use_embedder(embedder).run()
+
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        for dataset_id in ("fed_a", "fed_b"):
+            await client.post(
+                f"/v1/{dataset_id}",
+                json={"documents": [{"data": f"{dataset_id} {i}"} for i in range(3)]},
+            )
+        calls = len(embedder.calls)
+
+        response = await client.post(
+            "/v1/search", json={"query": "hello", "dataset_ids": ["fed_a", "fed_b"]}
+        )
+        assert response.status_code == 200
+        similarities = response.json()["similarities"]
+        assert {s["dataset_id"] for s in similarities} == {"fed_a", "fed_b"}
+        scores = [s["score"] for s in similarities]
+        assert scores == sorted(scores, reverse=True)
+        # the query is embedded once for both datasets
+        assert len(embedder.calls) == calls + 1
+
+        response = await client.post(
+            "/v1/search",
+            json={
+                "query": "hello",
+                "dataset_ids": ["fed_a", "fed_b"],
+                "weights": {"fed_b": 0.0},
+                "quotas": {"fed_a": 2},
+                "top_k": 4,
+            },
+        )
+        similarities = response.json()["similarities"]
+        assert [s["dataset_id"] for s in similarities] == ["fed_a"] * 2 + ["fed_b"] * 2
+
+        response = await client.post(
+            "/v1/search", json={"query": "hello", "dataset_ids": []}
+        )
+        assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_federated_search_with_weights_embeds_once_without_cache(monkeypatch):
+    monkeypatch.setattr("embedbase.app.QUERY_CACHE_SIZE", 0)
+    embedder = FakeEmbedder()
+    app = get_app().use_db(MemoryDatabase(dimensions=8)).use_embedder(embedder).run()
+
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        for dataset_id in ("fed_a", "fed_b", "fed_c"):
+            await client.post(f"/v1/{dataset_id}", json={"documents": [{"data": "a"}]})
+        calls = len(embedder.calls)
+        response = await client.post(
+            "/v1/search",
+            json={
+                "query": "hello",
+                "dataset_ids": ["fed_a", "fed_b", "fed_c"],
+                "weights": {"fed_b": 0.5},
+            },
+        )
+        assert len(response.json()["similarities"]) == 3
+        assert len(embedder.calls) == calls + 1
+
+
+@pytest.mark.asyncio
+async def test_federated_search_weights_are_applied_per_dataset():
+    vectors = {"da": [1.0, 0.045], "db": [1.0, 0.6]}
+    embedder = FakeEmbedder(dimensions=2)
+
+    async def embed(data):
+        data = [data] if isinstance(data, str) else data
+        return [vectors.get(text.split()[0], [1.0, 0.0]) for text in data]
+
+    embedder.embed = embed
+    app = get_app().use_db(MemoryDatabase(dimensions=2)).use_embedder(embedder).run()
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        # da has enough matches to fill a global top_k * len(dataset_ids)
+        for dataset_id, count in (("da", 6), ("db", 3)):
+            await client.post(
+                f"/v1/{dataset_id}",
+                json={
+                    "documents": [{"data": f"{dataset_id} {i}"} for i in range(count)]
+                },
+            )
+        response = await client.post(
+            "/v1/search",
+            json={
+                "query": "hello",
+                "dataset_ids": ["da", "db"],
+                "weights": {"db": 2.0},
+                "top_k": 3,
+            },
+        )
+        similarities = response.json()["similarities"]
+        # db scores about 0.857 * 2 against 0.999 for da
+        assert [s["dataset_id"] for s in similarities] == ["db"] * 3
+
+
+@pytest.mark.asyncio
+async def test_hybrid_and_lexical_search():
+    embedder = FakeEmbedder()
+    app = get_app().use_db(MemoryDatabase(dimensions=8)).use_embedder(embedder).run()
+    documents = ["Part SKU-4821 is a bolt", "A red bicycle", "Spare tyres for bicycles"]
+
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        await client.post(
+            "/v1/unit_test_hybrid",
+            json={"documents": [{"data": d} for d in documents]},
+        )
+        calls = len(embedder.calls)
+
+        response = await client.post(
+            "/v1/unit_test_hybrid/search",
+            json={"query": "sku-4821", "vector_weight": 0, "lexical_weight": 1},
+        )
+        similarities = response.json()["similarities"]
+        assert [s["data"] for s in similarities] == [documents[0]]
+        # keyword only searches do not embed the query
+        assert len(embedder.calls) == calls
+
+        response = await client.post(
+            "/v1/unit_test_hybrid/search",
+            json={"query": "sku 4821", "lexical_weight": 10, "top_k": 3},
+        )
+        similarities = response.json()["similarities"]
+        assert len(similarities) == 3
+        assert similarities[0]["data"] == documents[0]
+        assert len(embedder.calls) == calls + 1
+
+        response = await client.post(
+            "/v1/unit_test_hybrid/search",
+            json={"query": "bolt", "vector_weight": 0, "lexical_weight": 0},
+        )
+        assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_mmr_skips_near_duplicates():
+    class ClusteredEmbedder(FakeEmbedder):
+        async def embed(self, data):
+            data = [data] if isinstance(data, str) else data
+            # "dup" chunks are almost the query, "other" a bit further but distinct
+            vectors = {"query": [1, 0.1, 0], "dup": [1, 0, 0], "other": [0.7, 0, 0.7]}
+            return [vectors[d.split()[0]] for d in data]
+
+    app = (
+        get_app()
+        .use_db(MemoryDatabase(dimensions=3))
+        .use_embedder(ClusteredEmbedder(dimensions=3))
+        .run()
+    )
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        await client.post(
+            "/v1/unit_test_mmr",
+            json={
+                "documents": [{"data": f"dup {i}"} for i in range(3)]
+                + [{"data": "other"}]
+            },
+        )
+        search = {"query": "query", "top_k": 2}
+        response = await client.post("/v1/unit_test_mmr/search", json=search)
+        assert [s["data"].split()[0] for s in response.json()["similarities"]] == [
+            "dup",
+            "dup",
+        ]
+        response = await client.post(
+            "/v1/unit_test_mmr/search", json={**search, "mmr": True}
+        )
+        assert [s["data"].split()[0] for s in response.json()["similarities"]] == [
+            "dup",
+            "other",
+        ]
+
+
+@pytest.mark.asyncio
+async def test_min_score_drops_distant_matches():
+    class ClusteredEmbedder(FakeEmbedder):
+        async def embed(self, data):
+            data = [data] if isinstance(data, str) else data
+            vectors = {"query": [1, 0.1, 0], "near": [1, 0, 0], "far": [0.7, 0, 0.7]}
+            return [vectors[d.split()[0]] for d in data]
+
+    app = (
+        get_app()
+        .use_db(MemoryDatabase(dimensions=3))
+        .use_embedder(ClusteredEmbedder(dimensions=3))
+        .run()
+    )
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        await client.post(
+            "/v1/unit_test_min_score",
+            json={"documents": [{"data": "near"}, {"data": "far"}]},
+        )
+        search = {"query": "query", "top_k": 5}
+        response = await client.post("/v1/unit_test_min_score/search", json=search)
+        assert len(response.json()["similarities"]) == 2
+        response = await client.post(
+            "/v1/unit_test_min_score/search", json={**search, "min_score": 0.9}
+        )
+        similarities = response.json()["similarities"]
+        assert [s["data"] for s in similarities] == ["near"]
+        assert similarities[0]["score"] >= 0.9
+        response = await client.post(
+            "/v1/unit_test_min_score/search", json={**search, "min_score": 1.1}
+        )
+        assert response.json()["similarities"] == []
+
+
+@pytest.mark.asyncio
+async def test_context_packs_documents_within_token_budget(monkeypatch):
+    monkeypatch.setattr("embedbase.app.QUERY_CACHE_SIZE", 0)
+    embedder = FakeEmbedder()
+    app = get_app().use_db(MemoryDatabase(dimensions=8)).use_embedder(embedder).run()
+
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        await client.post(
+            "/v1/unit_test_context",
+            json={"documents": [{"data": f"document number {i}"} for i in range(20)]},
+        )
+        calls = len(embedder.calls)
+        context = {"query": "document", "top_k": 2, "max_tokens": 30}
+        response = await client.post("/v1/unit_test_context/context", json=context)
+        assert response.status_code == 200
+        body = response.json()
+        documents = body["documents"]
+        # 5 tokens per document and 1 per separator, fetched past top_k
+        assert len(documents) == 5
+        assert body["tokens"] == 29
+        assert [d["score"] for d in documents] == sorted(
+            [d["score"] for d in documents], reverse=True
+        )
+        assert body["context"].count("\n\n") == 4
+        assert "embedding" not in documents[0]
+        # searched in several rounds without a query cache, embedded once
+        assert len(embedder.calls) == calls + 1
+
+        response = await client.post(
+            "/v1/unit_test_context/context", json={"query": "a", "max_tokens": 0}
+        )
+        assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_context_through_a_wrapped_embedder():
+    embedder = MicroBatchEmbedder(FakeEmbedder(), max_wait_ms=1)
+    app = get_app().use_db(MemoryDatabase(dimensions=8)).use_embedder(embedder).run()
+
+    async with AsyncClient(app=app, base_url="http://localhost:8000") as client:
+        await client.post(
+            "/v1/unit_test_context_wrapped",
+            json={"documents": [{"data": f"document number {i}"} for i in range(3)]},
+        )
+        response = await client.post(
+            "/v1/unit_test_context_wrapped/context",
+            json={"query": "document", "max_tokens": 11},
+        )
+        assert response.status_code == 200
+        assert response.json()["tokens"] == 11